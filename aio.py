@@ -0,0 +1,70 @@
+from __future__ import annotations
+import asyncio
+import codecs
+import concurrent.futures
+import engine
+import lexer
+import parser
+import processor
+import threading
+from typing import AsyncIterator, Optional, Sequence
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Steps(processor.Tracer):
+    def __init__(self, every: int = 1024):
+        super().__init__()
+        self.every = every
+        self.count = 0
+        self.cancelled = threading.Event()
+
+    def event(self, event: processor.Event) -> None:
+        if event.kind == processor.ENTER:
+            self.step()
+
+    def step(self) -> None:
+        self.count += 1
+        if self.count % self.every == 0 and self.cancelled.is_set():
+            raise Cancelled(f'cancelled after {self.count} steps')
+
+
+async def chunks(reader: asyncio.StreamReader, encoding: str = 'utf-8', chunk_size: int = 1 << 16) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    while True:
+        data = await reader.read(chunk_size)
+        chunk = decoder.decode(data, not data)
+        if chunk:
+            yield chunk
+        if not data:
+            return
+
+
+async def read(reader: asyncio.StreamReader, encoding: str = 'utf-8', chunk_size: int = 1 << 16) -> str:
+    return ''.join([chunk async for chunk in chunks(reader, encoding, chunk_size)])
+
+
+async def lex(lexer_: lexer.Lexer, reader: asyncio.StreamReader, every: int = 256,
+              encoding: str = 'utf-8', chunk_size: int = 1 << 16) -> AsyncIterator[lexer.Token]:
+    session = lexer.Session(lexer_)
+    count = 0
+    async for chunk in chunks(reader, encoding, chunk_size):
+        for tok in session.feed(chunk):
+            yield tok
+            count += 1
+            if count % every == 0:
+                await asyncio.sleep(0)
+    for tok in session.close():
+        yield tok
+
+
+async def parse(parser_: parser.Parser, toks: Sequence[lexer.Token], executor: Optional[concurrent.futures.Executor] = None, steps: Optional[Steps] = None) -> parser.Node:
+    steps = steps or Steps()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, engine.process, parser_, parser.Input(toks), False, steps.step)
+    except asyncio.CancelledError:
+        steps.cancelled.set()
+        raise
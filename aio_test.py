@@ -0,0 +1,156 @@
+from __future__ import annotations
+import aio
+import asyncio
+import lexer
+import parser
+import processor
+import regex
+import time
+import unittest
+
+
+def lexer_() -> lexer.Lexer:
+    return lexer.Lexer(
+        {'a': regex.Regex(regex.Literal('a')), 'b': regex.Regex(regex.Literal('b'))},
+        {'ws': regex.Regex(regex.Literal(' '))},
+    ).freeze()
+
+
+def parser_() -> parser.Parser:
+    return parser.Parser({
+        'root': processor.UntilEmpty(processor.Ref('pair')),
+        'pair': processor.And(parser.Literal('a'), parser.Literal('b')),
+    }, 'root').freeze()
+
+
+def reader(data: bytes) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+class ReadTest(unittest.TestCase):
+    def test_read(self):
+        data = 'aéb'.encode('utf-8')
+        self.assertEqual(asyncio.run(aio.read(reader(data), chunk_size=2)), 'aéb')
+
+
+class LexTest(unittest.TestCase):
+    def test_lex(self):
+        input = 'ab a b ' * 10
+
+        async def lex():
+            return [tok async for tok in aio.lex(lexer_(), reader(input.encode()), every=3)]
+        self.assertEqual(asyncio.run(lex()), lexer_().lex(input))
+
+    def test_lex_chunks(self):
+        lexer_ = lexer.Lexer({'word': regex.Regex(processor.OneOrMore(regex.Literal('é')))},
+                             {'ws': regex.Regex(regex.Literal(' '))}).freeze()
+        input = 'é éé ééé ' * 10
+        for chunk_size in [1, 2, 3, 7]:
+            with self.subTest(chunk_size=chunk_size):
+                async def lex():
+                    return [tok async for tok in aio.lex(lexer_, reader(input.encode()), chunk_size=chunk_size)]
+                self.assertEqual(asyncio.run(lex()), lexer_.lex(input))
+
+    def test_lex_incremental(self):
+        async def lex():
+            reader = asyncio.StreamReader()
+            toks = aio.lex(lexer_(), reader)
+            reader.feed_data(b'ab a')
+            first = [await asyncio.wait_for(toks.__anext__(), 1) for _ in range(3)]
+            reader.feed_data(b'b')
+            reader.feed_eof()
+            return first, [tok async for tok in toks]
+        first, rest = asyncio.run(lex())
+        self.assertEqual([tok.val for tok in first], ['a', 'b', 'a'])
+        self.assertEqual([tok.val for tok in rest], ['b'])
+
+    def test_lex_error(self):
+        async def lex():
+            return [tok async for tok in aio.lex(lexer_(), reader(b'abc'))]
+        with self.assertRaises(processor.Error):
+            asyncio.run(lex())
+
+    def test_yields(self):
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0)
+
+        async def lex():
+            task = asyncio.create_task(tick())
+            toks = [tok async for tok in aio.lex(lexer_(), reader(b'ab' * 100), every=10)]
+            task.cancel()
+            return toks
+        self.assertEqual(len(asyncio.run(lex())), 200)
+        self.assertGreaterEqual(len(ticks), 10)
+
+
+class ParseTest(unittest.TestCase):
+    def test_parse(self):
+        toks = lexer_().lex('ab ab')
+        self.assertEqual(asyncio.run(aio.parse(parser_(), toks)), parser_().parse(toks))
+
+    def test_step_count(self):
+        steps = aio.Steps()
+        asyncio.run(aio.parse(parser_(), lexer_().lex('ab ab'), steps=steps))
+        self.assertEqual(steps.count, 11)
+
+    def test_cancel_threshold(self):
+        steps = aio.Steps(every=8)
+        steps.cancelled.set()
+        with self.assertRaisesRegex(aio.Cancelled, 'cancelled after 8 steps'):
+            asyncio.run(aio.parse(parser_(), lexer_().lex('ab ab'), steps=steps))
+
+    def test_error(self):
+        with self.assertRaises(processor.Error):
+            asyncio.run(aio.parse(parser_(), lexer_().lex('aa')))
+
+    def test_cancel(self):
+        toks = lexer_().lex('ab' * 20000)
+        steps = aio.Steps(every=16)
+
+        async def parse():
+            task = asyncio.create_task(aio.parse(parser_(), toks, steps=steps))
+            while not steps.count:
+                await asyncio.sleep(0.001)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        asyncio.run(parse())
+        self.assertTrue(steps.cancelled.is_set())
+        count = steps.count
+        time.sleep(0.01)
+        self.assertEqual(steps.count, count)
+
+    def test_cancel_unnamed(self):
+        parser_ = parser.Parser({
+            'root': processor.UntilEmpty(processor.And(parser.Literal('a'), parser.Literal('b'))),
+        }, 'root').freeze()
+        steps = aio.Steps(every=16)
+        steps.cancelled.set()
+        with self.assertRaises(aio.Cancelled):
+            asyncio.run(aio.parse(parser_, lexer_().lex('ab' * 1000), steps=steps))
+        self.assertLess(steps.count, 32)
+
+
+class StepsTest(unittest.TestCase):
+    def test_cancelled(self):
+        steps = aio.Steps(every=2)
+        traced = parser_().traced(steps)
+        steps.cancelled.set()
+        with self.assertRaisesRegex(aio.Cancelled, 'cancelled after 2 steps'):
+            traced.parse(lexer_().lex('ab'))
+
+    def test_count(self):
+        steps = aio.Steps()
+        parser_().traced(steps).parse(lexer_().lex('ab ab'))
+        self.assertEqual(steps.count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
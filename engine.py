@@ -0,0 +1,188 @@
+from __future__ import annotations
+import lexer
+import processor
+from typing import Any, Callable, Dict, Generator, List, NamedTuple, Optional, Tuple, Type
+
+Frame = Generator[Any, Any, Any]
+
+
+class _Apply(NamedTuple):
+    rule_name: str
+
+
+def _apply(rule: _Apply, context: processor.Context) -> Frame:
+    processor_ = context.processor
+    if rule.rule_name not in processor_.rules:
+        raise context.error(f'unknown rule {repr(rule.rule_name)}')
+    try:
+        output = yield processor_.rule(rule.rule_name), context
+    except processor.Error as error:
+        raise context.error(f'while applying rule {repr(rule.rule_name)}', error)
+    return processor_.with_rule_name(output, rule.rule_name)
+
+
+def _ref(rule: processor.Ref, context: processor.Context) -> Frame:
+    return context.aggregate([(yield _Apply(rule.val), context)])
+
+
+def _and(rule: processor.And, context: processor.Context) -> Frame:
+    outputs: List[Any] = []
+    for child in rule.rules:
+        output = yield child, context
+        outputs.append(output)
+        context = context.advance(output)
+    return context.aggregate(outputs)
+
+
+def _or(rule: processor.Or, context: processor.Context) -> Frame:
+    errors: List[processor.Error] = []
+    for child in rule.rules:
+        try:
+            return context.aggregate([(yield child, context)])
+        except processor.Error as error:
+            errors.append(error)
+    raise context.error('or', *errors)
+
+
+def _zero_or_more(rule: processor.ZeroOrMore, context: processor.Context) -> Frame:
+    outputs: List[Any] = []
+    while True:
+        try:
+            output = yield rule.rule, context
+        except processor.Error:
+            return context.aggregate(outputs)
+        outputs.append(output)
+        context = context.advance(output)
+
+
+def _one_or_more(rule: processor.OneOrMore, context: processor.Context) -> Frame:
+    output = yield rule.rule, context
+    outputs = [output]
+    context = context.advance(output)
+    while True:
+        try:
+            output = yield rule.rule, context
+        except processor.Error:
+            return context.aggregate(outputs)
+        outputs.append(output)
+        context = context.advance(output)
+
+
+def _zero_or_one(rule: processor.ZeroOrOne, context: processor.Context) -> Frame:
+    try:
+        return (yield rule.rule, context)
+    except processor.Error:
+        return context.aggregate([])
+
+
+def _until_empty(rule: processor.UntilEmpty, context: processor.Context) -> Frame:
+    outputs: List[Any] = []
+    while not context.empty:
+        output = yield rule.rule, context
+        outputs.append(output)
+        context = context.advance(output)
+    return context.aggregate(outputs)
+
+
+def _traced(rule: processor.Traced, context: processor.Context) -> Frame:
+    tracer = rule.tracer
+    size = context.processor.input_size(context.input)
+    if tracer.depth == 0:
+        tracer.origin = size
+    tracer.event(processor.Event(processor.ENTER, rule.rule_name, tracer.origin - size))
+    tracer.depth += 1
+    try:
+        output = yield rule.rule, context
+    except processor.Error:
+        tracer.depth -= 1
+        tracer.event(processor.Event(processor.FAIL, rule.rule_name, tracer.origin - size))
+        raise
+    tracer.depth -= 1
+    end = context.processor.input_size(context.advance(output).input)
+    tracer.event(processor.Event(processor.EXIT, rule.rule_name, tracer.origin - end))
+    return output
+
+
+def _dispatch(rule: lexer.Dispatch, context: processor.Context) -> Frame:
+    errors: List[processor.Error] = []
+    for child in rule.rules_at(context):
+        try:
+            return context.aggregate([(yield child, context)])
+        except processor.Error as error:
+            errors.append(error)
+    raise context.error('or', *errors)
+
+
+# Rule types without a frame, such as Literal, Literals and regex.Not, are
+# called directly and recurse in Python through any rules they contain.
+_FRAMES: Dict[Type, Callable[[Any, processor.Context], Frame]] = {
+    _Apply: _apply,
+    processor.Ref: _ref,
+    processor.And: _and,
+    processor.Or: _or,
+    processor.ZeroOrMore: _zero_or_more,
+    processor.OneOrMore: _one_or_more,
+    processor.ZeroOrOne: _zero_or_one,
+    processor.UntilEmpty: _until_empty,
+    processor.Traced: _traced,
+    lexer.Dispatch: _dispatch,
+}
+
+
+def run(rule: Any, context: processor.Context, memo: Optional[Dict[Tuple[str, int], Any]] = None,
+        step: Optional[Callable[[], None]] = None) -> Any:
+    frames = _FRAMES
+    stack: List[Tuple[Frame, Optional[Tuple[str, int]]]] = []
+    frame = frames[type(rule)](rule, context)
+    key: Optional[Tuple[str, int]] = None
+    val: Any = None
+    error: Optional[processor.Error] = None
+    while True:
+        try:
+            if error is None:
+                child, child_context = frame.send(val)
+            else:
+                error.__traceback__ = None
+                child, child_context = frame.throw(error)
+                error = None
+        except StopIteration as stop:
+            val, error = stop.value, None
+        except processor.Error as e:
+            val, error = None, e
+        else:
+            if step is not None:
+                step()
+            factory = frames.get(type(child))
+            if factory is None:
+                try:
+                    val = child(child_context)
+                except processor.Error as e:
+                    val, error = None, e
+                continue
+            child_key = None
+            if memo is not None and factory is _apply:
+                child_key = child.rule_name, child_context.processor.input_size(child_context.input)
+                if child_key in memo:
+                    val, error = memo[child_key]
+                    continue
+            stack.append((frame, key))
+            frame, key = factory(child, child_context), child_key
+            val = None
+            continue
+        if key is not None:
+            memo[key] = val, error
+        if not stack:
+            if error is not None:
+                raise error
+            return val
+        frame, key = stack.pop()
+
+
+def process(processor_: processor.Processor[processor.TI, processor.TO], input: processor.TI, memoize: bool = False,
+            step: Optional[Callable[[], None]] = None) -> processor.TO:
+    memo: Optional[Dict[Tuple[str, int], Any]] = None
+    if memoize:
+        if type(processor_).input_size is processor.Processor.input_size:
+            raise processor.Error(f'{processor_.__class__.__name__} has no input_size to memoize on')
+        memo = {}
+    return run(_Apply(processor_.root), processor.Context(processor_, input), memo, step)
@@ -0,0 +1,160 @@
+from __future__ import annotations
+import engine
+import lexer
+import loader
+import parser
+import processor
+import regex
+import sys
+import tracer
+import unittest
+
+import unittest.util
+unittest.util._MAX_LENGTH = 1000
+
+
+def outcome(f, *args):
+    try:
+        return f(*args)
+    except processor.Error as error:
+        return error
+
+
+class EngineTest(unittest.TestCase):
+    def test_regex(self):
+        for pattern in ['a', 'ab|ac', 'a*b', '(ab)+c?', '[a-c]!', '^a', '(a|b)*abb']:
+            regex_ = loader.load_regex(pattern).interpreted()
+            for input in ['', 'a', 'ab', 'ac', 'abb', 'ababc', 'cab', 'aabb', 'z']:
+                with self.subTest(pattern=pattern, input=input):
+                    expected = outcome(regex_.match_span, input)
+                    self.assertEqual(outcome(engine.process, regex_, regex.Input(input)), expected)
+                    self.assertEqual(outcome(engine.process, regex_, regex.Input(input), True), expected)
+
+    def test_lex_and_parse(self):
+        lexer_, parser_ = loader.load_lexer_and_parser('''
+            id = "[a-z]+";
+            ws ~= " +";
+            root -> stmt!;
+            stmt -> "id" "=" expr ";";
+            expr -> "id" | ("\\(" expr "\\)");
+        ''')
+        for input in ['a = b;', 'a = (b); c = ((d));', 'a = (b;', 'a b', '']:
+            with self.subTest(input=input):
+                input_ = lexer.Input(input, lexer.Location(0, 0))
+                toks = outcome(engine.process, lexer_, input_)
+                self.assertEqual(toks, outcome(lexer_.process, input_))
+                if isinstance(toks, lexer.Output):
+                    input__ = parser.Input(toks.toks)
+                    expected = outcome(parser_.process, input__)
+                    self.assertEqual(outcome(engine.process, parser_, input__), expected)
+                    self.assertEqual(outcome(engine.process, parser_, input__, True), expected)
+
+    def test_unknown_rule(self):
+        parser_ = parser.Parser({'a': processor.Ref('b')}, 'a')
+        self.assertEqual(
+            outcome(engine.process, parser_, parser.Input([])),
+            outcome(parser_.process, parser.Input([])))
+
+    def test_deep_nesting(self):
+        lexer_, parser_ = loader.load_lexer_and_parser('''
+            id = "x";
+            expr -> "id" | ("\\(" expr "\\)");
+        ''')
+        depth = sys.getrecursionlimit()
+        toks = lexer_.lex('(' * depth + 'x' + ')' * depth)
+        with self.assertRaises(RecursionError):
+            parser_.parse(toks)
+        node = engine.process(parser_, parser.Input(toks))
+        for _ in range(depth):
+            open_, ref, close = node.children[0].children
+            self.assertEqual((open_.token.val, close.token.val), ('(', ')'))
+            node = ref.children[0]
+        self.assertEqual(node.children[0].token.val, 'x')
+
+    def test_deep_nesting_error(self):
+        lexer_, parser_ = loader.load_lexer_and_parser('''
+            id = "x";
+            expr -> "id" | ("\\(" expr "\\)");
+        ''')
+        depth = sys.getrecursionlimit()
+        toks = lexer_.lex('(' * depth + 'x')
+        with self.assertRaises(processor.Error) as error:
+            engine.process(parser_, parser.Input(toks))
+        self.assertIn("while applying rule 'expr'", str(error.exception))
+        self.assertEqual(error.exception, error.exception)
+
+    def test_traced(self):
+        lexer_, parser_ = loader.load_lexer_and_parser('''
+            id = "[a-z]+";
+            ws ~= " +";
+            root -> expr!;
+            expr -> "id" | ("\\(" expr "\\)");
+        ''')
+        for input in ['a (b) ((c))', 'a (b']:
+            with self.subTest(input=input):
+                events, expected_events = tracer.RingBuffer(), tracer.RingBuffer()
+                lexer_input = lexer.Input(input, lexer.Location(0, 0))
+                self.assertEqual(outcome(engine.process, lexer_.traced(events), lexer_input),
+                                 outcome(lexer_.traced(expected_events).process, lexer_input))
+                toks = lexer_.lex(input)
+                self.assertEqual(outcome(engine.process, parser_.traced(events), parser.Input(toks)),
+                                 outcome(parser_.traced(expected_events).process, parser.Input(toks)))
+                self.assertEqual(list(events.events), list(expected_events.events))
+
+    def test_dispatch(self):
+        lexer_, _ = loader.load_lexer_and_parser('id = "[a-z]+"; ws ~= " +"; a = "=";')
+        for input in ['a = b', 'a ! b', '']:
+            with self.subTest(input=input):
+                lexer_input = lexer.Input(input, lexer.Location(0, 0))
+                self.assertIsInstance(lexer_.rules[lexer_.root].rule, lexer.Dispatch)
+                self.assertEqual(outcome(engine.process, lexer_, lexer_input),
+                                 outcome(lexer_.process, lexer_input))
+
+    def test_memoize(self):
+        depth = 12
+        calls = []
+
+        class Leaf(parser.Rule):
+            def __call__(self, context):
+                calls.append(context.input)
+                return parser.Literal('z')(context)
+
+        rules = {f'r{i}': processor.Or(
+            processor.And(processor.Ref(f'r{i+1}'), parser.Literal('x')),
+            processor.And(processor.Ref(f'r{i+1}'), parser.Literal('y')),
+        ) for i in range(depth)}
+        rules[f'r{depth}'] = Leaf()
+        parser_ = parser.Parser(rules, 'r0')
+        toks = [lexer.Token(val, lexer.Location(0, i), val)
+                for i, val in enumerate('z' + 'y' * depth)]
+        node = engine.process(parser_, parser.Input(toks), True)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(node, parser_.parse(toks))
+        self.assertEqual(len(calls), 1 + 2 ** depth)
+
+    def test_step(self):
+        parser_ = parser.Parser({
+            'root': processor.UntilEmpty(processor.And(parser.Literal('a'), parser.Literal('b'))),
+        }, 'root')
+        steps = []
+        toks = [lexer.Token(val, lexer.Location(0, 0), val) for val in 'abab']
+        engine.process(parser_, parser.Input(toks), step=lambda: steps.append(None))
+        self.assertEqual(len(steps), 7)
+
+    def test_memoize_without_input_size(self):
+        class Processor(processor.Processor[int, int]):
+            def advance(self, input, output):
+                return input
+
+            def aggregate(self, context, outputs):
+                return 0
+
+            def empty(self, input):
+                return True
+
+        with self.assertRaisesRegex(processor.Error, 'no input_size'):
+            engine.process(Processor({}, 'a'), 0, True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+from __future__ import annotations
+from typing import Any, Generic, Iterator, NamedTuple, Optional, Tuple, TypeVar, Union
+
+K = TypeVar('K')
+V = TypeVar('V')
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+_MISSING = object()
+
+
+def _hash(key: Any) -> int:
+    return hash(key) & _HASH_MASK
+
+
+def _index(bitmap: int, bit: int) -> int:
+    return bin(bitmap & (bit - 1)).count('1')
+
+
+class _Leaf(NamedTuple):
+    hash: int
+    key: Any
+    val: Any
+
+
+class _Collision:
+    def __init__(self, hash: int, leaves: Tuple[_Leaf, ...]):
+        self.hash = hash
+        self.leaves = leaves
+
+    def get(self, shift: int, hash: int, key: Any) -> Any:
+        for leaf in self.leaves:
+            if leaf.key == key:
+                return leaf.val
+        return _MISSING
+
+    def set(self, shift: int, leaf: _Leaf) -> Tuple[_Node, bool]:
+        if leaf.hash != self.hash:
+            return _Bitmap(0, ()).set(shift, leaf)[0]._merge(shift, self), True
+        for i, existing in enumerate(self.leaves):
+            if existing.key == leaf.key:
+                return _Collision(self.hash, self.leaves[:i] + (leaf,) + self.leaves[i+1:]), False
+        return _Collision(self.hash, self.leaves + (leaf,)), True
+
+    def delete(self, shift: int, hash: int, key: Any) -> Optional[Union[_Node, _Leaf]]:
+        leaves = tuple(leaf for leaf in self.leaves if leaf.key != key)
+        if len(leaves) == 1:
+            return leaves[0]
+        return _Collision(self.hash, leaves)
+
+    def __iter__(self) -> Iterator[_Leaf]:
+        return iter(self.leaves)
+
+
+class _Bitmap:
+    def __init__(self, bitmap: int, children: Tuple[Union[_Node, _Leaf], ...]):
+        self.bitmap = bitmap
+        self.children = children
+
+    def get(self, shift: int, hash: int, key: Any) -> Any:
+        node: _Node = self
+        while True:
+            if isinstance(node, _Collision):
+                return node.get(shift, hash, key)
+            bit = 1 << ((hash >> shift) & _MASK)
+            if not node.bitmap & bit:
+                return _MISSING
+            child = node.children[_index(node.bitmap, bit)]
+            if isinstance(child, _Leaf):
+                return child.val if child.key == key else _MISSING
+            node = child
+            shift += _BITS
+
+    def set(self, shift: int, leaf: _Leaf) -> Tuple[_Node, bool]:
+        bit = 1 << ((leaf.hash >> shift) & _MASK)
+        index = _index(self.bitmap, bit)
+        if not self.bitmap & bit:
+            return _Bitmap(self.bitmap | bit, self.children[:index] + (leaf,) + self.children[index:]), True
+        child = self.children[index]
+        added = True
+        if isinstance(child, _Leaf):
+            if child.key == leaf.key:
+                new_child: Union[_Node, _Leaf] = leaf
+                added = False
+            else:
+                new_child = _merge(shift + _BITS, child, leaf)
+        else:
+            new_child, added = child.set(shift + _BITS, leaf)
+        return _Bitmap(self.bitmap, self.children[:index] + (new_child,) + self.children[index+1:]), added
+
+    def _merge(self, shift: int, collision: _Collision) -> _Bitmap:
+        bit = 1 << ((collision.hash >> shift) & _MASK)
+        index = _index(self.bitmap, bit)
+        if self.bitmap & bit:
+            child = self.children[index]
+            if isinstance(child, _Leaf):
+                child = _Bitmap(0, ()).set(shift + _BITS, child)[0]
+            assert isinstance(child, _Bitmap), child
+            new_child = child._merge(shift + _BITS, collision)
+            return _Bitmap(self.bitmap, self.children[:index] + (new_child,) + self.children[index+1:])
+        return _Bitmap(self.bitmap | bit, self.children[:index] + (collision,) + self.children[index:])
+
+    def delete(self, shift: int, hash: int, key: Any) -> Optional[Union[_Node, _Leaf]]:
+        bit = 1 << ((hash >> shift) & _MASK)
+        index = _index(self.bitmap, bit)
+        child = self.children[index]
+        if isinstance(child, _Leaf):
+            new_child: Optional[Union[_Node, _Leaf]] = None
+        else:
+            new_child = child.delete(shift + _BITS, hash, key)
+        if new_child is None:
+            if len(self.children) == 1:
+                return None
+            return _Bitmap(self.bitmap & ~bit, self.children[:index] + self.children[index+1:])
+        if len(self.children) == 1 and isinstance(new_child, _Leaf):
+            return new_child
+        return _Bitmap(self.bitmap, self.children[:index] + (new_child,) + self.children[index+1:])
+
+    def __iter__(self) -> Iterator[_Leaf]:
+        for child in self.children:
+            if isinstance(child, _Leaf):
+                yield child
+            else:
+                yield from child
+
+
+_Node = Union[_Bitmap, _Collision]
+
+
+def _merge(shift: int, lhs: _Leaf, rhs: _Leaf) -> _Node:
+    if lhs.hash == rhs.hash or shift >= _HASH_BITS:
+        return _Collision(lhs.hash, (lhs, rhs))
+    return _Bitmap(0, ()).set(shift, lhs)[0].set(shift, rhs)[0]
+
+
+class Map(Generic[K, V]):
+    def __init__(self, root: Optional[_Bitmap] = None, size: int = 0):
+        self._root = root or _Bitmap(0, ())
+        self._size = size
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, self.__class__) and dict(self.items()) == dict(rhs.items())
+
+    def __repr__(self) -> str:
+        return f'Map({dict(self.items())})'
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, key: object) -> bool:
+        return self._root.get(0, _hash(key), key) is not _MISSING
+
+    def __getitem__(self, key: K) -> V:
+        val = self._root.get(0, _hash(key), key)
+        if val is _MISSING:
+            raise KeyError(key)
+        return val
+
+    def __iter__(self) -> Iterator[K]:
+        for leaf in self._root:
+            yield leaf.key
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        val = self._root.get(0, _hash(key), key)
+        return default if val is _MISSING else val
+
+    def items(self) -> Iterator[Tuple[K, V]]:
+        for leaf in self._root:
+            yield leaf.key, leaf.val
+
+    def set(self, key: K, val: V) -> Map[K, V]:
+        root, added = self._root.set(0, _Leaf(_hash(key), key, val))
+        assert isinstance(root, _Bitmap)
+        return Map(root, self._size + 1 if added else self._size)
+
+    def delete(self, key: K) -> Map[K, V]:
+        hash = _hash(key)
+        if self._root.get(0, hash, key) is _MISSING:
+            raise KeyError(key)
+        root = self._root.delete(0, hash, key)
+        if not isinstance(root, _Bitmap):
+            root = _Bitmap(0, ()).set(0, root)[0] if root else None
+        return Map(root, self._size - 1)
@@ -0,0 +1,88 @@
+from __future__ import annotations
+import hamt
+import random
+import unittest
+
+
+class Key:
+    def __init__(self, val: int, hash: int):
+        self.val = val
+        self.hash = hash
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, Key) and self.val == rhs.val
+
+    def __hash__(self) -> int:
+        return self.hash
+
+    def __repr__(self) -> str:
+        return f'Key({self.val}, {self.hash})'
+
+
+class MapTest(unittest.TestCase):
+    def test_empty(self):
+        map = hamt.Map()
+        self.assertEqual(len(map), 0)
+        self.assertNotIn('a', map)
+        self.assertIsNone(map.get('a'))
+        with self.assertRaises(KeyError):
+            map['a']
+        with self.assertRaises(KeyError):
+            map.delete('a')
+
+    def test_set(self):
+        empty = hamt.Map()
+        a = empty.set('a', 1)
+        b = a.set('b', 2)
+        c = b.set('a', 3)
+        self.assertEqual(dict(empty.items()), {})
+        self.assertEqual(dict(a.items()), {'a': 1})
+        self.assertEqual(dict(b.items()), {'a': 1, 'b': 2})
+        self.assertEqual(dict(c.items()), {'a': 3, 'b': 2})
+        self.assertEqual(len(c), 2)
+        self.assertEqual(c['a'], 3)
+        self.assertEqual(set(c), {'a', 'b'})
+
+    def test_delete(self):
+        map = hamt.Map().set('a', 1).set('b', 2)
+        self.assertEqual(dict(map.delete('a').items()), {'b': 2})
+        self.assertEqual(dict(map.items()), {'a': 1, 'b': 2})
+        self.assertEqual(len(map.delete('a').delete('b')), 0)
+
+    def test_eq(self):
+        self.assertEqual(hamt.Map().set('a', 1).set('b', 2),
+                         hamt.Map().set('b', 2).set('a', 1))
+        self.assertNotEqual(hamt.Map().set('a', 1), hamt.Map().set('a', 2))
+
+    def check_random(self, keys):
+        rng = random.Random(0)
+        expected = {}
+        map = hamt.Map()
+        snapshots = []
+        for _ in range(2000):
+            key = rng.choice(keys)
+            if key in expected and rng.random() < 0.3:
+                del expected[key]
+                map = map.delete(key)
+            else:
+                val = rng.randrange(1000)
+                expected[key] = val
+                map = map.set(key, val)
+            self.assertEqual(len(map), len(expected))
+            if rng.random() < 0.05:
+                snapshots.append((map, dict(expected)))
+        self.assertEqual(dict(map.items()), expected)
+        for key in keys:
+            self.assertEqual(map.get(key), expected.get(key))
+        for snapshot, snapshot_expected in snapshots:
+            self.assertEqual(dict(snapshot.items()), snapshot_expected)
+
+    def test_random(self):
+        self.check_random(list(range(500)))
+
+    def test_random_collisions(self):
+        self.check_random([Key(i, i % 7 + (i % 3 << 40)) for i in range(100)])
+
+
+if __name__ == '__main__':
+    unittest.main()
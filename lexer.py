@@ -1,7 +1,9 @@
 from __future__ import annotations
 import processor
 import regex
-from typing import cast, Mapping, MutableMapping, NamedTuple, Optional, Sequence, Tuple
+import symbols
+import types
+from typing import cast, Dict, Iterator, List, Mapping, MutableMapping, NamedTuple, Optional, Sequence, Tuple
 
 
 class Location(NamedTuple):
@@ -23,17 +25,25 @@ class Location(NamedTuple):
                     col += 1
         return Location(line, col)
 
+    def skip(self, text: str, start: int, end: int) -> Location:
+        lines = text.count('\n', start, end)
+        if not lines:
+            return Location(self.line, self.col + end - start)
+        return Location(self.line + lines, end - text.rfind('\n', start, end) - 1)
+
 
 class Input(NamedTuple):
     input: str
     location: Location
+    pos: int = 0
 
     def advance(self, output: Output) -> Input:
-        return Input(self.input[sum(map(len, output.toks)):], self.location.advance(output))
+        end = self.pos + output.size
+        return Input(self.input, self.location.skip(self.input, self.pos, end), end)
 
     @property
     def empty(self) -> bool:
-        return not self.input
+        return self.pos >= len(self.input)
 
 
 class Token(NamedTuple):
@@ -41,9 +51,20 @@ class Token(NamedTuple):
     location: Location
     rule_name: Optional[str] = None
     include: bool = True
+    kind: Optional[int] = None
+    symbols: Optional[symbols.Table] = None
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, Token) and self[:4] == rhs[:4]
+
+    def __ne__(self, rhs: object) -> bool:
+        return not self == rhs
+
+    def __hash__(self) -> int:
+        return hash(self[:4])
 
-    def with_rule_name(self, rule_name: str) -> Token:
-        return Token(self.val, self.location, rule_name, self.include)
+    def with_rule_name(self, rule_name: str, kind: Optional[int] = None, symbols_: Optional[symbols.Table] = None) -> Token:
+        return Token(self.val, self.location, rule_name, self.include, kind, symbols_)
 
     def __len__(self) -> int:
         return len(self.val)
@@ -51,13 +72,30 @@ class Token(NamedTuple):
 
 class Output(NamedTuple):
     toks: Tuple[Token, ...]
+    skipped: int = 0
+
+    @property
+    def size(self) -> int:
+        return sum(map(len, self.toks)) + self.skipped
+
+    @staticmethod
+    def skip(size: int) -> Output:
+        output = _skips.get(size)
+        if output is None:
+            output = _skips[size] = Output((), size)
+        return output
 
-    def with_rule_name(self, rule_name: str) -> Output:
-        return Output(tuple(tok.with_rule_name(rule_name) for tok in self.toks))
+    def with_rule_name(self, rule_name: str, kind: Optional[int] = None, symbols_: Optional[symbols.Table] = None) -> Output:
+        return Output(tuple(tok.with_rule_name(rule_name, kind, symbols_) for tok in self.toks))
 
     @staticmethod
     def aggregate(outputs: Sequence[Output]) -> Output:
-        return Output(sum([output.toks for output in outputs], ()))
+        if len(outputs) == 1:
+            return outputs[0]
+        return Output(tuple(tok for output in outputs for tok in output.toks), sum(output.skipped for output in outputs))
+
+
+_skips: Dict[int, Output] = {}
 
 
 Context = processor.Context[Input, Output]
@@ -65,9 +103,13 @@ Rule = processor.Rule[Input, Output]
 
 
 class Literal(Rule):
-    def __init__(self, val: regex.Regex, include: bool = True):
+    def __init__(self, val: regex.Regex, include: bool = True, rule_name: Optional[str] = None, kind: Optional[int] = None, symbols_: Optional[symbols.Table] = None):
         self.val = val
+        self.partial = val.as_partial()
         self.include = include
+        self.rule_name = rule_name
+        self.kind = kind
+        self.symbols = symbols_
 
     def __eq__(self, rhs: object) -> bool:
         return isinstance(rhs, self.__class__) and self.val == rhs.val
@@ -80,16 +122,103 @@ class Literal(Rule):
 
     def __call__(self, context: Context) -> Output:
         try:
-            return Output((Token(self.val.process(context.input.input), context.input.location, include=self.include),))
+            val = self.partial if context.processor.partial else self.val
+            start, end = val.match_span(context.input.input, context.input.pos)
+            if not self.include:
+                return Output.skip(end - start)
+            return Output((Token(context.input.input[start:end], context.input.location, self.rule_name, self.include, self.kind, self.symbols),))
         except processor.Error as e:
             raise context.error(f'failed to apply regex {self.val}', e)
 
 
+class Literals(Rule):
+    def __init__(self, *literals: Tuple[str, str, bool], symbols_: Optional[symbols.Table] = None):
+        self.literals = literals
+        self.trie = regex.Trie(*[val for val, _, _ in literals])
+        self.symbols = symbols_
+        self.tokens: Dict[str, Tuple[str, bool, Optional[int]]] = {}
+        for val, rule_name, include in literals:
+            self.tokens.setdefault(val, (rule_name, include, symbols_.intern(
+                rule_name) if symbols_ is not None else None))
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, self.__class__) and self.literals == rhs.literals
+
+    def __hash__(self) -> int:
+        return hash(self.literals)
+
+    def __repr__(self) -> str:
+        return f'Literals({self.trie})'
+
+    def __call__(self, context: Context) -> Output:
+        val = self.trie.match(context.input.input, context.input.pos, context.processor.partial)
+        if val is None:
+            raise context.error(f'failed to match {self.trie}')
+        rule_name, include, kind = self.tokens[val]
+        if not include:
+            return Output.skip(len(val))
+        return Output((Token(val, context.input.location, rule_name, include, kind, self.symbols),))
+
+
+class Dispatch(Rule):
+    def __init__(self, *rules: Tuple[Rule, Optional[regex.CharSet], str]):
+        self.rules = rules
+        self.any = tuple((rule, prefix) for rule, first, prefix in rules if first is None)
+        self.table: Dict[str, Tuple[Tuple[Rule, str], ...]] = {}
+        self.frozen = False
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, self.__class__) and self.rules == rhs.rules
+
+    def __hash__(self) -> int:
+        return hash(self.rules)
+
+    def __repr__(self) -> str:
+        return '(%s)' % ' | '.join(repr(rule) for rule, _, _ in self.rules)
+
+    def freeze(self) -> Dispatch:
+        frozen = Dispatch(*self.rules)
+        for o in range(128):
+            frozen.candidates(chr(o))
+        frozen.frozen = True
+        return frozen
+
+    def candidates(self, c: str) -> Tuple[Tuple[Rule, str], ...]:
+        candidates = self.table.get(c)
+        if candidates is None:
+            candidates = tuple(
+                (rule, prefix) for rule, first, prefix in self.rules
+                if first is None or first.contains(c))
+            if not self.frozen:
+                self.table[c] = candidates
+        return candidates
+
+    def rules_at(self, context: Context) -> Iterator[Rule]:
+        text, _, pos = context.input
+        for rule, prefix in self.candidates(text[pos]) if pos < len(text) else self.any:
+            if prefix and not text.startswith(prefix, pos):
+                if context.processor.partial and len(text) - pos < len(prefix) and text.startswith(prefix[:len(text) - pos], pos):
+                    raise processor.Incomplete()
+                continue
+            yield rule
+
+    def __call__(self, context: Context) -> Output:
+        errors: List[processor.Error] = []
+        for rule in self.rules_at(context):
+            try:
+                return context.aggregate([rule(context)])
+            except processor.Error as e:
+                errors.append(e)
+        raise context.error('or', *errors)
+
+
 class Lexer(processor.Processor[Input, Output]):
-    def __init__(self, regexes: Mapping[str, regex.Regex], silent_regexes: Mapping[str, regex.Regex]):
+    def __init__(self, regexes: Mapping[str, regex.Regex], silent_regexes: Mapping[str, regex.Regex], symbols_: Optional[symbols.Table] = None):
         super().__init__({}, '_root')
+        self.symbols = symbols_ if symbols_ is not None else symbols.Table()
         self.add_rules(regexes, True)
         self.add_rules(silent_regexes, False)
+        self.compile()
 
     def __repr__(self):
         # return repr(self.rules)
@@ -107,10 +236,68 @@ class Lexer(processor.Processor[Input, Output]):
             self.add_rule(name, rule, include)
 
     def add_rule(self, name: str, rule: regex.Regex, include: bool=True)->None:
+        if self.frozen:
+            raise processor.Error('frozen lexer')
         if name in self.rules:
             raise processor.Error(f'duplicate rule {name}')
-        self.rules[name] = Literal(rule, include)
-        self.rules[self.root] = processor.UntilEmpty(processor.Or(*[processor.Ref(rule_name) for rule_name in self.rules.keys() if not rule_name.startswith('_')]))
+        self.rules[name] = Literal(rule, include, name, self.symbols.intern(name), self.symbols)
+        self.rules.pop(self.root, None)
+
+    def compile(self) -> None:
+        if self.root not in self.rules:
+            self.rules[self.root] = self._root_rule()
+
+    def freeze(self) -> Lexer:
+        if self.frozen:
+            return self
+        self.compile()
+        rules = dict(self.rules)
+        for rule_name, rule in rules.items():
+            if isinstance(rule, Literal):
+                rules[rule_name] = Literal(cast(regex.Regex, rule.val.freeze()),
+                                           rule.include, rule.rule_name, rule.kind, rule.symbols)
+        root = rules[self.root]
+        if isinstance(root, processor.UntilEmpty) and isinstance(root.rule, Dispatch):
+            rules[self.root] = processor.UntilEmpty(root.rule.freeze())
+        return cast(Lexer, self._replace(rules=types.MappingProxyType(rules), frozen=True))
+
+    def process(self, input: Input) -> Output:
+        self.compile()
+        return super().process(input)
+
+    def traced(self, tracer: processor.Tracer) -> Lexer:
+        rules = {rule_name: rule for rule_name, rule in self.rules.items() if rule_name != self.root}
+        rules[self.root] = processor.UntilEmpty(processor.Or(
+            *[processor.Ref(rule_name) for rule_name in rules if not rule_name.startswith('_')]))
+        return cast(Lexer, processor.Processor.traced(self._replace(rules=rules), tracer))
+
+    def _root_rule(self) -> Rule:
+        rules: List[Rule] = []
+        literals: List[Tuple[str, str, bool]] = []
+
+        def flush() -> None:
+            if len(literals) > 1:
+                rules.append(Literals(*literals, symbols_=self.symbols))
+            elif literals:
+                rules.append(processor.Ref(literals[0][1]))
+            literals.clear()
+        for rule_name, rule in self.rules.items():
+            if rule_name.startswith('_'):
+                continue
+            literal = cast(Literal, rule)
+            if literal.val.literal:
+                literals.append((literal.val.literal, rule_name, literal.include))
+            else:
+                flush()
+                rules.append(processor.Ref(rule_name))
+        flush()
+        return processor.UntilEmpty(Dispatch(*map(self._dispatch_entry, rules)))
+
+    def _dispatch_entry(self, rule: Rule) -> Tuple[Rule, Optional[regex.CharSet], str]:
+        if isinstance(rule, Literals):
+            return rule, regex.first_chars(rule.trie), regex.literal_prefix(rule.trie)
+        val = cast(Literal, self.rules[cast(processor.Ref, rule).val]).val
+        return rule, val.first, val.prefix
 
     def advance(self, input: Input, output: Output) -> Input:
         return input.advance(output)
@@ -121,8 +308,11 @@ class Lexer(processor.Processor[Input, Output]):
     def empty(self, input: Input) -> bool:
         return input.empty
 
-    def with_rule_name(self, output: Output, rule_name: str) -> Output:
-        return output if rule_name.startswith('_') else output.with_rule_name(rule_name)
+    def input_size(self, input: Input) -> int:
+        return len(input.input) - input.pos
+
+    def output_size(self, output: Output) -> int:
+        return len(output.toks)
 
     def aggregate_error_keys(self, context: Context, keys: Sequence[Input]) -> Input:
         return max(keys, key=lambda key: key.location)
@@ -131,4 +321,77 @@ class Lexer(processor.Processor[Input, Output]):
         return f'lex error {repr(msg)} at {context.input.location}'
 
     def lex(self, input: str) -> Sequence[Token]:
-        return [tok for tok in self.process(Input(input, Location(0, 0))).toks if tok.include]
+        return list(self.process(Input(input, Location(0, 0))).toks)
+
+    def steps(self, input: str) -> Iterator[Output]:
+        self.compile()
+        root = cast(processor.UntilEmpty, self.rules[self.root])
+        context = Context(self, Input(input, Location(0, 0)))
+        while not context.empty:
+            output = root.rule(context)
+            yield output
+            context = context.advance(output)
+
+
+class Builder:
+    def __init__(self, symbols_: Optional[symbols.Table] = None):
+        self.symbols = symbols_
+        self.rules: Dict[str, Tuple[regex.Regex, bool]] = {}
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.rules
+
+    def add(self, name: str, rule: regex.Regex, include: bool = True) -> Builder:
+        if name in self.rules:
+            raise processor.Error(f'duplicate rule {name}')
+        self.rules[name] = (rule, include)
+        return self
+
+    def build(self) -> Lexer:
+        lexer = Lexer({}, {}, self.symbols)
+        for name, (rule, include) in self.rules.items():
+            lexer.add_rule(name, rule, include)
+        return lexer.freeze()
+
+
+class Session:
+    def __init__(self, lexer: Lexer):
+        lexer.compile()
+        self.lexer = lexer
+        self.partial = lexer.as_partial()
+        self.input = Input('', Location(0, 0))
+        self.fragments: List[str] = []
+        self.size = 0
+        self.retry = 0
+
+    # An incomplete tail is only re-lexed once it has grown by half, so a
+    # token split into many small fragments costs O(n) rather than O(n**2).
+    def feed(self, fragment: str) -> List[Token]:
+        self.fragments.append(fragment)
+        self.size += len(fragment)
+        if self.size < self.retry:
+            return []
+        return self._lex(self.partial)
+
+    def close(self) -> List[Token]:
+        return self._lex(self.lexer)
+
+    def _lex(self, lexer: processor.Processor[Input, Output]) -> List[Token]:
+        if self.fragments:
+            self.input = Input(self.input.input[self.input.pos:] + ''.join(self.fragments), self.input.location)
+            self.fragments.clear()
+        dispatch = cast(processor.UntilEmpty, lexer.rules[lexer.root]).rule
+        context = Context(lexer, self.input)
+        toks: List[Token] = []
+        self.retry = 0
+        try:
+            while not context.empty:
+                output = dispatch(context)
+                toks.extend(output.toks)
+                context = context.advance(output)
+        except processor.Incomplete:
+            pending = len(context.input.input) - context.input.pos
+            self.retry = pending + max(1, pending // 2)
+        self.input = context.input
+        self.size = len(self.input.input) - self.input.pos
+        return toks
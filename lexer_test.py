@@ -1,7 +1,10 @@
 import lexer
 import processor
 import regex
+import tracer
 import unittest
+import unittest.mock
+from typing import cast
 
 import unittest.util
 unittest.util._MAX_LENGTH = 1000
@@ -19,6 +22,15 @@ class LocationTest(unittest.TestCase):
             lexer.Location(2, 1)
         )
 
+    def test_skip(self):
+        for start, end, location in [
+            (0, 2, lexer.Location(1, 3)),
+            (1, 4, lexer.Location(3, 0)),
+            (0, 6, lexer.Location(3, 2)),
+        ]:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(lexer.Location(1, 1).skip('ab\n\nab', start, end), location)
+
 
 class InputTest(unittest.TestCase):
     def test_advance(self):
@@ -30,11 +42,19 @@ class InputTest(unittest.TestCase):
                 lexer.Token('ab', lexer.Location(0, 0)),
             ])),
             lexer.Input(
-                input='c',
+                input='abc',
                 location=lexer.Location(0, 2),
+                pos=2,
             )
         )
 
+    def test_advance_skipped(self):
+        self.assertEqual(
+            lexer.Input('a \n b', lexer.Location(0, 1), 1).advance(
+                lexer.Output.skip(3)),
+            lexer.Input('a \n b', lexer.Location(1, 1), 4)
+        )
+
     def test_empty(self):
         self.assertTrue(lexer.Input('', lexer.Location(0, 0)).empty)
         self.assertFalse(lexer.Input('a', lexer.Location(0, 0)).empty)
@@ -92,7 +112,80 @@ class LiteralTest(unittest.TestCase):
         )
 
 
+class LiteralsTest(unittest.TestCase):
+    def test_call(self):
+        literals = lexer.Literals(('-', 'minus', True), ('->', 'arrow', True), (' ', 'ws', False))
+        self.assertEqual(
+            literals(lexer.Context(lexer.Lexer({}, {}), lexer.Input('->', lexer.Location(0, 1)))),
+            lexer.Output((lexer.Token('-', lexer.Location(0, 1), 'minus'),))
+        )
+        self.assertEqual(
+            literals(lexer.Context(lexer.Lexer({}, {}), lexer.Input(' ', lexer.Location(0, 1)))),
+            lexer.Output((), 1)
+        )
+        with self.assertRaisesRegex(processor.Error, 'failed to match'):
+            literals(lexer.Context(lexer.Lexer({}, {}), lexer.Input('a', lexer.Location(0, 1))))
+
+
+class DispatchTest(unittest.TestCase):
+    def test_candidates(self):
+        a, b, c = processor.Ref('a'), processor.Ref('b'), processor.Ref('c')
+        dispatch = lexer.Dispatch(
+            (a, regex.CharSet([('a', 'z')]), ''),
+            (b, None, ''),
+            (c, regex.CharSet([('x', 'x')]), 'xy'),
+        )
+        self.assertEqual(dispatch.candidates('x'), ((a, ''), (b, ''), (c, 'xy')))
+        self.assertEqual(dispatch.candidates('0'), ((b, ''),))
+
+    def test_call(self):
+        lexer_ = lexer.Lexer(
+            {
+                'xy': regex.Regex(processor.And(regex.Literal('xy'), processor.ZeroOrMore(regex.Class('a', 'z')))),
+                'x': regex.Regex(regex.Class('a', 'z')),
+            }, {}
+        )
+        self.assertEqual(
+            [(tok.val, tok.rule_name) for tok in lexer_.lex('xyzxa')],
+            [('xyzxa', 'xy')]
+        )
+        self.assertEqual(
+            [(tok.val, tok.rule_name) for tok in lexer_.lex('xaxy')],
+            [('x', 'x'), ('a', 'x'), ('xy', 'xy')]
+        )
+        with self.assertRaisesRegex(processor.Error, 'or'):
+            lexer_.lex('x0')
+
+
 class LexerTest(unittest.TestCase):
+    def test_literals(self):
+        lexer_ = lexer.Lexer(
+            {
+                '->': regex.Regex(regex.Literal('->')),
+                '-': regex.Regex(regex.Literal('-')),
+                'id': regex.Regex(processor.OneOrMore(regex.Class('a', 'z'))),
+                '=': regex.Regex(regex.Literal('=')),
+                '==': regex.Regex(regex.Literal('==')),
+            }, {
+                'ws': regex.Regex(regex.Literal(' ')),
+            }
+        )
+        self.assertEqual(
+            lexer_.rules['_root'],
+            processor.UntilEmpty(lexer.Dispatch(
+                (lexer.Literals(('->', '->', True), ('-', '-', True)),
+                 regex.CharSet([('-', '-')]), '-'),
+                (processor.Ref('id'), regex.CharSet([('a', 'z')]), ''),
+                (lexer.Literals(('=', '=', True), ('==', '==', True), (' ', 'ws', False)),
+                 regex.CharSet([(' ', ' '), ('=', '=')]), ''),
+            ))
+        )
+        self.assertEqual(
+            [(tok.val, tok.rule_name) for tok in lexer_.lex('a->b-c==d')],
+            [('a', 'id'), ('->', '->'), ('b', 'id'), ('-', '-'), ('c', 'id'),
+             ('=', '='), ('=', '='), ('d', 'id')]
+        )
+
     def test_lex(self):
         for input, output in [
             (
@@ -125,6 +218,145 @@ class LexerTest(unittest.TestCase):
                     output
                 )
 
+    def test_one_token_per_included_match(self):
+        created = []
+
+        class CountingToken(lexer.Token):
+            def __new__(cls, *args, **kwargs):
+                created.append(None)
+                return super().__new__(cls, *args, **kwargs)
+        with unittest.mock.patch.object(lexer, 'Token', CountingToken):
+            toks = lexer.Lexer(
+                {
+                    'ar': regex.Regex(processor.OneOrMore(regex.Literal('a'))),
+                    'br': regex.Regex(regex.Literal('b')),
+                    'cr': regex.Regex(regex.Literal('c')),
+                }, {
+                    'ws': regex.Regex(regex.Literal(' ')),
+                }
+            ).lex('aa b c')
+        self.assertEqual([(tok.val, tok.rule_name) for tok in toks],
+                         [('aa', 'ar'), ('b', 'br'), ('c', 'cr')])
+        self.assertEqual(len(created), 3)
+
+    def test_lazy_root(self):
+        lexer_ = lexer.Lexer({'a': regex.Regex(regex.Literal('a'))}, {})
+        lexer_.add_rule('b', regex.Regex(regex.Literal('b')))
+        self.assertNotIn('_root', lexer_.rules)
+        self.assertEqual([tok.val for tok in lexer_.lex('ab')], ['a', 'b'])
+        self.assertIn('_root', lexer_.rules)
+
+    def test_freeze(self):
+        lexer_ = lexer.Lexer({'a': regex.Regex(regex.Literal('a'))}, {})
+        frozen = lexer_.freeze()
+        self.assertIs(frozen.freeze(), frozen)
+        self.assertEqual(frozen, lexer_)
+        with self.assertRaisesRegex(processor.Error, 'frozen lexer'):
+            frozen.add_rule('b', regex.Regex(regex.Literal('b')))
+        with self.assertRaises(TypeError):
+            frozen.rules['b'] = frozen.rules['a']
+        self.assertEqual([tok.val for tok in frozen.lex('aa')], ['a', 'a'])
+        literal = cast(lexer.Literal, frozen.rules['a'])
+        self.assertTrue(literal.val.frozen)
+        self.assertTrue(literal.partial.frozen)
+        self.assertFalse(cast(lexer.Literal, lexer_.rules['a']).val.frozen)
+
+    def test_freeze_traced(self):
+        frozen = lexer.Lexer({'a': regex.Regex(regex.Literal('a'))}, {}).freeze()
+        traced = frozen.traced(tracer.RingBuffer())
+        self.assertTrue(traced.frozen)
+        with self.assertRaises(TypeError):
+            traced.rules['b'] = traced.rules['a']
+        with self.assertRaisesRegex(processor.Error, 'frozen lexer'):
+            traced.add_rule('b', regex.Regex(regex.Literal('b')))
+        self.assertEqual([tok.val for tok in traced.lex('aa')], ['a', 'a'])
+        regex_ = cast(lexer.Literal, frozen.rules['a']).val.traced(tracer.RingBuffer())
+        with self.assertRaises(TypeError):
+            regex_.rules['b'] = regex_.rules['root']
+
+
+class BuilderTest(unittest.TestCase):
+    def test_build(self):
+        builder = lexer.Builder()
+        builder.add('a', regex.Regex(processor.OneOrMore(regex.Literal('a'))))
+        builder.add('ws', regex.Regex(regex.Literal(' ')), False)
+        builder.add('b', regex.Regex(regex.Literal('b')))
+        self.assertIn('ws', builder)
+        lexer_ = builder.build()
+        self.assertTrue(lexer_.frozen)
+        self.assertEqual(list(lexer_.rules), ['a', 'ws', 'b', '_root'])
+        self.assertEqual([(tok.val, tok.rule_name) for tok in lexer_.lex('aa b')],
+                         [('aa', 'a'), ('b', 'b')])
+
+    def test_duplicate(self):
+        builder = lexer.Builder().add('a', regex.Regex(regex.Literal('a')))
+        with self.assertRaisesRegex(processor.Error, 'duplicate rule a'):
+            builder.add('a', regex.Regex(regex.Literal('b')))
+
+
+class SessionTest(unittest.TestCase):
+    @staticmethod
+    def lexer_() -> lexer.Lexer:
+        return lexer.Lexer(
+            {
+                '->': regex.Regex(regex.Literal('->')),
+                '-': regex.Regex(regex.Literal('-')),
+                'id': regex.Regex(processor.OneOrMore(regex.Class('a', 'z'))),
+                'str': regex.Regex(processor.And(regex.Literal('"'), processor.ZeroOrMore(
+                    regex.Not(regex.Literal('"'))), regex.Literal('"'))),
+            }, {
+                'ws': regex.Regex(processor.OneOrMore(processor.Or(regex.Literal(' '), regex.Literal('\n')))),
+            }
+        ).freeze()
+
+    def test_feed(self):
+        session = lexer.Session(self.lexer_())
+        for fragment, vals in [
+            ('ab', []),
+            ('c -', ['abc']),
+            ('>', ['->']),
+            (' "x\n', []),
+            ('y" d', ['"x\ny"']),
+            ('', []),
+        ]:
+            with self.subTest(fragment=fragment):
+                self.assertEqual([tok.val for tok in session.feed(fragment)], vals)
+        self.assertEqual(session.close(), [lexer.Token('d', lexer.Location(1, 3), 'id')])
+
+    def test_splits(self):
+        input = 'ab -> "c d"\n-x->  y "" -'
+        expected = self.lexer_().lex(input)
+        for size in range(1, 6):
+            with self.subTest(size=size):
+                session = lexer.Session(self.lexer_())
+                toks = []
+                for i in range(0, len(input), size):
+                    toks.extend(session.feed(input[i:i+size]))
+                toks.extend(session.close())
+                self.assertEqual(toks, expected)
+
+    def test_long_token(self):
+        input = 'a "%s" b' % ('x' * 5000)
+        session = lexer.Session(self.lexer_())
+        toks = []
+        with unittest.mock.patch.object(session, '_lex', wraps=session._lex) as lex:
+            for c in input:
+                toks.extend(session.feed(c))
+            toks.extend(session.close())
+        self.assertEqual(toks, self.lexer_().lex(input))
+        self.assertLess(lex.call_count, 40)
+
+    def test_error(self):
+        session = lexer.Session(self.lexer_())
+        with self.assertRaises(processor.Error):
+            session.feed('a 0')
+
+    def test_close_incomplete(self):
+        session = lexer.Session(self.lexer_())
+        self.assertEqual(session.feed('"ab'), [])
+        with self.assertRaises(processor.Error):
+            session.close()
+
 
 if __name__ == '__main__':
     unittest.main()
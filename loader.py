@@ -3,23 +3,29 @@ import lexer
 import parser
 import processor
 import regex
+import symbols
 import syntax
-from typing import Callable, Optional, Sequence, Tuple
+from typing import Callable, Dict, Optional, Sequence, Tuple
 
 
 def load_regex(input: str) -> regex.Regex:
+    return regex.Regex(load_regex_rule(input))
+
+
+def regex_lexer() -> lexer.Lexer:
     operators = '*+?^!()[]-|'
     reserved_operators = operators + '\\'
-    class_pairs = {('a', 'z'), ('A', 'Z'), ('0', '9')}
-    lexer_ = lexer.Lexer({
+    return lexer.Lexer({
         'any': regex.Regex(regex.Not(processor.Or(
             *[regex.Literal(op) for op in reserved_operators]))),
         'escape': regex.Regex(processor.Or(
             *[regex.Literal('\\%s' % op) for op in operators])),
         **{op: regex.Regex(regex.Literal(op)) for op in operators}
     }, {})
-    toks = lexer_.lex(input)
-    parser_ = parser.Parser({
+
+
+def regex_parser() -> parser.Parser:
+    return parser.Parser({
         'rule': processor.Or(
             processor.Ref('or'),
             processor.Ref('and'),
@@ -91,7 +97,11 @@ def load_regex(input: str) -> regex.Regex:
             processor.Ref('unary_operand'),
         ),
     }, 'rule')
-    node = parser_.parse(toks)
+
+
+def load_regex_rule(input: str) -> regex.Rule:
+    toks = regex_lexer().lex(input)
+    node = regex_parser().parse(toks)
 
     syntax_: syntax.Syntax[regex.Rule] = syntax.Syntax(
         syntax.rule_name(
@@ -122,12 +132,12 @@ def load_regex(input: str) -> regex.Regex:
     )
     rules: Sequence[regex.Rule] = syntax_(node)
     assert len(rules) == 1, (input, toks, node, rules)
-    return regex.Regex(rules[0])
+    return rules[0]
 
 
-def load_lexer_and_parser(input: str) -> Tuple[lexer.Lexer, parser.Parser]:
+def grammar_lexer() -> lexer.Lexer:
     operators = {'=', '~=', ';', '->', '*', '?', '+', '!', '(', ')', '|'}
-    lexer_ = lexer.Lexer(
+    return lexer.Lexer(
         {
             'id': load_regex('([a-z]|[A-Z]|_)([a-z]|[A-Z]|[0-9]|_)*'),
             'regex': load_regex('"(^")*"'),
@@ -137,8 +147,10 @@ def load_lexer_and_parser(input: str) -> Tuple[lexer.Lexer, parser.Parser]:
             'ws': regex.Regex(processor.OneOrMore(processor.Or(*[regex.Literal(val) for val in ' \t\n']))),
         }
     )
-    toks = lexer_.lex(input)
-    parser_ = parser.Parser({
+
+
+def grammar_parser() -> parser.Parser:
+    return parser.Parser({
         'root': processor.UntilEmpty(
             processor.Ref('decl')
         ),
@@ -225,15 +237,20 @@ def load_lexer_and_parser(input: str) -> Tuple[lexer.Lexer, parser.Parser]:
             parser.Literal('!'),
         ),
     }, 'root')
-    node = parser_.parse(toks)
-    loaded_lexer = lexer.Lexer({}, {})
-    loaded_parser = parser.Parser({}, '')
+
+
+def load_lexer_and_parser(input: str) -> Tuple[lexer.Lexer, parser.Parser]:
+    toks = grammar_lexer().lex(input)
+    node = grammar_parser().parse(toks)
+    symbols_ = symbols.Table()
+    lexer_builder = lexer.Builder(symbols_)
+    loaded_rules: Dict[str, parser.Rule] = {}
 
     def lex_rule_decl(include: bool) -> syntax.Rule:
         def impl(node: parser.Node, exprs: Sequence[parser.Rule]) -> None:
             id = syntax.get_token_vals('id')(node)[0]
             val = syntax.get_token_vals('regex')(node)[0][1:-1]
-            loaded_lexer.add_rule(id, load_regex(val), include)
+            lexer_builder.add(id, load_regex(val), include)
         return impl
 
     def rule_decl(node: parser.Node, exprs: Sequence[parser.Rule]) -> parser.Rule:
@@ -241,16 +258,14 @@ def load_lexer_and_parser(input: str) -> Tuple[lexer.Lexer, parser.Parser]:
         id = syntax.get_token_vals('id')(node)[0]
         assert exprs
         rule = exprs[0]
-        assert not id in loaded_parser.rules, f'duplicate rule {repr(id)}'
-        loaded_parser.rules[id] = rule
-        if not loaded_parser.root:
-            loaded_parser.root = id
+        assert not id in loaded_rules, f'duplicate rule {repr(id)}'
+        loaded_rules[id] = rule
         return rule
 
     def literal(node: parser.Node, exprs: Sequence[parser.Rule]) -> parser.Rule:
         val = syntax.get_token_vals('regex')(node)[0][1:-1]
-        if val not in loaded_lexer.rules:
-            loaded_lexer.add_rule(val, load_regex(val))
+        if val not in lexer_builder:
+            lexer_builder.add(val, load_regex(val))
         return parser.Literal(val)
 
     syntax_: syntax.Syntax[parser.Rule] = syntax.Syntax(
@@ -273,4 +288,4 @@ def load_lexer_and_parser(input: str) -> Tuple[lexer.Lexer, parser.Parser]:
         syntax.rule_name('or', lambda node, exprs: processor.Or(*exprs)),
     )
     syntax_(node)
-    return loaded_lexer, loaded_parser
+    return lexer_builder.build(), parser.Parser(loaded_rules, next(iter(loaded_rules), ''), symbols_).freeze()
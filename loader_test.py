@@ -94,6 +94,32 @@ class LoaderTest(unittest.TestCase):
             with self.subTest(input=input, expected=expected):
                 self.assertEqual(loader.load_regex(input), expected)
 
+    def test_load_regex_simplified(self):
+        for input in [
+            '([a-z]|[A-Z]|_)([a-z]|[A-Z]|[0-9]|_)*',
+            '"(^")*"',
+            '( |\n|\t)+',
+            'abc',
+            '(ab)c(d(e))',
+            'aa*',
+        ]:
+            with self.subTest(input=input):
+                rule = loader.load_regex_rule(input)
+                self.assertLess(
+                    regex.count_nodes(regex.optimize(rule)),
+                    regex.count_nodes(rule))
+                for val in ['', 'a', 'aab', 'abcde', 'a_1 b', '"x"y', '123', ' \t\n ', 'Z']:
+                    self.assertEqual(
+                        self.match(regex.optimize(rule), val),
+                        self.match(rule, val))
+
+    @staticmethod
+    def match(rule: regex.Rule, input: str):
+        try:
+            return rule(processor.Context(regex.Regex(None), regex.Input(input)))
+        except processor.Error:
+            return None
+
     def test_load_lexer_and_parser(self):
         for input, expected_lexer, expected_parser in [
             (
@@ -158,6 +184,22 @@ class LoaderTest(unittest.TestCase):
                 self.assertEqual(actual_lexer, expected_lexer)
                 self.assertEqual(actual_parser, expected_parser)
 
+    def test_load_lexer_and_parser_symbols(self):
+        lexer_, parser_ = loader.load_lexer_and_parser('id = "[a-z]"; a -> "id" "=" "id";')
+        self.assertIs(lexer_.symbols, parser_.symbols)
+        self.assertEqual(parser_.rules['a'].rules[1].kind, lexer_.symbols.kind('='))
+        node = parser_.parse(lexer_.lex('x=y'))
+        self.assertEqual(node.kind, parser_.symbols.kind('a'))
+        self.assertEqual([child.token.kind for child in node.children],
+                         [lexer_.symbols.kind(name) for name in ['id', '=', 'id']])
+
+    def test_load_lexer_with_other_parser(self):
+        lexer_, _ = loader.load_lexer_and_parser('a = "a"; b = "b";')
+        parser_ = parser.Parser({'r': parser.Literal('a')}, 'r')
+        self.assertEqual(parser_.parse(lexer_.lex('a')).token.val, 'a')
+        with self.assertRaises(processor.Error):
+            parser_.parse(lexer_.lex('b'))
+
 
 if __name__ == '__main__':
     unittest.main()
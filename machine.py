@@ -0,0 +1,277 @@
+from __future__ import annotations
+import parser
+import processor
+import regex
+from typing import Any, Callable, Dict, Generic, List, Sequence, Tuple
+
+STRING = 0
+TOKEN = 1
+RANGE = 2
+SET = 3
+ANY = 4
+LEAF = 5
+CHOICE = 6
+COMMIT = 7
+JUMP = 8
+CALL = 9
+RETURN = 10
+MARK = 11
+AGGREGATE = 12
+NAME = 13
+EMPTY = 14
+FAIL = 15
+FAIL_TWICE = 16
+FAIL_AT_END = 17
+END = 18
+
+NAMES = ('string', 'token', 'range', 'set', 'any', 'leaf', 'choice', 'commit', 'jump', 'call',
+         'return', 'mark', 'aggregate', 'name', 'empty', 'fail', 'fail_twice', 'fail_at_end', 'end')
+
+Instruction = Tuple[int, Any]
+
+
+class Program(Generic[processor.TI, processor.TO]):
+    def __init__(self, processor_: processor.Processor[processor.TI, processor.TO], code: Sequence[Instruction],
+                 input: Callable[[Any, int], processor.TI], end: Callable[[int, processor.TO], int],
+                 aggregate: Callable[[int, List[processor.TO]], processor.TO]):
+        self.processor = processor_
+        self.code = tuple(code)
+        self.input = input
+        self.end = end
+        self.aggregate = aggregate
+
+    def __repr__(self) -> str:
+        return '\n'.join(f'{i:4} {NAMES[op]} {arg!r}' for i, (op, arg) in enumerate(self.code))
+
+    def run(self, subject: Any, pos: int = 0) -> processor.TO:
+        code = self.code
+        processor_ = self.processor
+        aggregate = self.aggregate
+        size = len(subject)
+        values: List[Any] = []
+        marks: List[Tuple[int, int]] = []
+        calls: List[int] = []
+        choices: List[Tuple[int, int, int, int, int]] = []
+        far = pos
+        pc = 0
+        while True:
+            op, arg = code[pc]
+            pc += 1
+            if op == TOKEN:
+                if pos < size:
+                    tok = subject[pos]
+                    val, kind, symbols_ = arg
+                    if tok.kind == kind if symbols_ is not None and tok.symbols is symbols_ else tok.rule_name == val:
+                        values.append(parser.Node(token=tok))
+                        pos += 1
+                        continue
+            elif op == STRING:
+                if subject.startswith(arg, pos):
+                    end = pos + len(arg)
+                    values.append(regex.Span(pos, end))
+                    pos = end
+                    continue
+            elif op == RANGE:
+                if pos < size and arg[0] <= subject[pos] <= arg[1]:
+                    values.append(regex.Span(pos, pos + 1))
+                    pos += 1
+                    continue
+            elif op == SET:
+                if pos < size and arg(subject[pos]):
+                    values.append(regex.Span(pos, pos + 1))
+                    pos += 1
+                    continue
+            elif op == MARK:
+                marks.append((len(values), pos))
+                continue
+            elif op == AGGREGATE:
+                vlen, start = marks.pop()
+                outputs = values[vlen:]
+                del values[vlen:]
+                values.append(aggregate(start, outputs))
+                continue
+            elif op == CALL:
+                calls.append(pc)
+                pc = arg
+                continue
+            elif op == RETURN:
+                pc = calls.pop()
+                continue
+            elif op == NAME:
+                values[-1] = processor_.with_rule_name(values[-1], arg)
+                continue
+            elif op == CHOICE:
+                choices.append((arg, pos, len(values), len(marks), len(calls)))
+                continue
+            elif op == COMMIT:
+                choices.pop()
+                pc = arg
+                continue
+            elif op == JUMP:
+                pc = arg
+                continue
+            elif op == EMPTY:
+                if pos >= size:
+                    pc = arg
+                continue
+            elif op == ANY:
+                values.append(regex.Span(pos, pos + 1))
+                pos += 1
+                continue
+            elif op == LEAF:
+                try:
+                    output = arg(processor.Context(processor_, self.input(subject, pos)))
+                except processor.Error:
+                    pass
+                else:
+                    values.append(output)
+                    pos = self.end(pos, output)
+                    continue
+            elif op == FAIL_AT_END:
+                if pos < size:
+                    continue
+            elif op == FAIL_TWICE:
+                choices.pop()
+            elif op == END:
+                return values[-1]
+            if pos > far:
+                far = pos
+            if not choices:
+                raise processor.Context(processor_, self.input(subject, far)).error('failed to match')
+            pc, pos, vlen, mlen, clen = choices.pop()
+            del values[vlen:]
+            del marks[mlen:]
+            del calls[clen:]
+
+
+class _Compiler:
+    def __init__(self, processor_: processor.Processor, leaf: Callable[[Any], Instruction]):
+        self.processor = processor_
+        self.leaf = leaf
+        self.code: List[Instruction] = []
+        self.labels: Dict[str, int] = {}
+        self.calls: List[Tuple[int, str]] = []
+
+    def emit(self, op: int, arg: Any = None) -> int:
+        self.code.append((op, arg))
+        return len(self.code) - 1
+
+    def patch(self, pc: int, target: int) -> None:
+        self.code[pc] = (self.code[pc][0], target)
+
+    def compile(self) -> List[Instruction]:
+        self.calls.append((self.emit(CALL), self.processor.root))
+        self.emit(END)
+        for rule_name in self.processor.rules:
+            self.labels[rule_name] = len(self.code)
+            self.rule(self.processor.rule(rule_name))
+            self.emit(NAME, rule_name)
+            self.emit(RETURN)
+        for pc, rule_name in self.calls:
+            if rule_name not in self.labels:
+                self.labels[rule_name] = self.emit(FAIL)
+            self.patch(pc, self.labels[rule_name])
+        return self.code
+
+    def rule(self, rule: Any) -> None:
+        if isinstance(rule, processor.Ref):
+            self.emit(MARK)
+            self.calls.append((self.emit(CALL), rule.val))
+            self.emit(AGGREGATE)
+        elif isinstance(rule, processor.And):
+            self.emit(MARK)
+            for child in rule.rules:
+                self.rule(child)
+            self.emit(AGGREGATE)
+        elif isinstance(rule, processor.Or):
+            self.emit(MARK)
+            commits: List[int] = []
+            for child in rule.rules[:-1]:
+                choice = self.emit(CHOICE)
+                self.rule(child)
+                commits.append(self.emit(COMMIT))
+                self.patch(choice, len(self.code))
+            if rule.rules:
+                self.rule(rule.rules[-1])
+            else:
+                self.emit(FAIL)
+            for commit in commits:
+                self.patch(commit, len(self.code))
+            self.emit(AGGREGATE)
+        elif isinstance(rule, (processor.ZeroOrMore, processor.OneOrMore)):
+            self.emit(MARK)
+            if isinstance(rule, processor.OneOrMore):
+                self.rule(rule.rule)
+            choice = self.emit(CHOICE)
+            self.rule(rule.rule)
+            self.emit(COMMIT, choice)
+            self.patch(choice, len(self.code))
+            self.emit(AGGREGATE)
+        elif isinstance(rule, processor.ZeroOrOne):
+            choice = self.emit(CHOICE)
+            self.rule(rule.rule)
+            commit = self.emit(COMMIT)
+            self.patch(choice, self.emit(MARK))
+            self.emit(AGGREGATE)
+            self.patch(commit, len(self.code))
+        elif isinstance(rule, processor.UntilEmpty):
+            self.emit(MARK)
+            empty = self.emit(EMPTY)
+            self.rule(rule.rule)
+            self.emit(JUMP, empty)
+            self.patch(empty, self.emit(AGGREGATE))
+        elif isinstance(rule, regex.Not):
+            self.emit(FAIL_AT_END)
+            choice = self.emit(CHOICE)
+            self.rule(rule.rule)
+            self.emit(FAIL_TWICE)
+            self.patch(choice, self.emit(ANY))
+        else:
+            self.code.append(self.leaf(rule))
+
+
+def _regex_leaf(rule: Any) -> Instruction:
+    if isinstance(rule, regex.Literal):
+        return STRING, rule.val
+    elif isinstance(rule, regex.Class):
+        return RANGE, (rule.min, rule.max)
+    elif isinstance(rule, regex.CharSet):
+        return SET, rule.contains
+    return LEAF, rule
+
+
+def _regex_aggregate(start: int, outputs: List[regex.Span]) -> regex.Span:
+    if not outputs:
+        return regex.Span(start, start)
+    return regex.Span(outputs[0].start, outputs[-1].end)
+
+
+def _parser_leaf(rule: Any) -> Instruction:
+    if isinstance(rule, parser.Literal):
+        return TOKEN, (rule.val, rule.kind, rule.symbols)
+    return LEAF, rule
+
+
+def _parser_aggregate(start: int, outputs: List[parser.Node]) -> parser.Node:
+    return parser.Node(children=tuple(outputs))
+
+
+def compile_regex(regex_: regex.Regex) -> Program[regex.Input, regex.Span]:
+    return Program(
+        regex_,
+        _Compiler(regex_, _regex_leaf).compile(),
+        regex.Input,
+        lambda pos, output: output.end,
+        _regex_aggregate,
+    )
+
+
+def compile_parser(parser_: parser.Parser) -> Program[parser.Input, parser.Node]:
+    return Program(
+        parser_,
+        _Compiler(parser_, _parser_leaf).compile(),
+        lambda toks, pos: parser.Input(toks[pos:]),
+        lambda pos, output: pos + len(output),
+        _parser_aggregate,
+    )
+
@@ -0,0 +1,55 @@
+from __future__ import annotations
+import loader
+import machine
+import parser
+import timeit
+import vm
+from typing import Callable, Mapping, Sequence, Tuple
+
+
+def regexes(count: int) -> Sequence[str]:
+    return ['([a-z]|[A-Z]|_)([a-z]|[A-Z]|[0-9]|_)*', '"(^")*"', '( |\n|\t)+', '\\(a+\\)?|b!'] * count
+
+
+def grammars(count: int) -> Sequence[str]:
+    return [vm.GRAMMAR * count]
+
+
+BENCHMARKS: Mapping[str, Tuple[Callable[[], Tuple[parser.Parser, Callable[[str], Sequence]]], Sequence[str]]] = {
+    'regex': (lambda: (loader.regex_parser(), loader.regex_lexer().lex), regexes(4)),
+    'grammar': (lambda: (loader.grammar_parser(), loader.grammar_lexer().lex), grammars(8)),
+}
+
+MATCHES: Mapping[str, str] = {
+    '([a-z]|[A-Z]|_)([a-z]|[A-Z]|[0-9]|_)*': 'snake_case_identifier_42 ' * 8,
+    '"(^")*"': '"%s"' % ('x' * 200),
+    '( |\n|\t)+': ' \t\n' * 64,
+}
+
+
+def bench(name: str, fn: Callable[[], None], number: int) -> float:
+    seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f'  {name:12} {seconds * 1e6:10.1f}us')
+    return seconds
+
+
+def main(number: int = 20) -> None:
+    for name, (load, inputs) in BENCHMARKS.items():
+        parser_, lex = load()
+        program = machine.compile_parser(parser_)
+        toks = [lex(input) for input in inputs]
+        print(name)
+        tree = bench('interpreter', lambda: [parser_.parse(toks_) for toks_ in toks], number)
+        compiled = bench('machine', lambda: [program.run(toks_) for toks_ in toks], number)
+        print(f'  {"speedup":12} {tree / compiled:10.2f}x')
+    for pattern, text in MATCHES.items():
+        regex_ = loader.load_regex(pattern).interpreted()
+        program_ = machine.compile_regex(regex_)
+        print(repr(pattern))
+        tree = bench('interpreter', lambda: regex_.match_span(text), number)
+        compiled = bench('machine', lambda: program_.run(text), number)
+        print(f'  {"speedup":12} {tree / compiled:10.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+from __future__ import annotations
+import lexer
+import loader
+import machine
+import parser
+import processor
+import random
+import regex
+import regex_test
+import unittest
+import vm
+
+import unittest.util
+unittest.util._MAX_LENGTH = 1000
+
+
+def attempt(fn, *args):
+    try:
+        return fn(*args)
+    except processor.Error:
+        return None
+
+
+class RegexTest(unittest.TestCase):
+    def test_equivalent(self):
+        rng = random.Random(0)
+        texts = [''.join(rng.choice(regex_test.ALPHABET) for _ in range(rng.randint(0, 6)))
+                 for _ in range(40)]
+        for _ in range(300):
+            regex_ = regex.Regex(regex_test.random_rule(rng, 3)).interpreted()
+            program = machine.compile_regex(regex_)
+            for text in texts:
+                with self.subTest(regex=regex_, text=text):
+                    self.assertEqual(attempt(program.run, text),
+                                     attempt(regex_.match_span, text))
+
+    def test_pos(self):
+        program = machine.compile_regex(loader.load_regex('b+'))
+        self.assertEqual(program.run('abbc', 1), regex.Span(1, 3))
+
+    def test_error(self):
+        program = machine.compile_regex(loader.load_regex('a[b-c]'))
+        with self.assertRaisesRegex(processor.Error, "regex error 'failed to match' at 'd'"):
+            program.run('ad')
+
+
+class ParserTest(unittest.TestCase):
+    def test_grammar(self):
+        lexer_, parser_ = loader.grammar_lexer(), loader.grammar_parser()
+        program = machine.compile_parser(parser_)
+        for input in [vm.GRAMMAR, 'a -> b;', 'a -> (b | "c")* d? e+ f!;', 'a -> ;', 'a = "b"; c ~= "d";']:
+            with self.subTest(input=input):
+                toks = lexer_.lex(input)
+                self.assertEqual(attempt(program.run, toks), attempt(parser_.parse, toks))
+
+    def test_regex_grammar(self):
+        lexer_, parser_ = loader.regex_lexer(), loader.regex_parser()
+        program = machine.compile_parser(parser_)
+        for input in ['a', 'ab|c', '([a-z]|_)*', '"(^")*"', '\\(a+\\)?', 'a!b', '(a', '|']:
+            with self.subTest(input=input):
+                toks = lexer_.lex(input)
+                self.assertEqual(attempt(program.run, toks), attempt(parser_.parse, toks))
+
+    def test_kinds(self):
+        lexer_, parser_ = loader.load_lexer_and_parser('id = "[a-z]"; a -> "id" "=" "id";')
+        toks = lexer_.lex('x=y')
+        node = machine.compile_parser(parser_).run(toks)
+        self.assertEqual(node, parser_.parse(toks))
+        self.assertEqual(node.kind, parser_.symbols.kind('a'))
+
+    def test_kinds_other_table(self):
+        lexer_, _ = loader.load_lexer_and_parser('a = "a"; b = "b";')
+        program = machine.compile_parser(parser.Parser({'r': parser.Literal('a')}, 'r'))
+        self.assertEqual(program.run(lexer_.lex('a')).token.val, 'a')
+        with self.assertRaises(processor.Error):
+            program.run(lexer_.lex('b'))
+
+    def test_unknown_rule(self):
+        program = machine.compile_parser(parser.Parser({'a': processor.Ref('b')}, 'a'))
+        with self.assertRaises(processor.Error):
+            program.run([lexer.Token('b', lexer.Location(0, 0), 'b')])
+
+    def test_deep_nesting(self):
+        lexer_, parser_ = loader.load_lexer_and_parser('''
+            id = "x";
+            expr -> "id" | ("\\(" expr "\\)");
+        ''')
+        toks = lexer_.lex('(' * 5000 + 'x' + ')' * 5000)
+        self.assertEqual(len(machine.compile_parser(parser_).run(toks)), len(toks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+import bisect
+import json
+import processor
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Sequence
+
+
+def _buckets(min: float = 1e-6, max: float = 100.0, factor: float = 2.0) -> Sequence[float]:
+    buckets: List[float] = []
+    bound = min
+    while bound < max:
+        buckets.append(bound)
+        bound *= factor
+    return tuple(buckets)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = _buckets()):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def __repr__(self) -> str:
+        return f'Histogram(count={self.count}, sum={self.sum})'
+
+    def add(self, val: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, val)] += 1
+        self.count += 1
+        self.sum += val
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class Stats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.input_size = 0
+        self.output_size = 0
+        self.seconds = 0.0
+        self.latency = Histogram()
+
+    def __repr__(self) -> str:
+        return f'Stats(calls={self.calls}, errors={self.errors})'
+
+    @property
+    def input_rate(self) -> float:
+        return self.input_size / self.seconds if self.seconds else 0.0
+
+    @property
+    def output_rate(self) -> float:
+        return self.output_size / self.seconds if self.seconds else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.calls if self.calls else 0.0
+
+    def snapshot(self) -> Mapping[str, Any]:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'error_rate': self.error_rate,
+            'input_size': self.input_size,
+            'output_size': self.output_size,
+            'seconds': self.seconds,
+            'input_rate': self.input_rate,
+            'output_rate': self.output_rate,
+            'p50': self.latency.quantile(0.5),
+            'p90': self.latency.quantile(0.9),
+            'p99': self.latency.quantile(0.99),
+        }
+
+
+class Aggregator(processor.Metrics):
+    def __init__(self):
+        self.stats: Dict[str, Stats] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f'Aggregator(stats={self.stats})'
+
+    def _stats(self, name: str) -> Stats:
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = Stats()
+        return stats
+
+    def start(self, name: str, input_size: int) -> None:
+        pass
+
+    def end(self, name: str, input_size: int, output_size: int, seconds: float) -> None:
+        with self._lock:
+            stats = self._stats(name)
+            stats.calls += 1
+            stats.input_size += input_size
+            stats.output_size += output_size
+            stats.seconds += seconds
+            stats.latency.add(seconds)
+
+    def error(self, name: str, input_size: int, seconds: float) -> None:
+        with self._lock:
+            stats = self._stats(name)
+            stats.calls += 1
+            stats.errors += 1
+            stats.input_size += input_size
+            stats.seconds += seconds
+            stats.latency.add(seconds)
+
+    def snapshot(self) -> Mapping[str, Mapping[str, Any]]:
+        with self._lock:
+            return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+
+class FileExporter:
+    def __init__(self, path: str):
+        self.path = path
+
+    def __repr__(self) -> str:
+        return f'FileExporter(path={repr(self.path)})'
+
+    def export(self, aggregator: Aggregator) -> None:
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(
+                {'time': time.time(), 'stats': aggregator.snapshot()}) + '\n')
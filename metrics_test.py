@@ -0,0 +1,95 @@
+from __future__ import annotations
+import json
+import lexer
+import metrics
+import os
+import parser
+import processor
+import regex
+import tempfile
+import unittest
+
+
+def lexer_() -> lexer.Lexer:
+    return lexer.Lexer(
+        {'a': regex.Regex(regex.Literal('a'))},
+        {'ws': regex.Regex(regex.Literal(' '))},
+    )
+
+
+def parser_() -> parser.Parser:
+    return parser.Parser({'root': processor.UntilEmpty(parser.Literal('a'))}, 'root')
+
+
+class HistogramTest(unittest.TestCase):
+    def test_quantile(self):
+        histogram = metrics.Histogram([1, 2, 4, 8])
+        for val in [0.5, 1.5, 1.5, 3, 100]:
+            histogram.add(val)
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.sum, 106.5)
+        self.assertEqual(histogram.quantile(0.2), 1)
+        self.assertEqual(histogram.quantile(0.5), 2)
+        self.assertEqual(histogram.quantile(0.8), 4)
+        self.assertEqual(histogram.quantile(1), float('inf'))
+
+    def test_quantile_empty(self):
+        self.assertEqual(metrics.Histogram().quantile(0.5), 0.0)
+
+
+class AggregatorTest(unittest.TestCase):
+    def test_lex_and_parse(self):
+        aggregator = metrics.Aggregator()
+        lexer__ = lexer_()
+        parser__ = parser_()
+        lexer__.metrics = aggregator
+        parser__.metrics = aggregator
+        for input in ['a a', 'aa']:
+            parser__.parse(lexer__.lex(input))
+        with self.assertRaises(processor.Error):
+            lexer__.lex('b')
+        lexer_stats = aggregator.stats['Lexer']
+        self.assertEqual(lexer_stats.calls, 3)
+        self.assertEqual(lexer_stats.errors, 1)
+        self.assertEqual(lexer_stats.input_size, 6)
+        self.assertEqual(lexer_stats.output_size, 4)
+        self.assertEqual(lexer_stats.latency.count, 3)
+        self.assertAlmostEqual(lexer_stats.error_rate, 1 / 3)
+        parser_stats = aggregator.stats['Parser']
+        self.assertEqual(parser_stats.calls, 2)
+        self.assertEqual(parser_stats.errors, 0)
+        self.assertEqual(parser_stats.input_size, 4)
+        self.assertEqual(parser_stats.output_size, 4)
+        self.assertGreater(parser_stats.input_rate, 0)
+
+    def test_no_metrics(self):
+        self.assertIsNone(lexer_().metrics)
+
+    def test_lexer_output_size_excludes_silent(self):
+        aggregator = metrics.Aggregator()
+        lexer__ = lexer_()
+        lexer__.metrics = aggregator
+        lexer__.lex('a  a ')
+        self.assertEqual(aggregator.stats['Lexer'].output_size, 2)
+
+
+class FileExporterTest(unittest.TestCase):
+    def test_export(self):
+        aggregator = metrics.Aggregator()
+        lexer__ = lexer_()
+        lexer__.metrics = aggregator
+        lexer__.lex('aa')
+        with tempfile.TemporaryDirectory() as dir:
+            path = os.path.join(dir, 'metrics.jsonl')
+            exporter = metrics.FileExporter(path)
+            exporter.export(aggregator)
+            exporter.export(aggregator)
+            with open(path) as file:
+                lines = [json.loads(line) for line in file]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['stats']['Lexer']['calls'], 1)
+        self.assertEqual(lines[0]['stats']['Lexer']['output_size'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
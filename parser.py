@@ -1,7 +1,8 @@
 from __future__ import annotations
 import processor
 import lexer
-from typing import NamedTuple, Optional, Sequence, Tuple
+import symbols
+from typing import cast, List, MutableMapping, NamedTuple, Optional, Sequence, Tuple
 
 
 class Input(NamedTuple):
@@ -18,10 +19,13 @@ class Input(NamedTuple):
 
 
 class Node:
-    def __init__(self, token: Optional[lexer.Token] = None, rule_name: Optional[str] = None, children: Optional[Tuple[Node, ...]] = None):
+    def __init__(self, token: Optional[lexer.Token] = None, rule_name: Optional[str] = None, children: Optional[Tuple[Node, ...]] = None, kind: Optional[int] = None, symbols_: Optional[symbols.Table] = None):
         self.token = token
         self.rule_name = rule_name
         self.children = children or ()
+        self.kind = kind
+        self.symbols = symbols_
+        self.size = (1 if token else 0) + sum(map(len, self.children))
 
     def __eq__(self, rhs: object) -> bool:
         return isinstance(rhs, self.__class__) and self.token == rhs.token and self.rule_name == rhs.rule_name and self.children == rhs.children
@@ -36,10 +40,10 @@ class Node:
         return f'\n{"  " * tabs}Node(token={self.token}, rule_name={repr(self.rule_name)}' + ''.join([child._repr(tabs+1) for child in self.children])
 
     def __len__(self) -> int:
-        return (1 if self.token else 0) + sum(map(len, self.children))
+        return self.size
 
-    def with_rule_name(self, rule_name: str) -> Node:
-        return Node(self.token, rule_name, self.children)
+    def with_rule_name(self, rule_name: str, kind: Optional[int] = None, symbols_: Optional[symbols.Table] = None) -> Node:
+        return Node(self.token, rule_name, self.children, kind, symbols_)
 
 
 Context = processor.Context[Input, Node]
@@ -47,8 +51,10 @@ Rule = processor.Rule[Input, Node]
 
 
 class Literal(Rule):
-    def __init__(self, val: str):
+    def __init__(self, val: str, kind: Optional[int] = None, symbols_: Optional[symbols.Table] = None):
         self.val = val
+        self.kind = kind
+        self.symbols = symbols_
 
     def __eq__(self, rhs: object) -> bool:
         return isinstance(rhs, self.__class__) and self.val == rhs.val
@@ -61,14 +67,37 @@ class Literal(Rule):
 
     def __call__(self, context: Context) -> Node:
         if not context.input.tokens:
+            if context.processor.partial:
+                raise processor.Incomplete()
             raise context.error(f'no input')
         tok = context.input.tokens[0]
-        if tok.rule_name != self.val:
+        if tok.kind != self.kind if self.symbols is not None and tok.symbols is self.symbols else tok.rule_name != self.val:
             raise context.error(f'failed to match {tok}')
         return Node(token=tok)
 
 
+def bind(rule: Rule, symbols_: symbols.Table) -> Rule:
+    if isinstance(rule, Literal):
+        return Literal(rule.val, symbols_.intern(rule.val), symbols_)
+    elif isinstance(rule, (processor.And, processor.Or)):
+        return rule.__class__(*[bind(child, symbols_) for child in rule.rules])
+    elif isinstance(rule, (processor.ZeroOrMore, processor.OneOrMore, processor.ZeroOrOne, processor.UntilEmpty)):
+        return rule.__class__(bind(rule.rule, symbols_))
+    return rule
+
+
 class Parser(processor.Processor[Input, Node]):
+    def __init__(self, rules: MutableMapping[str, Rule], root: str, symbols_: Optional[symbols.Table] = None):
+        self.symbols = symbols_ if symbols_ is not None else symbols.Table()
+        for rule_name in rules:
+            self.symbols.intern(rule_name)
+        super().__init__({rule_name: bind(rule, self.symbols) for rule_name, rule in rules.items()}, root)
+
+    def freeze(self) -> Parser:
+        for rule_name in self.rules:
+            self.symbols.intern(rule_name)
+        return cast(Parser, super().freeze())
+
     def advance(self, input: Input, output: Node) -> Input:
         return input.advance(output)
 
@@ -76,10 +105,20 @@ class Parser(processor.Processor[Input, Node]):
         return Node(children=tuple(outputs))
 
     def empty(self, input: Input) -> bool:
-        return input.empty()
+        if input.tokens:
+            return False
+        if self.partial:
+            raise processor.Incomplete()
+        return True
+
+    def input_size(self, input: Input) -> int:
+        return len(input.tokens)
+
+    def output_size(self, output: Node) -> int:
+        return len(output)
 
     def with_rule_name(self, output: Node, rule_name: str) -> Node:
-        return output.with_rule_name(rule_name)
+        return output.with_rule_name(rule_name, self.symbols.kind(rule_name), self.symbols)
 
     def aggregate_error_keys(self, context: Context, keys: Sequence[Input]) -> Input:
         return max(keys, key=Input.max_location)
@@ -89,3 +128,41 @@ class Parser(processor.Processor[Input, Node]):
 
     def parse(self, toks: Sequence[lexer.Token]) -> Node:
         return self.process(Input(toks))
+
+
+class Session:
+    def __init__(self, parser: Parser):
+        root = parser.rules[parser.root]
+        if not isinstance(root, processor.UntilEmpty):
+            raise processor.Error(f'session root {repr(parser.root)} must repeat until empty')
+        self.parser = parser
+        self.partial = parser.as_partial()
+        self.rule = root.rule
+        self.tokens: List[lexer.Token] = []
+        self.retry = 0
+
+    # An incomplete tail is only re-parsed once it has grown by half, so a
+    # node split across many small feeds costs O(n) rather than O(n**2).
+    def feed(self, tokens: Sequence[lexer.Token]) -> List[Node]:
+        self.tokens.extend(tokens)
+        if len(self.tokens) < self.retry:
+            return []
+        return self._parse(self.partial)
+
+    def close(self) -> List[Node]:
+        return self._parse(self.parser)
+
+    def _parse(self, parser: processor.Processor[Input, Node]) -> List[Node]:
+        context = Context(parser, Input(self.tokens))
+        nodes: List[Node] = []
+        self.retry = 0
+        try:
+            while context.input.tokens:
+                node = self.rule(context)
+                nodes.append(node)
+                context = context.advance(node)
+        except processor.Incomplete:
+            pending = len(context.input.tokens)
+            self.retry = pending + max(1, pending // 2)
+        self.tokens = list(context.input.tokens)
+        return nodes
@@ -1,8 +1,13 @@
 from __future__ import annotations
+import concurrent.futures
+import loader
 import parser
 import lexer
+import sys
 import unittest
+import unittest.mock
 import processor
+import symbols
 from typing import Optional
 
 import unittest.util
@@ -86,6 +91,34 @@ class LiteralTest(unittest.TestCase):
             parser.Node(token=token('a'))
         )
 
+    def test_call_kind(self):
+        table = symbols.Table(['a', 'b'])
+        kinded = lexer.Token('a', lexer.Location(0, 0), 'b', kind=0, symbols=table)
+        self.assertEqual(parser.Literal('a', 0, table)(context(kinded)), parser.Node(token=kinded))
+        with self.assertRaisesRegex(processor.Error, 'failed to match Token'):
+            parser.Literal('b', 1, table)(context(kinded))
+        with self.assertRaisesRegex(processor.Error, 'failed to match Token'):
+            parser.Literal('a', 0, table)(context(token('b')))
+
+    def test_call_kind_other_table(self):
+        table = symbols.Table(['a', 'b'])
+        other = symbols.Table(['b', 'a'])
+        a = lexer.Token('a', lexer.Location(0, 0), 'a', kind=0, symbols=table)
+        b = lexer.Token('b', lexer.Location(0, 0), 'b', kind=1, symbols=table)
+        with self.assertRaisesRegex(processor.Error, 'failed to match Token'):
+            parser.Literal('b', 0, other)(context(a))
+        self.assertEqual(parser.Literal('b', 0, other)(context(b)), parser.Node(token=b))
+
+
+class BindTest(unittest.TestCase):
+    def test_bind(self):
+        table = symbols.Table(['b'])
+        rule = parser.bind(processor.And(parser.Literal('a'), processor.ZeroOrMore(
+            parser.Literal('b')), processor.Ref('c')), table)
+        self.assertEqual(rule.rules[0].kind, 1)
+        self.assertEqual(rule.rules[1].rule.kind, 0)
+        self.assertEqual(rule.rules[2], processor.Ref('c'))
+
 
 class ParserTest(unittest.TestCase):
     def test_parse(self):
@@ -148,5 +181,77 @@ class ParserTest(unittest.TestCase):
                 )
 
 
+class SessionTest(unittest.TestCase):
+    parser_ = parser.Parser({
+        'root': processor.UntilEmpty(processor.Ref('pair')),
+        'pair': processor.And(parser.Literal('a'), processor.ZeroOrMore(parser.Literal('b'))),
+    }, 'root').freeze()
+
+    def test_feed(self):
+        session = parser.Session(self.parser_)
+        self.assertEqual(session.feed([token('a'), token('b')]), [])
+        self.assertEqual(session.feed([token('a')]),
+                         [output(rule_output('pair', token_output(token('a')), output(token_output(token('b')))))])
+        self.assertEqual(session.feed([]), [])
+        self.assertEqual(session.close(), [output(rule_output('pair', token_output(token('a')), output()))])
+
+    def test_matches_parse(self):
+        toks = [token(val) for val in 'abbaaba']
+        session = parser.Session(self.parser_)
+        nodes = []
+        for tok in toks:
+            nodes.extend(session.feed([tok]))
+        nodes.extend(session.close())
+        self.assertEqual(nodes, list(self.parser_.parse(toks).children))
+
+    def test_long_node(self):
+        toks = [token('a')] + [token('b')] * 5000 + [token('a')]
+        session = parser.Session(self.parser_)
+        nodes = []
+        with unittest.mock.patch.object(session, '_parse', wraps=session._parse) as parse:
+            for tok in toks:
+                nodes.extend(session.feed([tok]))
+            nodes.extend(session.close())
+        self.assertEqual(nodes, list(self.parser_.parse(toks).children))
+        self.assertLess(parse.call_count, 40)
+
+    def test_error(self):
+        with self.assertRaises(processor.Error):
+            parser.Session(self.parser_).feed([token('b')])
+
+    def test_root(self):
+        with self.assertRaisesRegex(processor.Error, 'must repeat until empty'):
+            parser.Session(parser.Parser({'root': parser.Literal('a')}, 'root'))
+
+
+class ConcurrencyTest(unittest.TestCase):
+    def test_shared_parses(self):
+        lexer_, parser_ = loader.load_lexer_and_parser(r'''
+            id = "[a-z]([a-z]|[0-9])*";
+            ws ~= " +";
+            prog -> stmt+;
+            stmt -> "id" "=" expr ";";
+            expr -> call | ref;
+            call -> "id" "\(\)";
+            ref -> "id";
+        ''')
+        self.assertTrue(lexer_.frozen)
+        self.assertTrue(parser_.frozen)
+
+        def parse(input: str) -> parser.Node:
+            return parser_.process(parser.Input(lexer_.lex(input)))
+        inputs = [f'a{i} = t(); b = a{i}; c{i % 7} = b;' for i in range(64)]
+        expected = {input: parse(input) for input in inputs}
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(16) as executor:
+                jobs = [inputs[i % len(inputs)] for i in range(2000)]
+                for input, node in zip(jobs, executor.map(parse, jobs)):
+                    self.assertEqual(node, expected[input])
+        finally:
+            sys.setswitchinterval(interval)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,9 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import Any, Generic, List, MutableMapping, NamedTuple, Optional, Sequence, TypeVar
+import copy
+import time
+import types
+from typing import Any, Generic, List, MutableMapping, NamedTuple, Optional, Sequence, Tuple, TypeVar
 
 
 TI = TypeVar('TI')
@@ -11,19 +14,37 @@ class Error(Exception):
     def __init__(self, msg: str, *inner_errors: Error):
         self.msg = msg
         self.inner_errors = inner_errors
-        super().__init__(repr(self))
+        super().__init__(msg)
 
     def __eq__(self, rhs: object)->bool:
-        return isinstance(rhs, self.__class__) and self.msg == rhs.msg and self.inner_errors == rhs.inner_errors
+        pairs: List[Tuple[Error, object]] = [(self, rhs)]
+        while pairs:
+            lhs, rhs = pairs.pop()
+            if lhs is rhs:
+                continue
+            if not isinstance(rhs, lhs.__class__) or lhs.msg != rhs.msg or len(lhs.inner_errors) != len(rhs.inner_errors):
+                return False
+            pairs.extend(zip(lhs.inner_errors, rhs.inner_errors))
+        return True
 
     def __hash__(self)->int:
-        return hash((self.msg, self.inner_errors))
+        return hash((self.msg, len(self.inner_errors)))
 
     def __repr__(self)->str:
-        return self._repr(0)
+        lines: List[str] = []
+        errors: List[Tuple[Error, int]] = [(self, 0)]
+        while errors:
+            error, tabs = errors.pop()
+            lines.append('\n%s%s' % ('  ' * tabs, error.msg))
+            errors.extend((inner_error, tabs + 1) for inner_error in reversed(error.inner_errors))
+        return ''.join(lines)
 
-    def _repr(self, tabs: int)->str:
-        return '\n%s%s%s' % ('  ' * tabs, self.msg, ''.join([error._repr(tabs+1) for error in self.inner_errors]))
+    def __str__(self)->str:
+        return repr(self)
+
+
+class Incomplete(Exception):
+    pass
 
 
 class Context(Generic[TI, TO]):
@@ -213,10 +234,105 @@ class UntilEmpty(Rule[TI, TO]):
         return context.aggregate(outputs)
 
 
+ENTER = 0
+EXIT = 1
+FAIL = 2
+
+
+class Event(NamedTuple):
+    kind: int
+    rule_name: str
+    pos: int
+
+
+class Tracer(ABC):
+    def __init__(self):
+        self.depth = 0
+        self.origin = 0
+
+    @abstractmethod
+    def event(self, event: Event) -> None: pass
+
+
+class Traced(Rule[TI, TO]):
+    def __init__(self, tracer: Tracer, rule_name: str, rule: Rule[TI, TO]):
+        self.tracer = tracer
+        self.rule_name = rule_name
+        self.rule = rule
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, self.__class__) and self.tracer is rhs.tracer and self.rule_name == rhs.rule_name and self.rule == rhs.rule
+
+    def __hash__(self) -> int:
+        return hash((self.rule_name, self.rule))
+
+    def __repr__(self) -> str:
+        return repr(self.rule)
+
+    def __call__(self, context: Context[TI, TO]) -> TO:
+        tracer = self.tracer
+        size = context.processor.input_size(context.input)
+        if tracer.depth == 0:
+            tracer.origin = size
+        tracer.event(Event(ENTER, self.rule_name, tracer.origin - size))
+        tracer.depth += 1
+        try:
+            output = self.rule(context)
+        except Error:
+            tracer.depth -= 1
+            tracer.event(Event(FAIL, self.rule_name, tracer.origin - size))
+            raise
+        tracer.depth -= 1
+        end = context.processor.input_size(context.advance(output).input)
+        tracer.event(Event(EXIT, self.rule_name, tracer.origin - end))
+        return output
+
+
+class Metrics(ABC):
+    @abstractmethod
+    def start(self, name: str, input_size: int) -> None: pass
+
+    @abstractmethod
+    def end(self, name: str, input_size: int, output_size: int, seconds: float) -> None: pass
+
+    @abstractmethod
+    def error(self, name: str, input_size: int, seconds: float) -> None: pass
+
+
 class Processor(Generic[TI, TO], ABC):
     def __init__(self, rules: MutableMapping[str, Rule[TI, TO]], root: str):
+        self.frozen = False
         self.rules = rules
         self.root = root
+        self.metrics: Optional[Metrics] = None
+        self.partial = False
+
+    def __setattr__(self, name: str, val: Any) -> None:
+        if getattr(self, 'frozen', False):
+            raise Error(f'frozen {self.__class__.__name__}')
+        super().__setattr__(name, val)
+
+    def _replace(self, **attrs: Any) -> Processor[TI, TO]:
+        replaced = copy.copy(self)
+        if self.frozen and 'rules' in attrs and not isinstance(attrs['rules'], types.MappingProxyType):
+            attrs['rules'] = types.MappingProxyType(dict(attrs['rules']))
+        replaced.__dict__.update(attrs)
+        return replaced
+
+    # A frozen processor can be shared between threads: its attributes and rule
+    # table are read-only, and subclasses freeze any processors their rules hold.
+    # Traced processors are not safe to share, since the tracer keeps per-run
+    # depth and origin state.
+    def freeze(self) -> Processor[TI, TO]:
+        if self.frozen:
+            return self
+        return self._replace(rules=types.MappingProxyType(dict(self.rules)), frozen=True)
+
+    def with_metrics(self, metrics: Optional[Metrics]) -> Processor[TI, TO]:
+        return self._replace(metrics=metrics)
+
+    def as_partial(self) -> Processor[TI, TO]:
+        return self._replace(partial=True)
 
     def __eq__(self, rhs: object) -> bool:
         return isinstance(rhs, self.__class__) and self.rules == rhs.rules and self.root == rhs.root
@@ -240,17 +356,46 @@ class Processor(Generic[TI, TO], ABC):
     def with_rule_name(self, output: TO, rule_name: str) -> TO:
         return output
 
+    def input_size(self, input: TI) -> int:
+        return 0
+
+    def output_size(self, output: TO) -> int:
+        return 0
+
     def error(self, context: Context[TI,TO], msg: str)->str:
         return msg
 
+    def rule(self, rule_name: str) -> Rule[TI, TO]:
+        return self.rules[rule_name]
+
     def apply_rule(self, rule_name: str, context: Context[TI, TO]) -> TO:
         if rule_name not in self.rules:
             raise context.error(f'unknown rule {repr(rule_name)}')
         try:
-            output = self.rules[rule_name](context)
+            output = self.rule(rule_name)(context)
         except Error as error:
             raise context.error(f'while applying rule {repr(rule_name)}', error)
         return self.with_rule_name(output, rule_name)
 
     def process(self, input: TI) -> TO:
-        return self.apply_rule(self.root, Context(self, input))
+        if self.metrics is None:
+            return self.apply_rule(self.root, Context(self, input))
+        return self._process_with_metrics(self.metrics, input)
+
+    def _process_with_metrics(self, metrics: Metrics, input: TI) -> TO:
+        name = self.__class__.__name__
+        input_size = self.input_size(input)
+        metrics.start(name, input_size)
+        start = time.perf_counter()
+        try:
+            output = self.apply_rule(self.root, Context(self, input))
+        except Error:
+            metrics.error(name, input_size, time.perf_counter() - start)
+            raise
+        metrics.end(name, input_size, self.output_size(output),
+                    time.perf_counter() - start)
+        return output
+
+    def traced(self, tracer: Tracer) -> Processor[TI, TO]:
+        return self._replace(rules={rule_name: Traced(tracer, rule_name, rule)
+                                    for rule_name, rule in self.rules.items()})
@@ -1,6 +1,6 @@
 from __future__ import annotations
 import processor
-from typing import MutableMapping, NamedTuple, Optional, Sequence, Tuple
+from typing import cast, List, MutableMapping, NamedTuple, Optional, Sequence, Tuple
 import unittest
 
 import unittest.util
@@ -286,6 +286,9 @@ class IntFilter(processor.Processor[Input, Output]):
     def with_rule_name(self, output: Output, rule_name: str) -> Output:
         return output.with_rule_name(rule_name)
 
+    def input_size(self, input: Input) -> int:
+        return len(input.vals)
+
     def aggregate_error_keys(self, context: processor.Context[Input, Output], keys: Sequence[Input]) -> Input:
         return max(keys, key=lambda key: key.vals)
 
@@ -314,6 +317,65 @@ class IntFilterTest(unittest.TestCase):
             Output((1,), rule_name='a')
         )
 
+    def test_freeze(self):
+        filter = IntFilter({'a': Equals(1)}, 'a')
+        frozen = filter.freeze()
+        self.assertIsNot(frozen, filter)
+        self.assertIs(frozen.freeze(), frozen)
+        self.assertFalse(filter.frozen)
+        self.assertEqual(frozen.process(Input((1,))), Output((1,), rule_name='a'))
+        with self.assertRaisesRegex(processor.Error, 'frozen IntFilter'):
+            frozen.root = 'b'
+        with self.assertRaises(TypeError):
+            frozen.rules['b'] = Equals(2)
+
+    def test_with_metrics(self):
+        frozen = IntFilter({'a': Equals(1)}, 'a').freeze()
+        metrics = cast(processor.Metrics, object())
+        with_metrics = frozen.with_metrics(metrics)
+        self.assertIs(with_metrics.metrics, metrics)
+        self.assertIsNone(frozen.metrics)
+        self.assertTrue(with_metrics.frozen)
+
+
+class Events(processor.Tracer):
+    def __init__(self):
+        super().__init__()
+        self.events: List[processor.Event] = []
+
+    def event(self, event: processor.Event) -> None:
+        self.events.append(event)
+
+
+class TracedTest(unittest.TestCase):
+    def test_process(self):
+        tracer = Events()
+        filter = IntFilter({
+            'a': processor.UntilEmpty(processor.Ref('b')),
+            'b': processor.Or(processor.Ref('c'), Equals(2)),
+            'c': Equals(1),
+        }, 'a')
+        traced = filter.traced(tracer)
+        self.assertEqual(traced.process(Input((1, 2))), filter.process(Input((1, 2))))
+        self.assertEqual(tracer.events, [
+            processor.Event(processor.ENTER, 'a', 0),
+            processor.Event(processor.ENTER, 'b', 0),
+            processor.Event(processor.ENTER, 'c', 0),
+            processor.Event(processor.EXIT, 'c', 1),
+            processor.Event(processor.EXIT, 'b', 1),
+            processor.Event(processor.ENTER, 'b', 1),
+            processor.Event(processor.ENTER, 'c', 1),
+            processor.Event(processor.FAIL, 'c', 1),
+            processor.Event(processor.EXIT, 'b', 2),
+            processor.Event(processor.EXIT, 'a', 2),
+        ])
+
+    def test_untraced(self):
+        rule = Equals(1)
+        filter = IntFilter({'a': rule}, 'a')
+        filter.traced(Events())
+        self.assertIs(filter.rules['a'], rule)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,37 +1,93 @@
 from __future__ import annotations
-from typing import MutableMapping, Optional
+import hamt
+import itertools
+import threading
+from typing import Dict, FrozenSet, Iterator, List, MutableMapping, NamedTuple, Optional, Sequence, Set, Tuple
 
 
 class Error(Exception):
     pass
 
 
+_type_ids = itertools.count()
+
+
 class Type:
     def __init__(self, name: str, parent: Optional[Type] = None):
         self.name = name
         self.parent = parent
         self.scope = Scope()
+        self.id = next(_type_ids)
+        self.ancestors: FrozenSet[int] = frozenset(
+            [self.id]) | (parent.ancestors if parent else frozenset())
+        self.shape = Shape()
 
     def __eq__(self, rhs: object) -> bool:
-        return isinstance(rhs, self.__class__) and self.name == rhs.name and self.parent == rhs.parent and self.scope == rhs.scope
+        return self is rhs
 
     def __hash__(self) -> int:
-        return hash((self.name, self.parent, self.scope))
+        return self.id
 
     def __repr__(self) -> str:
         return f'Type(name={self.name}, parent={self.parent}, scope={self.scope})'
 
+    def structurally_equal(self, rhs: object) -> bool:
+        return self._structurally_equal(rhs, set())
+
+    def _structurally_equal(self, rhs: object, seen: Set[Tuple[int, int]]) -> bool:
+        if not isinstance(rhs, Type):
+            return False
+        if self is rhs or (id(self), id(rhs)) in seen:
+            return True
+        seen.add((id(self), id(rhs)))
+        if self.name != rhs.name or (self.parent is None) != (rhs.parent is None):
+            return False
+        if self.parent is not None and not self.parent._structurally_equal(rhs.parent, seen):
+            return False
+        lhs_vars = self.scope.vars
+        rhs_vars = rhs.scope.vars
+        return lhs_vars.keys() == rhs_vars.keys() and all(
+            lhs_vars[name].type._structurally_equal(rhs_vars[name].type, seen) and
+            lhs_vars[name].val._structurally_equal(rhs_vars[name].val, seen)
+            for name in lhs_vars)
+
     def compatible_with(self, type: Type) -> bool:
-        return self == type or (self.parent.compatible_with(type) if self.parent else False)
+        return type.id in self.ancestors
+
+
+class TypeTable:
+    def __init__(self, max_size: Optional[int] = None):
+        self.types: Dict[Tuple[str, Optional[int]], Type] = {}
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f'TypeTable({[type.name for type in self.types.values()]})'
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def intern(self, name: str, parent: Optional[Type] = None) -> Type:
+        key = (name, parent.id if parent else None)
+        type = self.types.get(key)
+        if type is None:
+            with self.lock:
+                type = self.types.get(key)
+                if type is None:
+                    if self.max_size is not None and len(self.types) >= self.max_size:
+                        raise Error(f'type table full at {self.max_size} types')
+                    type = self.types[key] = Type(name, parent)
+        return type
 
 
 class Var:
     def __init__(self, type: Type, val: Val):
         self.type = type
         self.val = val
+        self._compatible = type
 
     def __eq__(self, rhs: object) -> bool:
-        return isinstance(rhs, self.__class__) and self.type == rhs.type and self.val == rhs.val
+        return isinstance(rhs, Var) and self.type == rhs.type and self.val == rhs.val
 
     def __hash__(self) -> int:
         return hash((self.type, self.val))
@@ -40,29 +96,120 @@ class Var:
         return f'Var(type={self.type}, val={self.val})'
 
     def set(self, val):
-        if not val.type.compatible_with(self.type):
-            raise Error(f'val {val} incompatible with var {self}')
+        if val.type is not self._compatible:
+            if not val.type.compatible_with(self.type):
+                raise Error(f'val {val} incompatible with var {self}')
+            self._compatible = val.type
         self.val = val
 
 
+class Shape:
+    def __init__(self, names: Tuple[str, ...] = (), types: Tuple[Type, ...] = ()):
+        self.names = names
+        self.types = types
+        self.indices: Dict[str, int] = {name: i for i, name in enumerate(names)}
+        self.transitions: Dict[Tuple[str, int], Shape] = {}
+
+    def __repr__(self) -> str:
+        return f'Shape(names={self.names})'
+
+    def add(self, name: str, type: Type) -> Shape:
+        key = (name, type.id)
+        shape = self.transitions.get(key)
+        if shape is None:
+            shape = self.transitions[key] = Shape(
+                self.names + (name,), self.types + (type,))
+        return shape
+
+
 class Val:
     def __init__(self, type: Type):
         self.type = type
-        self.scope = Scope()
+        self.shape = type.shape
+        self.slots: List[Val] = []
+        self._scope: Optional[ShapeScope] = None
+
+    @property
+    def scope(self) -> Scope:
+        if self._scope is None:
+            self._scope = ShapeScope(self)
+        return self._scope
 
     def __eq__(self, rhs: object) -> bool:
-        return isinstance(rhs, self.__class__) and self.type == rhs.type and self.scope == rhs.scope
+        return self is rhs
 
     def __hash__(self) -> int:
-        return hash((self.type, self.scope))
+        return id(self)
+
+    def __repr__(self) -> str:
+        return f'Val(type={self.type.name}, attrs={list(self.shape.names)})'
+
+    def structurally_equal(self, rhs: object) -> bool:
+        return self._structurally_equal(rhs, set())
+
+    def _structurally_equal(self, rhs: object, seen: Set[Tuple[int, int]]) -> bool:
+        if not isinstance(rhs, self.__class__):
+            return False
+        if self is rhs or (id(self), id(rhs)) in seen:
+            return True
+        seen.add((id(self), id(rhs)))
+        return self.type._structurally_equal(rhs.type, seen) and self.shape.names == rhs.shape.names and all(
+            lhs_type._structurally_equal(rhs_type, seen) and lhs_val._structurally_equal(rhs_val, seen)
+            for lhs_type, rhs_type, lhs_val, rhs_val in zip(self.shape.types, rhs.shape.types, self.slots, rhs.slots))
+
+    def get_attr(self, name: str) -> Val:
+        index = self.shape.indices.get(name)
+        if index is None:
+            raise Error(f'unknown var {repr(name)}')
+        return self.slots[index]
+
+    def set_attr(self, name: str, val: Val):
+        index = self.shape.indices.get(name)
+        if index is None:
+            self.shape = self.shape.add(name, val.type)
+            self.slots.append(val)
+        else:
+            self._set_slot(index, val)
+
+    def _set_slot(self, index: int, val: Val):
+        type = self.shape.types[index]
+        if val.type is not type and not val.type.compatible_with(type):
+            raise Error(f'val {val} incompatible with var {Var(type, self.slots[index])}')
+        self.slots[index] = val
+
+
+class AttrCache:
+    def __init__(self, name: str):
+        self.name = name
+        self.shape: Optional[Shape] = None
+        self.index = -1
 
     def __repr__(self) -> str:
-        return f'Var(type={self.type}, scope={self.scope})'
+        return f'AttrCache(name={repr(self.name)})'
+
+    def _lookup(self, val: Val) -> bool:
+        index = val.shape.indices.get(self.name)
+        if index is None:
+            return False
+        self.shape = val.shape
+        self.index = index
+        return True
+
+    def get(self, val: Val) -> Val:
+        if val.shape is not self.shape and not self._lookup(val):
+            raise Error(f'unknown var {repr(self.name)}')
+        return val.slots[self.index]
+
+    def set(self, val: Val, attr: Val):
+        if val.shape is self.shape or self._lookup(val):
+            val._set_slot(self.index, attr)
+        else:
+            val.set_attr(self.name, attr)
 
 
 class Scope:
-    def __init__(self, parent: Optional[Scope] = None):
-        self.vars: MutableMapping[str, Var] = {}
+    def __init__(self, parent: Optional[Scope] = None, vars: Optional[MutableMapping[str, Var]] = None):
+        self.vars: MutableMapping[str, Var] = vars if vars is not None else {}
         self.parent = parent
 
     def __eq__(self, rhs: object) -> bool:
@@ -78,15 +225,296 @@ class Scope:
         return key in self.vars or (key in self.parent if self.parent else False)
 
     def __getitem__(self, key: str) -> Val:
-        if key in self.vars:
-            return self.vars[key].val
+        var = self.vars.get(key)
+        if var is not None:
+            return var.val
         elif self.parent:
             return self.parent[key]
         else:
             raise Error(f'unknown var {repr(key)}')
 
     def __setitem__(self, key: str, val: Val):
-        if key not in self.vars:
+        var = self.vars.get(key)
+        if var is None:
             self.vars[key] = Var(val.type, val)
         else:
-            self.vars[key].set(val)
+            var.set(val)
+
+
+class _BoundVar(Var):
+    def __init__(self, scope: Scope, name: str, type: Type, val: Val):
+        super().__init__(type, val)
+        self.scope = scope
+        self.name = name
+
+    def set(self, val):
+        self.scope[self.name] = val
+        self.val = val
+
+
+class _Vars(MutableMapping[str, Var]):
+    def __init__(self, scope: _VarsScope):
+        self.scope = scope
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    def __getitem__(self, name: str) -> Var:
+        entry = self.scope._get_var(name)
+        if entry is None:
+            raise KeyError(name)
+        return _BoundVar(self.scope, name, *entry)
+
+    def __setitem__(self, name: str, var: Var) -> None:
+        self.scope._put_var(name, var.type, var.val)
+
+    def __delitem__(self, name: str) -> None:
+        if self.scope._get_var(name) is None:
+            raise KeyError(name)
+        self.scope._del_var(name)
+
+    def __iter__(self) -> Iterator[str]:
+        return self.scope._names()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.scope._names())
+
+
+class _VarsScope(Scope):
+    def _get_var(self, name: str) -> Optional[Tuple[Type, Val]]:
+        raise NotImplementedError()
+
+    def _put_var(self, name: str, type: Type, val: Val) -> None:
+        raise NotImplementedError()
+
+    def _del_var(self, name: str) -> None:
+        raise Error(f'cannot delete var {repr(name)}')
+
+    def _names(self) -> Iterator[str]:
+        raise NotImplementedError()
+
+
+class Slot(NamedTuple):
+    depth: int
+    index: int
+
+
+class Layout:
+    def __init__(self, names: Sequence[str] = (), parent: Optional[Layout] = None):
+        self.names: List[str] = []
+        self.indices: Dict[str, int] = {}
+        self.parent = parent
+        self.frozen = False
+        for name in names:
+            self.declare(name)
+
+    def __repr__(self) -> str:
+        return f'Layout(names={self.names}, parent={repr(self.parent)})'
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def declare(self, name: str) -> int:
+        if name not in self.indices:
+            if self.frozen:
+                raise Error(f'frozen layout cannot declare {repr(name)}')
+            self.indices[name] = len(self.names)
+            self.names.append(name)
+        return self.indices[name]
+
+    def freeze(self) -> Layout:
+        self.frozen = True
+        return self
+
+    def resolve(self, name: str) -> Optional[Slot]:
+        layout: Optional[Layout] = self
+        depth = 0
+        while layout is not None:
+            index = layout.indices.get(name)
+            if index is not None:
+                return Slot(depth, index)
+            layout = layout.parent
+            depth += 1
+        return None
+
+
+class FrameScope(_VarsScope):
+    def __init__(self, layout: Layout, parent: Optional[Scope] = None):
+        super().__init__(parent, _Vars(self))
+        self.layout = layout
+        self.owns_layout = False
+        size = len(layout.names)
+        self.vals: List[Optional[Val]] = [None] * size
+        self.types: List[Optional[Type]] = [None] * size
+        self.frames: Tuple[FrameScope, ...] = (
+            self,) + (parent.frames if isinstance(parent, FrameScope) else ())
+
+    def _get_var(self, name: str) -> Optional[Tuple[Type, Val]]:
+        index = self.layout.indices.get(name)
+        if index is None or index >= len(self.vals):
+            return None
+        type, val = self.types[index], self.vals[index]
+        return None if type is None or val is None else (type, val)
+
+    def _put_var(self, name: str, type: Type, val: Val) -> None:
+        index = self._declare(name)
+        self._grow()
+        self.types[index] = type
+        self.vals[index] = val
+
+    def _del_var(self, name: str) -> None:
+        index = self.layout.indices[name]
+        self.types[index] = None
+        self.vals[index] = None
+
+    def _names(self) -> Iterator[str]:
+        return (name for name, type, val in zip(self.layout.names, self.types, self.vals)
+                if type is not None and val is not None)
+
+    def __contains__(self, key: str) -> bool:
+        index = self.layout.indices.get(key)
+        if index is not None and index < len(self.vals) and self.vals[index] is not None:
+            return True
+        return key in self.parent if self.parent else False
+
+    def __getitem__(self, key: str) -> Val:
+        index = self.layout.indices.get(key)
+        if index is not None and index < len(self.vals):
+            val = self.vals[index]
+            if val is not None:
+                return val
+        if self.parent:
+            return self.parent[key]
+        raise Error(f'unknown var {repr(key)}')
+
+    def __setitem__(self, key: str, val: Val):
+        self._set(self._declare(key), val)
+
+    def _declare(self, key: str) -> int:
+        index = self.layout.indices.get(key)
+        if index is not None:
+            return index
+        if self.layout.frozen:
+            raise Error(f'frozen layout cannot declare {repr(key)}')
+        if not self.owns_layout:
+            self.layout = Layout(self.layout.names, self.layout.parent)
+            self.owns_layout = True
+        return self.layout.declare(key)
+
+    def _grow(self) -> None:
+        grow = len(self.layout) - len(self.vals)
+        if grow > 0:
+            self.vals.extend([None] * grow)
+            self.types.extend([None] * grow)
+
+    def _set(self, index: int, val: Val):
+        if index >= len(self.vals):
+            self._grow()
+        type = self.types[index]
+        if type is None:
+            self.types[index] = val.type
+        elif val.type is not type and not val.type.compatible_with(type):
+            raise Error(f'val {val} incompatible with var {Var(type, self.vals[index])}')
+        self.vals[index] = val
+
+    def _frame(self, slot: Slot) -> FrameScope:
+        if not 0 <= slot.depth < len(self.frames):
+            raise Error(f'invalid slot {slot}')
+        return self.frames[slot.depth]
+
+    def get(self, slot: Slot) -> Val:
+        frame = self._frame(slot)
+        if slot.index < len(frame.vals):
+            val = frame.vals[slot.index]
+            if val is not None:
+                return val
+        if slot.index >= len(frame.layout):
+            raise Error(f'invalid slot {slot}')
+        raise Error(f'unknown var {repr(frame.layout.names[slot.index])}')
+
+    def set(self, slot: Slot, val: Val):
+        frame = self._frame(slot)
+        if slot.index >= len(frame.layout):
+            raise Error(f'invalid slot {slot}')
+        frame._set(slot.index, val)
+
+
+class ShapeScope(_VarsScope):
+    def __init__(self, val: Val):
+        super().__init__(None, _Vars(self))
+        self.val = val
+
+    def _get_var(self, name: str) -> Optional[Tuple[Type, Val]]:
+        index = self.val.shape.indices.get(name)
+        return None if index is None else (self.val.shape.types[index], self.val.slots[index])
+
+    def _put_var(self, name: str, type: Type, val: Val) -> None:
+        index = self.val.shape.indices.get(name)
+        if index is not None:
+            self.val._set_slot(index, val)
+        elif val.type is not type and not val.type.compatible_with(type):
+            raise Error(f'val {val} incompatible with var {Var(type, val)}')
+        else:
+            self.val.shape = self.val.shape.add(name, type)
+            self.val.slots.append(val)
+
+    def _names(self) -> Iterator[str]:
+        return iter(self.val.shape.names)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.val.shape.indices
+
+    def __getitem__(self, key: str) -> Val:
+        return self.val.get_attr(key)
+
+    def __setitem__(self, key: str, val: Val):
+        self.val.set_attr(key, val)
+
+
+class PersistentScope(_VarsScope):
+    def __init__(self, parent: Optional[Scope] = None,
+                 entries: Optional[hamt.Map[str, Tuple[Type, Val]]] = None):
+        super().__init__(parent, _Vars(self))
+        self.entries: hamt.Map[str, Tuple[Type, Val]] = entries if entries is not None else hamt.Map()
+
+    def _get_var(self, name: str) -> Optional[Tuple[Type, Val]]:
+        return self.entries.get(name)
+
+    def _put_var(self, name: str, type: Type, val: Val) -> None:
+        entry = self.entries.get(name)
+        if entry is not None:
+            type = entry[0]
+        if val.type is not type and not val.type.compatible_with(type):
+            raise Error(f'val {val} incompatible with var {Var(type, val)}')
+        self.entries = self.entries.set(name, (type, val))
+
+    def _names(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries or (key in self.parent if self.parent else False)
+
+    def __getitem__(self, key: str) -> Val:
+        entry = self.entries.get(key)
+        if entry is not None:
+            return entry[1]
+        elif self.parent:
+            return self.parent[key]
+        else:
+            raise Error(f'unknown var {repr(key)}')
+
+    def __setitem__(self, key: str, val: Val):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.entries = self.entries.set(key, (val.type, val))
+        else:
+            type = entry[0]
+            if val.type is not type and not val.type.compatible_with(type):
+                raise Error(f'val {val} incompatible with var {Var(type, entry[1])}')
+            self.entries = self.entries.set(key, (type, val))
+
+    def snapshot(self) -> PersistentScope:
+        return PersistentScope(self.parent, self.entries)
+
+    def fork(self) -> PersistentScope:
+        return self.snapshot()
@@ -1,6 +1,457 @@
 from __future__ import annotations
 import pysh
+import threading
+from typing import List
 import unittest
 
+
+class TypeTest(unittest.TestCase):
+    def test_compatible_with(self):
+        t = pysh.Type('t')
+        u = pysh.Type('u', t)
+        v = pysh.Type('v', u)
+        w = pysh.Type('w', t)
+        self.assertTrue(t.compatible_with(t))
+        self.assertTrue(u.compatible_with(t))
+        self.assertTrue(v.compatible_with(t))
+        self.assertTrue(v.compatible_with(u))
+        self.assertFalse(t.compatible_with(u))
+        self.assertFalse(v.compatible_with(w))
+        self.assertFalse(w.compatible_with(u))
+
+    def test_compatible_with_identity(self):
+        self.assertFalse(pysh.Type('t').compatible_with(pysh.Type('t')))
+
+    def test_eq(self):
+        t = pysh.Type('t')
+        self.assertEqual(t, t)
+        self.assertNotEqual(pysh.Type('t'), pysh.Type('t'))
+        self.assertEqual({t: 1}[t], 1)
+
+    def test_structurally_equal(self):
+        t = pysh.Type('t')
+        self.assertTrue(pysh.Type('t').structurally_equal(pysh.Type('t')))
+        self.assertTrue(pysh.Type('u', t).structurally_equal(pysh.Type('u', pysh.Type('t'))))
+        self.assertFalse(pysh.Type('t').structurally_equal(pysh.Type('u')))
+        self.assertFalse(pysh.Type('u', t).structurally_equal(pysh.Type('u')))
+
+    def test_structurally_equal_scope(self):
+        def type(*names: str) -> pysh.Type:
+            type = pysh.Type('t')
+            for name in names:
+                type.scope[name] = pysh.Val(type)
+            return type
+        self.assertTrue(type('a').structurally_equal(type('a')))
+        self.assertFalse(type('a').structurally_equal(type('b')))
+        self.assertFalse(type('a').structurally_equal(type('a', 'b')))
+        lhs = type('a')
+        rhs = type('a')
+        rhs.scope['a'].set_attr('x', pysh.Val(rhs))
+        self.assertFalse(lhs.structurally_equal(rhs))
+        lhs.scope['a'].set_attr('x', pysh.Val(lhs))
+        self.assertTrue(lhs.structurally_equal(rhs))
+
+    def test_intern(self):
+        types = pysh.TypeTable()
+        t = types.intern('t')
+        self.assertIs(types.intern('t'), t)
+        self.assertIs(types.intern('u', t), types.intern('u', t))
+        self.assertIsNot(types.intern('u', t), types.intern('u'))
+        self.assertIsNot(pysh.TypeTable().intern('t'), t)
+        self.assertEqual(len(types), 3)
+
+    def test_intern_max_size(self):
+        types = pysh.TypeTable(1)
+        t = types.intern('t')
+        self.assertIs(types.intern('t'), t)
+        with self.assertRaisesRegex(pysh.Error, 'type table full'):
+            types.intern('u')
+
+    def test_intern_threads(self):
+        types = pysh.TypeTable()
+        results: List[pysh.Type] = []
+        threads = [threading.Thread(target=lambda: results.extend(
+            types.intern(f't{i}') for i in range(100))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(types), 100)
+        for i, type in enumerate(results):
+            self.assertIs(type, types.intern(f't{i % 100}'))
+
+
+class VarTest(unittest.TestCase):
+    def test_set(self):
+        t = pysh.Type('t')
+        u = pysh.Type('u', t)
+        var = pysh.Var(t, pysh.Val(t))
+        for _ in range(2):
+            val = pysh.Val(u)
+            var.set(val)
+            self.assertIs(var.val, val)
+        with self.assertRaisesRegex(pysh.Error, 'incompatible'):
+            var.set(pysh.Val(pysh.Type('v')))
+
+
+class ScopeTest(unittest.TestCase):
+    def test_get_set(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        parent = pysh.Scope()
+        parent['a'] = a
+        scope = pysh.Scope(parent)
+        self.assertIn('a', scope)
+        self.assertNotIn('b', scope)
+        self.assertIs(scope['a'], a)
+        with self.assertRaisesRegex(pysh.Error, "unknown var 'b'"):
+            scope['b']
+
+    def test_set_incompatible(self):
+        scope = pysh.Scope()
+        scope['a'] = pysh.Val(pysh.Type('t'))
+        with self.assertRaisesRegex(pysh.Error, 'incompatible'):
+            scope['a'] = pysh.Val(pysh.Type('u'))
+
+
+class LayoutTest(unittest.TestCase):
+    def test_resolve(self):
+        outer = pysh.Layout(['a', 'b'])
+        inner = pysh.Layout(['c', 'a'], outer)
+        self.assertEqual(inner.resolve('a'), pysh.Slot(0, 1))
+        self.assertEqual(inner.resolve('b'), pysh.Slot(1, 1))
+        self.assertEqual(inner.resolve('c'), pysh.Slot(0, 0))
+        self.assertIsNone(inner.resolve('d'))
+
+    def test_declare(self):
+        layout = pysh.Layout(['a'])
+        self.assertEqual(layout.declare('a'), 0)
+        self.assertEqual(layout.declare('b'), 1)
+        self.assertEqual(layout.names, ['a', 'b'])
+
+
+class FrameScopeTest(unittest.TestCase):
+    def test_slots(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        b = pysh.Val(t)
+        outer_layout = pysh.Layout(['a'])
+        inner_layout = pysh.Layout(['b'], outer_layout)
+        outer = pysh.FrameScope(outer_layout)
+        inner = pysh.FrameScope(inner_layout, outer)
+        inner.set(inner_layout.resolve('a'), a)
+        inner.set(inner_layout.resolve('b'), b)
+        self.assertIs(outer['a'], a)
+        self.assertIs(inner['a'], a)
+        self.assertIs(inner['b'], b)
+        self.assertNotIn('b', outer)
+        self.assertIs(inner.get(pysh.Slot(1, 0)), a)
+        self.assertIs(inner.get(pysh.Slot(0, 0)), b)
+
+    def test_unset_slot(self):
+        scope = pysh.FrameScope(pysh.Layout(['a']))
+        self.assertNotIn('a', scope)
+        with self.assertRaisesRegex(pysh.Error, "unknown var 'a'"):
+            scope.get(pysh.Slot(0, 0))
+
+    def test_dynamic(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        parent = pysh.Scope()
+        parent['g'] = a
+        scope = pysh.FrameScope(pysh.Layout(), parent)
+        scope['x'] = a
+        self.assertIs(scope['x'], a)
+        self.assertIs(scope['g'], a)
+        self.assertEqual(scope.layout.names, ['x'])
+        self.assertEqual(scope.vars, {'x': pysh.Var(t, a)})
+        with self.assertRaisesRegex(pysh.Error, "unknown var 'y'"):
+            scope['y']
+
+    def test_set_incompatible(self):
+        scope = pysh.FrameScope(pysh.Layout(['a']))
+        scope.set(pysh.Slot(0, 0), pysh.Val(pysh.Type('t')))
+        with self.assertRaisesRegex(pysh.Error, 'incompatible'):
+            scope.set(pysh.Slot(0, 0), pysh.Val(pysh.Type('u')))
+
+    def test_set_subtype(self):
+        t = pysh.Type('t')
+        u = pysh.Type('u', t)
+        scope = pysh.FrameScope(pysh.Layout(['a']))
+        scope['a'] = pysh.Val(t)
+        b = pysh.Val(u)
+        scope['a'] = b
+        self.assertIs(scope['a'], b)
+
+    def test_vars_write_through(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        b = pysh.Val(t)
+        layout = pysh.Layout(['a'])
+        scope = pysh.FrameScope(layout)
+        scope.vars['a'] = pysh.Var(t, a)
+        self.assertIs(scope.get(pysh.Slot(0, 0)), a)
+        scope.vars['a'].set(b)
+        self.assertIs(scope['a'], b)
+        with self.assertRaisesRegex(pysh.Error, 'incompatible'):
+            scope.vars['a'].set(pysh.Val(pysh.Type('u')))
+        del scope.vars['a']
+        self.assertNotIn('a', scope)
+
+    def test_invalid_depth(self):
+        scope = pysh.FrameScope(pysh.Layout(['a']), pysh.Scope())
+        with self.assertRaisesRegex(pysh.Error, 'invalid slot'):
+            scope.get(pysh.Slot(1, 0))
+        with self.assertRaisesRegex(pysh.Error, 'invalid slot'):
+            scope.set(pysh.Slot(1, 0), pysh.Val(pysh.Type('t')))
+
+    def test_dynamic_copies_layout(self):
+        t = pysh.Type('t')
+        layout = pysh.Layout(['a'])
+        lhs = pysh.FrameScope(layout)
+        rhs = pysh.FrameScope(layout)
+        lhs['x'] = pysh.Val(t)
+        self.assertEqual(layout.names, ['a'])
+        self.assertEqual(lhs.layout.names, ['a', 'x'])
+        self.assertNotIn('x', rhs)
+        rhs['x'] = pysh.Val(t)
+        self.assertEqual(rhs.layout.names, ['a', 'x'])
+
+    def test_frozen_layout(self):
+        scope = pysh.FrameScope(pysh.Layout(['a']).freeze())
+        with self.assertRaisesRegex(pysh.Error, "frozen layout cannot declare 'x'"):
+            scope['x'] = pysh.Val(pysh.Type('t'))
+
+    def test_parent(self):
+        parent = pysh.Scope()
+        scope = pysh.FrameScope(pysh.Layout(), parent)
+        self.assertIs(scope.parent, parent)
+        self.assertEqual(scope.vars, {})
+
+
+class ValTest(unittest.TestCase):
+    def test_attrs(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        b = pysh.Val(t)
+        a.set_attr('x', b)
+        self.assertIs(a.get_attr('x'), b)
+        self.assertIs(a.scope['x'], b)
+        self.assertIn('x', a.scope)
+        self.assertNotIn('y', a.scope)
+        self.assertEqual(a.scope.vars, {'x': pysh.Var(t, b)})
+        with self.assertRaisesRegex(pysh.Error, "unknown var 'y'"):
+            a.get_attr('y')
+
+    def test_scope_set(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        b = pysh.Val(t)
+        a.scope['x'] = b
+        self.assertIs(a.get_attr('x'), b)
+        with self.assertRaisesRegex(pysh.Error, 'incompatible'):
+            a.scope['x'] = pysh.Val(pysh.Type('u'))
+
+    def test_scope_cached(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        self.assertIs(a.scope, a.scope)
+        self.assertIsNot(a.scope, pysh.Val(t).scope)
+
+    def test_scope_vars_write_through(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        b = pysh.Val(t)
+        c = pysh.Val(t)
+        a.scope.vars['x'] = pysh.Var(t, b)
+        self.assertIs(a.get_attr('x'), b)
+        a.scope.vars['x'].set(c)
+        self.assertIs(a.get_attr('x'), c)
+        with self.assertRaisesRegex(pysh.Error, 'incompatible'):
+            a.scope.vars['x'] = pysh.Var(t, pysh.Val(pysh.Type('u')))
+        with self.assertRaisesRegex(pysh.Error, "cannot delete var 'x'"):
+            del a.scope.vars['x']
+        self.assertEqual(list(a.scope.vars), ['x'])
+
+    def test_shared_shape(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        b = pysh.Val(t)
+        self.assertIs(a.shape, b.shape)
+        a.set_attr('x', a)
+        b.set_attr('x', b)
+        self.assertIs(a.shape, b.shape)
+        self.assertIsNot(a.shape, t.shape)
+        a.set_attr('y', a)
+        self.assertIsNot(a.shape, b.shape)
+
+    def test_eq(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        self.assertEqual(a, a)
+        self.assertNotEqual(a, pysh.Val(t))
+        self.assertEqual({a: 1}[a], 1)
+
+    def test_structurally_equal(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        b = pysh.Val(t)
+        self.assertTrue(a.structurally_equal(b))
+        a.set_attr('x', a)
+        self.assertFalse(a.structurally_equal(b))
+        b.set_attr('x', b)
+        self.assertTrue(a.structurally_equal(b))
+        self.assertFalse(a.structurally_equal(pysh.Val(pysh.Type('u'))))
+        self.assertEqual(repr(a), "Val(type=t, attrs=['x'])")
+
+
+class AttrCacheTest(unittest.TestCase):
+    def test_get(self):
+        t = pysh.Type('t')
+        vals = [pysh.Val(t) for _ in range(3)]
+        for val in vals:
+            val.set_attr('x', val)
+        cache = pysh.AttrCache('x')
+        for val in vals:
+            self.assertIs(cache.get(val), val)
+        self.assertIs(cache.shape, vals[0].shape)
+        other = pysh.Val(t)
+        other.set_attr('y', other)
+        other.set_attr('x', vals[0])
+        self.assertIs(cache.get(other), vals[0])
+        self.assertEqual(cache.index, 1)
+        with self.assertRaisesRegex(pysh.Error, "unknown var 'x'"):
+            cache.get(pysh.Val(t))
+
+    def test_set(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        b = pysh.Val(t)
+        cache = pysh.AttrCache('x')
+        cache.set(a, b)
+        cache.set(a, b)
+        self.assertIs(a.get_attr('x'), b)
+        with self.assertRaisesRegex(pysh.Error, 'incompatible'):
+            cache.set(a, pysh.Val(pysh.Type('u')))
+
+
+class PersistentScopeTest(unittest.TestCase):
+    def test_get_set(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        parent = pysh.PersistentScope()
+        parent['a'] = a
+        scope = pysh.PersistentScope(parent)
+        self.assertIn('a', scope)
+        self.assertNotIn('b', scope)
+        self.assertIs(scope['a'], a)
+        self.assertEqual(parent.vars, {'a': pysh.Var(t, a)})
+        with self.assertRaisesRegex(pysh.Error, "unknown var 'b'"):
+            scope['b']
+        with self.assertRaisesRegex(pysh.Error, 'incompatible'):
+            parent['a'] = pysh.Val(pysh.Type('u'))
+
+    def test_snapshot(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        b = pysh.Val(t)
+        scope = pysh.PersistentScope()
+        scope['a'] = a
+        snapshot = scope.snapshot()
+        scope['a'] = b
+        scope['c'] = b
+        self.assertIs(snapshot['a'], a)
+        self.assertNotIn('c', snapshot)
+        self.assertIs(scope['a'], b)
+
+    def test_fork(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        b = pysh.Val(t)
+        globals = pysh.PersistentScope()
+        globals['g'] = a
+        lhs = globals.fork()
+        rhs = globals.fork()
+        lhs['x'] = a
+        rhs['x'] = b
+        globals['g'] = b
+        self.assertIs(lhs['x'], a)
+        self.assertIs(rhs['x'], b)
+        self.assertIs(lhs['g'], a)
+        self.assertIs(rhs['g'], a)
+        self.assertNotIn('x', globals)
+
+    def test_fork_incompatible(self):
+        globals = pysh.PersistentScope()
+        globals['g'] = pysh.Val(pysh.Type('t'))
+        fork = globals.fork()
+        with self.assertRaisesRegex(pysh.Error, 'incompatible'):
+            fork['g'] = pysh.Val(pysh.Type('u'))
+
+    def test_snapshot_child(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        b = pysh.Val(t)
+        parent = pysh.PersistentScope()
+        parent['g'] = a
+        scope = pysh.PersistentScope(parent)
+        scope['x'] = a
+        snapshot = scope.snapshot()
+        scope['x'] = b
+        scope['y'] = b
+        self.assertIs(snapshot['x'], a)
+        self.assertNotIn('y', snapshot)
+        self.assertIs(snapshot.parent, parent)
+        parent['g'] = b
+        self.assertIs(snapshot['g'], b)
+
+    def test_parent_write_after_child(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        for parent in [pysh.PersistentScope(), pysh.Scope()]:
+            with self.subTest(parent=parent.__class__.__name__):
+                scope = pysh.PersistentScope(parent)
+                self.assertNotIn('f', scope)
+                parent['f'] = a
+                self.assertIn('f', scope)
+                self.assertIs(scope['f'], a)
+                self.assertEqual(scope.vars, {})
+
+    def test_shadow(self):
+        parent = pysh.PersistentScope()
+        parent['a'] = pysh.Val(pysh.Type('t'))
+        scope = pysh.PersistentScope(parent)
+        b = pysh.Val(pysh.Type('u'))
+        scope['a'] = b
+        self.assertIs(scope['a'], b)
+        self.assertIsNot(parent['a'], b)
+        self.assertEqual(scope.vars, {'a': pysh.Var(b.type, b)})
+
+    def test_vars_write_through(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        scope = pysh.PersistentScope()
+        scope.vars['a'] = pysh.Var(t, pysh.Val(t))
+        scope.vars['a'].set(a)
+        self.assertIs(scope['a'], a)
+
+    def test_plain_parent(self):
+        t = pysh.Type('t')
+        a = pysh.Val(t)
+        parent = pysh.Scope()
+        parent['a'] = a
+        scope = pysh.PersistentScope(parent)
+        self.assertIs(scope['a'], a)
+        with self.assertRaisesRegex(pysh.Error, "unknown var 'b'"):
+            scope['b']
+
+    def test_as_scope(self):
+        t = pysh.Type('t')
+        scope = pysh.FrameScope(pysh.Layout(), pysh.PersistentScope())
+        a = pysh.Val(t)
+        scope.parent['a'] = a
+        self.assertIs(scope['a'], a)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,30 @@
 from __future__ import annotations
+import bisect
 import processor
-from typing import Sequence
+import re
+import sys
+import unicodedata
+from typing import Any, cast, Dict, FrozenSet, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 
-Context = processor.Context[str, str]
-Rule = processor.Rule[str, str]
+
+class Input(NamedTuple):
+    text: str
+    pos: int = 0
+
+
+class Span(NamedTuple):
+    start: int
+    end: int
+
+
+Context = processor.Context[Input, Span]
+Rule = processor.Rule[Input, Span]
+
+
+def _no_input(context: Context) -> processor.Error:
+    if context.processor.partial:
+        raise processor.Incomplete()
+    return context.error('no input')
 
 
 class Literal(Rule):
@@ -19,10 +40,13 @@ class Literal(Rule):
     def __repr__(self) -> str:
         return repr(self.val)
 
-    def __call__(self, context: Context) -> str:
-        if not context.input.startswith(self.val):
+    def __call__(self, context: Context) -> Span:
+        text, pos = context.input
+        if not text.startswith(self.val, pos):
+            if context.processor.partial and len(text) - pos < len(self.val) and text.startswith(self.val[:len(text) - pos], pos):
+                raise processor.Incomplete()
             raise context.error(f'failed to match {self}')
-        return self.val
+        return Span(pos, pos + len(self.val))
 
 
 class Class(Rule):
@@ -39,13 +63,14 @@ class Class(Rule):
     def __repr__(self) -> str:
         return f'[{self.min}-{self.max}]'
 
-    def __call__(self, context: Context) -> str:
-        if not context.input:
-            raise context.error('no input')
-        c = context.input[0]
+    def __call__(self, context: Context) -> Span:
+        text, pos = context.input
+        if pos >= len(text):
+            raise _no_input(context)
+        c = text[pos]
         if c < self.min or c > self.max:
             raise context.error(f'failed to match {self}')
-        return c
+        return Span(pos, pos + 1)
 
 
 class Not(Rule):
@@ -61,31 +86,516 @@ class Not(Rule):
     def __repr__(self) -> str:
         return f'^{self.rule}'
 
-    def __call__(self, context: Context) -> str:
-        if not context.input:
-            raise context.error('no input')
+    def __call__(self, context: Context) -> Span:
+        text, pos = context.input
+        if pos >= len(text):
+            raise _no_input(context)
         try:
             self.rule(context)
         except processor.Error:
-            return context.input[0]
+            return Span(pos, pos + 1)
         raise context.error(f'failed to match {self}')
 
 
-class Regex(processor.Processor[str, str]):
+class CharSet(Rule):
+    def __init__(self, ranges: Sequence[Tuple[str, str]] = (), negated: bool = False, categories: Sequence[str] = ()):
+        self.ranges = CharSet._merge(ranges)
+        self.negated = negated
+        self.categories: FrozenSet[str] = frozenset(categories)
+        self.bitmap = 0
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        for first, last in self.ranges:
+            lo, hi = ord(first), ord(last)
+            for o in range(lo, min(hi, 127) + 1):
+                self.bitmap |= 1 << o
+            if hi >= 128:
+                self.starts.append(max(lo, 128))
+                self.ends.append(hi)
+        for o in range(128):
+            if self._in_categories(chr(o)):
+                self.bitmap |= 1 << o
+
+    @staticmethod
+    def _merge(ranges: Sequence[Tuple[str, str]]) -> Tuple[Tuple[str, str], ...]:
+        merged: List[Tuple[str, str]] = []
+        for first, last in sorted(ranges):
+            if merged and ord(first) <= ord(merged[-1][1]) + 1:
+                if last > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], last)
+            else:
+                merged.append((first, last))
+        return tuple(merged)
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, self.__class__) and self.ranges == rhs.ranges and self.negated == rhs.negated and self.categories == rhs.categories
+
+    def __hash__(self) -> int:
+        return hash((self.ranges, self.negated, self.categories))
+
+    def __repr__(self) -> str:
+        return '[%s%s%s]' % (
+            '^' if self.negated else '',
+            ''.join(first if first == last else f'{first}-{last}' for first, last in self.ranges),
+            ''.join('\\p{%s}' % category for category in sorted(self.categories)))
+
+    def _in_categories(self, c: str) -> bool:
+        if not self.categories:
+            return False
+        category = unicodedata.category(c)
+        return category in self.categories or category[0] in self.categories
+
+    def contains(self, c: str) -> bool:
+        o = ord(c)
+        if o < 128:
+            return bool((self.bitmap >> o) & 1) != self.negated
+        i = bisect.bisect_right(self.starts, o) - 1
+        hit = (i >= 0 and o <= self.ends[i]) or self._in_categories(c)
+        return hit != self.negated
+
+    def __call__(self, context: Context) -> Span:
+        text, pos = context.input
+        if pos >= len(text):
+            raise _no_input(context)
+        if not self.contains(text[pos]):
+            raise context.error(f'failed to match {self}')
+        return Span(pos, pos + 1)
+
+
+def _char_set(rule: Rule) -> Optional[CharSet]:
+    if isinstance(rule, CharSet):
+        return rule
+    elif isinstance(rule, Class):
+        return CharSet([(rule.min, rule.max)])
+    elif isinstance(rule, Literal) and len(rule.val) == 1:
+        return CharSet([(rule.val, rule.val)])
+    return None
+
+
+def _union(rules: Sequence[CharSet]) -> CharSet:
+    return CharSet(
+        [range for rule in rules for range in rule.ranges],
+        False,
+        [category for rule in rules for category in rule.categories])
+
+
+class Trie(Rule):
+    def __init__(self, *vals: str):
+        self.vals = vals
+        self.root: Dict[Optional[str], Any] = {}
+        for priority, val in enumerate(vals):
+            node = self.root
+            for c in val:
+                node = node.setdefault(c, {})
+            node.setdefault(None, priority)
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, self.__class__) and self.vals == rhs.vals
+
+    def __hash__(self) -> int:
+        return hash(self.vals)
+
+    def __repr__(self) -> str:
+        return '(%s)' % ' | '.join(map(repr, self.vals))
+
+    def match(self, text: str, pos: int = 0, partial: bool = False) -> Optional[str]:
+        node = self.root
+        best = node.get(None)
+        for i in range(pos, len(text)):
+            node = node.get(text[i])
+            if node is None:
+                break
+            priority = node.get(None)
+            if priority is not None and (best is None or priority < best):
+                best = priority
+        else:
+            if partial and len(node) > (None in node):
+                raise processor.Incomplete()
+        return None if best is None else self.vals[best]
+
+    def __call__(self, context: Context) -> Span:
+        text, pos = context.input
+        val = self.match(text, pos, context.processor.partial)
+        if val is None:
+            raise context.error(f'failed to match {self}')
+        return Span(pos, pos + len(val))
+
+
+def _merge_char_sets(rules: Sequence[Rule]) -> List[Rule]:
+    merged: List[Rule] = []
+    run: List[Rule] = []
+    for child in list(rules) + [None]:
+        char_set = _char_set(child) if child is not None else None
+        if char_set is not None and not char_set.negated:
+            run.append(child)
+            continue
+        if len(run) > 1:
+            merged.append(_union([_char_set(rule) for rule in run]))
+        else:
+            merged.extend(run)
+        run = []
+        if child is not None:
+            merged.append(child)
+    return merged
+
+
+_UNARY = (processor.ZeroOrMore, processor.OneOrMore,
+          processor.ZeroOrOne, processor.UntilEmpty, Not)
+
+
+def count_nodes(rule: Rule) -> int:
+    if isinstance(rule, (processor.And, processor.Or)):
+        return 1 + sum(map(count_nodes, rule.rules))
+    elif isinstance(rule, _UNARY):
+        return 1 + count_nodes(rule.rule)
+    return 1
+
+
+def simplify(rule: Rule) -> Rule:
+    if isinstance(rule, processor.And):
+        rules: List[Rule] = []
+        for child in map(simplify, rule.rules):
+            for part in child.rules if isinstance(child, processor.And) else [child]:
+                if isinstance(part, Literal) and not part.val:
+                    continue
+                elif rules and isinstance(part, Literal) and isinstance(rules[-1], Literal):
+                    rules[-1] = Literal(rules[-1].val + part.val)
+                elif rules and isinstance(part, processor.ZeroOrMore) and part.rule == rules[-1]:
+                    rules[-1] = processor.OneOrMore(part.rule)
+                else:
+                    rules.append(part)
+        if not rules:
+            return Literal('')
+        return rules[0] if len(rules) == 1 else processor.And(*rules)
+    elif isinstance(rule, processor.Or):
+        rules = []
+        for child in map(simplify, rule.rules):
+            for part in child.rules if isinstance(child, processor.Or) else [child]:
+                if part not in rules:
+                    rules.append(part)
+        return rules[0] if len(rules) == 1 else processor.Or(*rules)
+    elif isinstance(rule, _UNARY):
+        return rule.__class__(simplify(rule.rule))
+    return rule
+
+
+def _fold(rule: Rule) -> Rule:
+    if isinstance(rule, processor.Or):
+        rules = _merge_char_sets([_fold(child) for child in rule.rules])
+        merged: List[Rule] = []
+        literals: List[str] = []
+        for child in rules + [None]:
+            if isinstance(child, Literal):
+                literals.append(child.val)
+                continue
+            if len(literals) > 1:
+                merged.append(Trie(*literals))
+            elif literals:
+                merged.append(Literal(literals[0]))
+            literals = []
+            if child is not None:
+                merged.append(child)
+        return merged[0] if len(merged) == 1 else processor.Or(*merged)
+    elif isinstance(rule, processor.And):
+        return processor.And(*[_fold(child) for child in rule.rules])
+    elif isinstance(rule, Not):
+        child = _fold(rule.rule)
+        char_set = _char_set(child)
+        if char_set is not None:
+            return CharSet(char_set.ranges, not char_set.negated, char_set.categories)
+        return Not(child)
+    elif isinstance(rule, (processor.ZeroOrMore, processor.OneOrMore, processor.ZeroOrOne, processor.UntilEmpty)):
+        return rule.__class__(_fold(rule.rule))
+    return rule
+
+
+def optimize(rule: Rule) -> Rule:
+    return _fold(simplify(rule))
+
+
+def _common_prefix(vals: Sequence[str]) -> str:
+    if not vals:
+        return ''
+    prefix = vals[0]
+    for val in vals[1:]:
+        while not val.startswith(prefix):
+            prefix = prefix[:-1]
+    return prefix
+
+
+def literal_prefix(rule: Rule) -> str:
+    if isinstance(rule, Literal):
+        return rule.val
+    elif isinstance(rule, Trie):
+        return _common_prefix(rule.vals)
+    elif isinstance(rule, CharSet) and not rule.negated and not rule.categories and len(rule.ranges) == 1 and rule.ranges[0][0] == rule.ranges[0][1]:
+        return rule.ranges[0][0]
+    elif isinstance(rule, processor.And):
+        prefix = ''
+        for child in rule.rules:
+            child_prefix = literal_prefix(child)
+            prefix += child_prefix
+            if not isinstance(child, Literal):
+                break
+        return prefix
+    elif isinstance(rule, processor.Or):
+        return _common_prefix([literal_prefix(child) for child in rule.rules])
+    elif isinstance(rule, processor.OneOrMore):
+        return literal_prefix(rule.rule)
+    return ''
+
+
+def required_literal(rule: Rule) -> str:
+    if isinstance(rule, processor.And):
+        return max([required_literal(child) for child in rule.rules] + [literal_prefix(rule)], key=len)
+    elif isinstance(rule, processor.OneOrMore):
+        return required_literal(rule.rule)
+    return literal_prefix(rule)
+
+
+def first_chars(rule: Rule) -> Optional[CharSet]:
+    if isinstance(rule, Literal):
+        return CharSet([(rule.val[0], rule.val[0])]) if rule.val else None
+    elif isinstance(rule, Trie):
+        if not all(rule.vals):
+            return None
+        return CharSet([(val[0], val[0]) for val in rule.vals])
+    elif isinstance(rule, (Class, CharSet)):
+        return _char_set(rule)
+    elif isinstance(rule, processor.And):
+        return first_chars(rule.rules[0]) if rule.rules else None
+    elif isinstance(rule, processor.Or):
+        char_sets = [first_chars(child) for child in rule.rules]
+        if any(char_set is None or char_set.negated for char_set in char_sets):
+            return None
+        return _union(char_sets)
+    elif isinstance(rule, processor.OneOrMore):
+        return first_chars(rule.rule)
+    return None
+
+
+class AhoCorasick:
+    def __init__(self, *vals: str):
+        self.max_len = max(map(len, vals), default=0)
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[int] = [0]
+        for val in vals:
+            state = 0
+            for c in val:
+                if c not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(0)
+                    self.goto[state][c] = len(self.goto) - 1
+                state = self.goto[state][c]
+            self.out[state] = max(self.out[state], len(val))
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for c, next in self.goto[state].items():
+                fail = self.fail[state]
+                while fail and c not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next] = self.goto[fail].get(c, 0)
+                self.out[next] = max(self.out[next], self.out[self.fail[next]])
+                queue.append(next)
+
+    def find(self, text: str, pos: int = 0) -> int:
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        best = -1
+        for i in range(pos, len(text)):
+            if best >= 0 and i - best >= self.max_len:
+                break
+            c = text[i]
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            if out[state]:
+                start = i - out[state] + 1
+                if best < 0 or start < best:
+                    best = start
+        return best
+
+
+def nullable(rule: Rule) -> bool:
+    if isinstance(rule, Literal):
+        return not rule.val
+    elif isinstance(rule, Trie):
+        return not all(rule.vals)
+    elif isinstance(rule, (Class, CharSet, Not)):
+        return False
+    elif isinstance(rule, processor.And):
+        return all(map(nullable, rule.rules))
+    elif isinstance(rule, processor.Or):
+        return any(map(nullable, rule.rules))
+    elif isinstance(rule, processor.OneOrMore):
+        return nullable(rule.rule)
+    return True
+
+
+def _class_char(c: str) -> str:
+    return '\\' + c if c in '\\]^-[' else c
+
+
+_QUANTIFIERS = {
+    processor.ZeroOrMore: '*+',
+    processor.OneOrMore: '++',
+    processor.ZeroOrOne: '?+',
+}
+
+
+def translate(rule: Rule) -> Optional[str]:
+    if isinstance(rule, Literal):
+        return re.escape(rule.val)
+    elif isinstance(rule, Class):
+        if rule.min > rule.max:
+            return '[^\\s\\S]'
+        return f'[{_class_char(rule.min)}-{_class_char(rule.max)}]'
+    elif isinstance(rule, CharSet):
+        if rule.categories:
+            return None
+        if not rule.ranges:
+            return '[\\s\\S]' if rule.negated else '[^\\s\\S]'
+        return '[%s%s]' % ('^' if rule.negated else '', ''.join(
+            _class_char(first) if first == last else f'{_class_char(first)}-{_class_char(last)}'
+            for first, last in rule.ranges))
+    elif isinstance(rule, Trie):
+        return '(?>%s)' % '|'.join(map(re.escape, rule.vals))
+    elif isinstance(rule, Not):
+        child = translate(rule.rule)
+        return None if child is None else f'(?!{child})[\\s\\S]'
+    elif isinstance(rule, (processor.And, processor.Or)):
+        children = list(map(translate, rule.rules))
+        if None in children:
+            return None
+        if isinstance(rule, processor.And):
+            return '(?:%s)' % ''.join(children)
+        return '(?>%s)' % '|'.join(children) if children else '(?!)'
+    elif isinstance(rule, (processor.ZeroOrMore, processor.OneOrMore, processor.ZeroOrOne, processor.UntilEmpty)):
+        child = translate(rule.rule)
+        if child is None or (nullable(rule.rule) and not isinstance(rule, processor.ZeroOrOne)):
+            return None
+        if isinstance(rule, processor.UntilEmpty):
+            return f'(?:{child})*+\\Z'
+        return f'(?:{child}){_QUANTIFIERS[rule.__class__]}'
+    return None
+
+
+def to_pattern(rule: Rule) -> Optional[re.Pattern]:
+    if sys.version_info < (3, 11):
+        return None
+    source = translate(rule)
+    return None if source is None else re.compile(source)
+
+
+class Regex(processor.Processor[Input, Span]):
     def __init__(self, rule: Rule):
         super().__init__({'root': rule}, 'root')
+        root = optimize(rule)
+        self._optimized: Optional[Rule] = root
+        self.literal = root.val if isinstance(root, Literal) and root.val else None
+        self.prefix = literal_prefix(root)
+        self.required = required_literal(root)
+        self.first = first_chars(root)
+        self.automaton = AhoCorasick(*root.vals) if isinstance(
+            root, Trie) and all(root.vals) else None
+        self.pattern = to_pattern(root)
 
     def __repr__(self)->str:
         return repr(self.rules[self.root])
 
-    def advance(self, input: str, output: str) -> str:
-        return input[len(output):]
+    def advance(self, input: Input, output: Span) -> Input:
+        return Input(input.text, output.end)
 
-    def aggregate(self, context: Context, outputs: Sequence[str]) -> str:
-        return ''.join(outputs)
+    def aggregate(self, context: Context, outputs: Sequence[Span]) -> Span:
+        if not outputs:
+            return Span(context.input.pos, context.input.pos)
+        return Span(outputs[0].start, outputs[-1].end)
 
     def error(self, context: Context, msg: str)->str:
-        return f'regex error {repr(msg)} at {repr(context.input[:min(10,len(context.input))])}'
+        text, pos = context.input
+        return f'regex error {repr(msg)} at {repr(text[pos:pos+10])}'
+
+    def empty(self, input: Input) -> bool:
+        if input.pos < len(input.text):
+            return False
+        if self.partial:
+            raise processor.Incomplete()
+        return True
+
+    def input_size(self, input: Input) -> int:
+        return len(input.text) - input.pos
+
+    def output_size(self, output: Span) -> int:
+        return output.end - output.start
+
+    def rule(self, rule_name: str) -> Rule:
+        if rule_name == self.root and self._optimized is not None:
+            return self._optimized
+        return super().rule(rule_name)
+
+    def interpreted(self) -> Regex:
+        return cast(Regex, self._replace(pattern=None))
+
+    def as_partial(self) -> Regex:
+        return cast(Regex, self._replace(partial=True, pattern=None))
+
+    def traced(self, tracer: processor.Tracer) -> Regex:
+        return cast(Regex, processor.Processor.traced(self._replace(pattern=None, _optimized=None), tracer))
+
+    def match_span(self, text: str, pos: int = 0) -> Span:
+        if self.pattern is None or self.metrics is not None:
+            return self.process(Input(text, pos))
+        match = self.pattern.match(text, pos)
+        if match is None:
+            raise processor.Error(self.error(
+                processor.Context(self, Input(text, pos)), f'failed to match {self}'))
+        return Span(pos, match.end())
+
+    def match(self, text: str, pos: int = 0) -> str:
+        start, end = self.match_span(text, pos)
+        return text[start:end]
+
+    def _candidates(self, text: str, pos: int) -> Iterator[int]:
+        if self.required and text.find(self.required, pos) < 0:
+            return
+        if self.prefix:
+            pos = text.find(self.prefix, pos)
+            while pos >= 0:
+                yield pos
+                pos = text.find(self.prefix, pos + 1)
+        elif self.automaton is not None:
+            pos = self.automaton.find(text, pos)
+            while pos >= 0:
+                yield pos
+                pos = self.automaton.find(text, pos + 1)
+        elif self.first is not None:
+            contains = self.first.contains
+            for i in range(pos, len(text)):
+                if contains(text[i]):
+                    yield i
+        else:
+            yield from range(pos, len(text) + 1)
+
+    def search(self, text: str, pos: int = 0) -> Optional[Span]:
+        if self.pattern is not None and self.metrics is None:
+            match = self.pattern.search(text, pos)
+            return None if match is None else Span(*match.span())
+        for start in self._candidates(text, pos):
+            try:
+                return self.match_span(text, start)
+            except processor.Error:
+                pass
+        return None
+
+    def finditer(self, text: str, pos: int = 0) -> Iterator[Span]:
+        while pos <= len(text):
+            span = self.search(text, pos)
+            if span is None:
+                return
+            yield span
+            pos = span.end if span.end > span.start else span.end + 1
 
-    def empty(self, input: str) -> bool:
-        return not input
+    def findall(self, text: str, pos: int = 0) -> List[str]:
+        return [text[start:end] for start, end in self.finditer(text, pos)]
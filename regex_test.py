@@ -1,6 +1,9 @@
 from __future__ import annotations
+import random
 import regex
 import processor
+import sys
+import tracer
 import unittest
 
 
@@ -11,9 +14,9 @@ class LiteralTest(unittest.TestCase):
 
     def test_call(self):
         self.assertEqual(regex.Literal('a')(
-            processor.Context(regex.Regex(None), 'a')), 'a')
+            processor.Context(regex.Regex(None), regex.Input('a'))), regex.Span(0, 1))
         with self.assertRaisesRegex(processor.Error, "regex error \"failed to match 'a'\" at 'b'"):
-            regex.Literal('a')(processor.Context(regex.Regex(None), 'b'))
+            regex.Literal('a')(processor.Context(regex.Regex(None), regex.Input('b')))
 
 
 class ClassTest(unittest.TestCase):
@@ -26,14 +29,14 @@ class ClassTest(unittest.TestCase):
         for input in ['a', 'm', 'z']:
             with self.subTest(input=input):
                 self.assertEqual(regex.Class('a', 'z')(
-                    processor.Context(regex.Regex(None), input)), input)
+                    processor.Context(regex.Regex(None), regex.Input(input))), regex.Span(0, 1))
 
     def test_call_fail(self):
         with self.subTest(input=input):
             with self.assertRaisesRegex(processor.Error,
                                         "regex error 'failed to match \[a\-z\]' at '0'"):
                 regex.Class('a', 'z')(
-                    processor.Context(regex.Regex(None), '0'))
+                    processor.Context(regex.Regex(None), regex.Input('0')))
 
 
 class NotTest(unittest.TestCase):
@@ -42,11 +45,205 @@ class NotTest(unittest.TestCase):
         self.assertNotEqual(regex.Not(regex.Literal('a')),regex.Not(regex.Literal('b')))
 
     def test_call_success(self):
-        self.assertEqual(regex.Not(regex.Literal('a'))(regex.Context(regex.Regex(None), 'b')),'b')
+        self.assertEqual(regex.Not(regex.Literal('a'))(processor.Context(regex.Regex(None), regex.Input('b'))), regex.Span(0, 1))
 
     def test_call_fail(self):
         with self.assertRaisesRegex(processor.Error, "regex error \"failed to match \^'a'\" at 'a'"):
-            regex.Not(regex.Literal('a'))(regex.Context(regex.Regex(None), 'a'))
+            regex.Not(regex.Literal('a'))(processor.Context(regex.Regex(None), regex.Input('a')))
+
+
+class TrieTest(unittest.TestCase):
+    def test_call(self):
+        for vals, input, output in [
+            (('a', 'ab'), 'abc', 'a'),
+            (('ab', 'a'), 'abc', 'ab'),
+            (('ab', 'a'), 'ac', 'a'),
+            (('abc', 'b', 'ab'), 'abd', 'ab'),
+            (('', 'a'), 'a', ''),
+        ]:
+            with self.subTest(vals=vals, input=input):
+                self.assertEqual(regex.Trie(*vals)(
+                    processor.Context(regex.Regex(None), regex.Input(input))), regex.Span(0, len(output)))
+                self.assertEqual(processor.Or(*map(regex.Literal, vals))(
+                    processor.Context(regex.Regex(None), regex.Input(input))), regex.Span(0, len(output)))
+
+    def test_call_fail(self):
+        for input in ['', 'c', 'ac']:
+            with self.subTest(input=input):
+                with self.assertRaisesRegex(processor.Error, 'failed to match'):
+                    regex.Trie('ab', 'b')(
+                        processor.Context(regex.Regex(None), regex.Input(input)))
+
+
+class CharSetTest(unittest.TestCase):
+    def test_eq(self):
+        self.assertEqual(regex.CharSet([('a', 'c'), ('b', 'd')]), regex.CharSet([('a', 'd')]))
+        self.assertNotEqual(regex.CharSet([('a', 'c')]), regex.CharSet([('a', 'c')], True))
+        self.assertNotEqual(regex.CharSet([('a', 'c')]), regex.CharSet([('a', 'c')], False, ['L']))
+
+    def test_repr(self):
+        self.assertEqual(repr(regex.CharSet([('a', 'z'), ('_', '_')])), '[_a-z]')
+        self.assertEqual(repr(regex.CharSet([('a', 'a')], True, ['Lu'])), '[^a\\p{Lu}]')
+
+    def test_contains(self):
+        char_set = regex.CharSet(
+            [('a', 'z'), ('A', 'Z'), ('_', '_'), ('\u03b1', '\u03c9')])
+        for c in 'amzAMZ_\u03b1\u03c9':
+            with self.subTest(c=c):
+                self.assertTrue(char_set.contains(c))
+        for c in '09-`{\u0391\u4e00':
+            with self.subTest(c=c):
+                self.assertFalse(char_set.contains(c))
+
+    def test_contains_negated(self):
+        char_set = regex.CharSet([('a', 'z'), ('\u4e00', '\u4e00')], True)
+        self.assertFalse(char_set.contains('a'))
+        self.assertFalse(char_set.contains('\u4e00'))
+        self.assertTrue(char_set.contains('A'))
+        self.assertTrue(char_set.contains('\u4e01'))
+
+    def test_contains_categories(self):
+        char_set = regex.CharSet([('_', '_')], False, ['L', 'Nd'])
+        for c in 'aZ_5\u00e9\u4e00\u0663':
+            with self.subTest(c=c):
+                self.assertTrue(char_set.contains(c))
+        for c in ' -\u2160':
+            with self.subTest(c=c):
+                self.assertFalse(char_set.contains(c))
+
+    def test_call(self):
+        char_set = regex.CharSet([('a', 'z')])
+        self.assertEqual(char_set(processor.Context(regex.Regex(None), regex.Input('bc'))), regex.Span(0, 1))
+        with self.assertRaisesRegex(processor.Error, 'no input'):
+            char_set(processor.Context(regex.Regex(None), regex.Input('')))
+        with self.assertRaisesRegex(processor.Error, 'failed to match'):
+            char_set(processor.Context(regex.Regex(None), regex.Input('A')))
+
+
+class SimplifyTest(unittest.TestCase):
+    def test_simplify(self):
+        a = regex.Literal('a')
+        b = regex.Literal('b')
+        c = regex.Literal('c')
+        d = regex.Class('0', '9')
+        for rule, expected in [
+            (a, a),
+            (processor.And(a, b, c), regex.Literal('abc')),
+            (processor.And(a, d, b, c), processor.And(a, d, regex.Literal('bc'))),
+            (processor.And(processor.And(a, d), processor.And(d, b)), processor.And(a, d, d, b)),
+            (processor.Or(processor.Or(a, d), processor.Or(b, c)), processor.Or(a, d, b, c)),
+            (processor.Or(a, d, a), processor.Or(a, d)),
+            (processor.And(d, processor.ZeroOrMore(d)), processor.OneOrMore(d)),
+            (processor.And(a, d, processor.ZeroOrMore(d)), processor.And(a, processor.OneOrMore(d))),
+            (processor.And(processor.ZeroOrMore(d), d), processor.And(processor.ZeroOrMore(d), d)),
+            (processor.And(regex.Literal(''), a), a),
+            (processor.And(regex.Literal('')), regex.Literal('')),
+            (processor.ZeroOrMore(processor.And(a, b)), processor.ZeroOrMore(regex.Literal('ab'))),
+            (regex.Not(processor.Or(a)), regex.Not(a)),
+        ]:
+            with self.subTest(rule=rule):
+                self.assertEqual(regex.simplify(rule), expected)
+
+    def test_count_nodes(self):
+        self.assertEqual(regex.count_nodes(regex.Literal('a')), 1)
+        self.assertEqual(regex.count_nodes(processor.And(
+            regex.Literal('a'), processor.ZeroOrMore(regex.Not(regex.Literal('b'))))), 5)
+
+
+class OptimizeTest(unittest.TestCase):
+    def test_regex_keeps_rule(self):
+        rule = processor.Or(processor.And(regex.Literal('a'), regex.Literal('b')), regex.Literal('c'))
+        regex_ = regex.Regex(rule)
+        self.assertIs(regex_.rules[regex_.root], rule)
+        self.assertEqual(repr(regex_), repr(rule))
+        self.assertEqual(regex_, regex.Regex(processor.Or(
+            processor.And(regex.Literal('a'), regex.Literal('b')), regex.Literal('c'))))
+        self.assertNotEqual(regex_, regex.Regex(regex.Trie('ab', 'c')))
+        self.assertEqual(regex_.rule(regex_.root), regex.Trie('ab', 'c'))
+        self.assertEqual(regex_.interpreted().match('cab'), 'c')
+
+    def test_optimize(self):
+        for rule, expected in [
+            (regex.Literal('a'), regex.Literal('a')),
+            (
+                processor.Or(regex.Literal('ab'), regex.Literal('cd')),
+                regex.Trie('ab', 'cd'),
+            ),
+            (
+                processor.Or(regex.Literal('a'), regex.Literal('bc'), regex.Literal('d')),
+                regex.Trie('a', 'bc', 'd'),
+            ),
+            (
+                processor.Or(regex.Literal('a'), regex.Literal('b')),
+                regex.CharSet([('a', 'b')]),
+            ),
+            (
+                processor.Or(
+                    regex.Literal('ab'),
+                    regex.Literal('cd'),
+                    regex.Class('0', '9'),
+                    regex.Literal('ef'),
+                    regex.Literal('gh'),
+                ),
+                processor.Or(
+                    regex.Trie('ab', 'cd'),
+                    regex.Class('0', '9'),
+                    regex.Trie('ef', 'gh'),
+                ),
+            ),
+            (
+                processor.Or(
+                    regex.Class('a', 'z'),
+                    regex.Class('A', 'Z'),
+                    regex.Literal('_'),
+                ),
+                regex.CharSet([('a', 'z'), ('A', 'Z'), ('_', '_')]),
+            ),
+            (
+                processor.Or(
+                    regex.Literal('ab'),
+                    regex.Class('a', 'z'),
+                    regex.Literal('_'),
+                ),
+                processor.Or(
+                    regex.Literal('ab'),
+                    regex.CharSet([('a', 'z'), ('_', '_')]),
+                ),
+            ),
+            (
+                regex.Not(regex.Literal('a')),
+                regex.CharSet([('a', 'a')], True),
+            ),
+            (
+                regex.Not(regex.Literal('ab')),
+                regex.Not(regex.Literal('ab')),
+            ),
+            (
+                processor.ZeroOrMore(regex.Not(processor.Or(
+                    regex.Literal('a'), regex.Literal('b')))),
+                processor.ZeroOrMore(regex.CharSet([('a', 'b')], True)),
+            ),
+        ]:
+            with self.subTest(rule=rule):
+                self.assertEqual(regex.optimize(rule), expected)
+
+    def test_equivalent(self):
+        rules = [
+            processor.OneOrMore(processor.Or(
+                regex.Class('a', 'c'), regex.Literal('x'), regex.Literal('xy'), regex.Literal('_'))),
+            processor.ZeroOrMore(regex.Not(processor.Or(
+                regex.Literal('a'), regex.Class('x', 'z')))),
+            processor.And(regex.Not(regex.Literal('ab')), regex.Literal('b')),
+        ]
+        for rule in rules:
+            for input in ['', 'a', 'abc_x', 'xyz', 'xya', 'b_', 'zz', 'bb', 'qb', 'ab']:
+                with self.subTest(rule=rule, input=input):
+                    def run(rule):
+                        try:
+                            return rule(processor.Context(regex.Regex(None), regex.Input(input)))
+                        except processor.Error:
+                            return None
+                    self.assertEqual(run(rule), run(regex.optimize(rule)))
 
 
 class RegexTest(unittest.TestCase):
@@ -64,7 +261,7 @@ class RegexTest(unittest.TestCase):
         ]:
             with self.subTest(input=input, output=output):
                 self.assertEqual(
-                    self.regex_.process(input),
+                    self.regex_.match(input),
                     output
                 )
 
@@ -76,7 +273,221 @@ class RegexTest(unittest.TestCase):
         ]:
             with self.subTest(input=input):
                 with self.assertRaises(processor.Error):
-                    self.regex_.process(input)
+                    self.regex_.match(input)
+
+    def test_match_span(self):
+        for input, pos, span in [
+            ('a3', 0, regex.Span(0, 2)),
+            ('xa3b', 1, regex.Span(1, 3)),
+        ]:
+            with self.subTest(input=input, pos=pos):
+                self.assertEqual(self.regex_.match_span(input, pos), span)
+                self.assertEqual(self.regex_.process(regex.Input(input, pos)), span)
+        with self.assertRaisesRegex(processor.Error, "at 'b'"):
+            self.regex_.match_span('a3b', 2)
+
+
+class PartialTest(unittest.TestCase):
+    def test_match_span(self):
+        for rule, input, span in [
+            (regex.Literal('ab'), 'a', None),
+            (regex.Literal('ab'), 'abc', regex.Span(0, 2)),
+            (processor.ZeroOrMore(regex.Literal('a')), 'aa', None),
+            (processor.ZeroOrMore(regex.Literal('a')), 'aab', regex.Span(0, 2)),
+            (regex.Trie('ab', 'abcd'), 'abc', None),
+            (regex.Trie('ab', 'c'), 'abc', regex.Span(0, 2)),
+            (regex.Not(regex.Literal('ab')), 'a', None),
+            (processor.UntilEmpty(regex.Class('a', 'z')), 'ab', None),
+        ]:
+            with self.subTest(rule=rule, input=input):
+                partial = regex.Regex(rule).as_partial()
+                if span is None:
+                    with self.assertRaises(processor.Incomplete):
+                        partial.match_span(input)
+                else:
+                    self.assertEqual(partial.match_span(input), span)
+
+    def test_failure(self):
+        with self.assertRaises(processor.Error):
+            regex.Regex(regex.Literal('ab')).as_partial().match_span('ac')
+
+
+class AnalysisTest(unittest.TestCase):
+    def test_literal_prefix(self):
+        a, b = regex.Literal('a'), regex.Literal('b')
+        for rule, prefix in [
+            (regex.Literal('ab'), 'ab'),
+            (regex.Trie('abc', 'abd'), 'ab'),
+            (processor.And(regex.Literal('ab'), processor.OneOrMore(b), a), 'abb'),
+            (processor.Or(regex.Literal('ab'), regex.Literal('ac')), 'a'),
+            (processor.ZeroOrMore(a), ''),
+            (regex.Not(a), ''),
+        ]:
+            with self.subTest(rule=rule):
+                self.assertEqual(regex.literal_prefix(rule), prefix)
+
+    def test_required_literal(self):
+        rule = processor.And(regex.Not(regex.Literal('a')),
+                             regex.Literal('bc'), processor.ZeroOrMore(regex.Literal('d')))
+        self.assertEqual(regex.required_literal(rule), 'bc')
+
+    def test_first_chars(self):
+        for rule, first in [
+            (regex.Literal('ab'), regex.CharSet([('a', 'a')])),
+            (regex.Trie('ab', 'c'), regex.CharSet([('a', 'a'), ('c', 'c')])),
+            (processor.And(regex.Class('0', '9'), regex.Literal('a')), regex.CharSet([('0', '9')])),
+            (processor.Or(regex.Literal('x'), regex.Class('a', 'c')), regex.CharSet([('a', 'c'), ('x', 'x')])),
+            (processor.ZeroOrMore(regex.Literal('a')), None),
+            (regex.Trie('', 'a'), None),
+            (processor.Or(regex.Literal('a'), regex.Not(regex.Literal('b'))), None),
+        ]:
+            with self.subTest(rule=rule):
+                self.assertEqual(regex.first_chars(rule), first)
+
+
+class AhoCorasickTest(unittest.TestCase):
+    def test_find(self):
+        for vals, text, pos, start in [
+            (('he', 'she', 'his', 'hers'), 'ushers', 0, 1),
+            (('he', 'she', 'his', 'hers'), 'ushers', 2, 2),
+            (('abcd', 'bc'), 'xabcd', 0, 1),
+            (('abcd', 'bc'), 'xabce', 0, 2),
+            (('a',), 'bbb', 0, -1),
+        ]:
+            with self.subTest(vals=vals, text=text, pos=pos):
+                self.assertEqual(regex.AhoCorasick(*vals).find(text, pos), start)
+
+
+class SearchTest(unittest.TestCase):
+    rules = [
+        regex.Literal('ab'),
+        processor.Or(regex.Literal('ab'), regex.Literal('a'), regex.Literal('bc')),
+        processor.And(regex.Class('0', '9'), processor.ZeroOrMore(regex.Class('0', '9'))),
+        processor.And(regex.Not(regex.Literal('a')), regex.Literal('b')),
+        processor.ZeroOrMore(regex.Literal('a')),
+    ]
+
+    @staticmethod
+    def brute_force(regex_: regex.Regex, text: str):
+        spans = []
+        pos = 0
+        while pos <= len(text):
+            for start in range(pos, len(text) + 1):
+                try:
+                    span = regex_.match_span(text, start)
+                    break
+                except processor.Error:
+                    pass
+            else:
+                break
+            spans.append(span)
+            pos = span.end if span.end > span.start else span.end + 1
+        return spans
+
+    def test_finditer(self):
+        for rule in self.rules:
+            regex_ = regex.Regex(rule)
+            for text in ['', 'ab', 'xxabcab', 'a1b23c', 'bcaab', 'cbxb', '9']:
+                with self.subTest(rule=rule, text=text):
+                    self.assertEqual(list(regex_.finditer(text)),
+                                     self.brute_force(regex_, text))
+
+    def test_search(self):
+        regex_ = regex.Regex(processor.And(regex.Literal('a'), regex.Class('0', '9')))
+        self.assertEqual(regex_.search('xxa1a2'), regex.Span(2, 4))
+        self.assertEqual(regex_.search('xxa1a2', 3), regex.Span(4, 6))
+        self.assertIsNone(regex_.search('aaaa'))
+
+    def test_findall(self):
+        self.assertEqual(
+            regex.Regex(processor.Or(regex.Literal('ab'), regex.Literal('a'),
+                        regex.Literal('bc'))).findall('xabcabcbc'),
+            ['ab', 'ab', 'bc'])
+
+
+class TranslateTest(unittest.TestCase):
+    def test_translate(self):
+        for rule, source in [
+            (regex.Literal('a.'), 'a\\.'),
+            (regex.Class('a', 'z'), '[a-z]'),
+            (regex.CharSet([('a', 'c'), ('-', '-')], True), '[^\\-a-c]'),
+            (processor.Or(regex.Not(regex.Literal('a')), regex.Class('0', '9')),
+             '(?>(?!a)[\\s\\S]|[0-9])'),
+            (processor.OneOrMore(regex.Literal('ab')), '(?:ab)++'),
+            (processor.UntilEmpty(regex.Class('a', 'z')), '(?:[a-z])*+\\Z'),
+            (regex.CharSet(categories=['Lu']), None),
+            (processor.ZeroOrMore(processor.ZeroOrOne(regex.Literal('a'))), None),
+        ]:
+            with self.subTest(rule=rule):
+                self.assertEqual(regex.translate(rule), source)
+
+    def test_to_pattern(self):
+        self.assertFalse(hasattr(regex, 'compile'))
+        self.assertIsNone(regex.to_pattern(regex.CharSet(categories=['Lu'])))
+        pattern = regex.to_pattern(regex.Literal('a.'))
+        if sys.version_info < (3, 11):
+            self.assertIsNone(pattern)
+        else:
+            self.assertEqual(pattern.pattern, 'a\\.')
+
+    def test_traced_is_interpreted(self):
+        regex_ = regex.Regex(regex.Literal('a'))
+        self.assertIsNotNone(regex_.pattern)
+        self.assertIsNone(regex_.traced(tracer.RingBuffer()).pattern)
+
+    def test_frozen_variants(self):
+        regex_ = regex.Regex(regex.Literal('a')).freeze()
+        for variant in [regex_.traced(tracer.RingBuffer()), regex_.interpreted()]:
+            self.assertIsNone(variant.pattern)
+            self.assertEqual(variant.match('ab'), 'a')
+        self.assertIsNotNone(regex_.pattern)
+
+
+ALPHABET = 'ab-]'
+
+
+def random_rule(rng: random.Random, depth: int, alphabet: str = ALPHABET) -> regex.Rule:
+    leaves = [
+        lambda: regex.Literal(''.join(rng.choice(alphabet)
+                              for _ in range(rng.randint(0, 2)))),
+        lambda: regex.Class(*sorted(rng.choice(alphabet) for _ in range(2))),
+        lambda: regex.CharSet([(c, c) for c in rng.sample(alphabet, 2)],
+                              rng.random() < 0.5),
+    ]
+    if depth == 0 or rng.random() < 0.3:
+        return rng.choice(leaves)()
+    kind = rng.choice([processor.And, processor.Or, processor.ZeroOrMore, processor.OneOrMore,
+                       processor.ZeroOrOne, processor.UntilEmpty, regex.Not])
+    if kind in (processor.And, processor.Or):
+        return kind(*[random_rule(rng, depth - 1, alphabet) for _ in range(rng.randint(1, 3))])
+    child = random_rule(rng, depth - 1, alphabet)
+    if kind is not processor.ZeroOrOne and regex.nullable(child):
+        child = processor.And(regex.Literal('a'), child)
+    return kind(child)
+
+
+class DifferentialTest(unittest.TestCase):
+    @staticmethod
+    def attempt(fn, *args):
+        try:
+            return fn(*args)
+        except processor.Error:
+            return None
+
+    def test_equivalent(self):
+        rng = random.Random(0)
+        texts = [''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 6)))
+                 for _ in range(40)]
+        for _ in range(300):
+            regex_ = regex.Regex(random_rule(rng, 3))
+            self.assertIsNotNone(regex_.pattern)
+            interpreted = regex_.interpreted()
+            for text in texts:
+                with self.subTest(regex=regex_, text=text):
+                    self.assertEqual(self.attempt(regex_.match_span, text),
+                                     self.attempt(interpreted.match_span, text))
+                    self.assertEqual(list(regex_.finditer(text)),
+                                     list(interpreted.finditer(text)))
 
 
 if __name__ == '__main__':
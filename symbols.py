@@ -0,0 +1,38 @@
+from __future__ import annotations
+import threading
+from typing import Dict, Iterable, List, Optional
+
+
+class Table:
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = []
+        self.kinds: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        for name in names:
+            self.intern(name)
+
+    def __repr__(self) -> str:
+        return f'Table({self.names})'
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.kinds
+
+    def intern(self, name: str) -> int:
+        kind = self.kinds.get(name)
+        if kind is None:
+            with self.lock:
+                kind = self.kinds.get(name)
+                if kind is None:
+                    kind = len(self.names)
+                    self.names.append(name)
+                    self.kinds[name] = kind
+        return kind
+
+    def kind(self, name: str) -> Optional[int]:
+        return self.kinds.get(name)
+
+    def name(self, kind: int) -> str:
+        return self.names[kind]
@@ -0,0 +1,41 @@
+from __future__ import annotations
+import symbols
+import threading
+import unittest
+
+
+class TableTest(unittest.TestCase):
+    def test_intern(self):
+        table = symbols.Table(['a', 'b'])
+        self.assertEqual(table.intern('a'), 0)
+        self.assertEqual(table.intern('c'), 2)
+        self.assertEqual(table.intern('c'), 2)
+        self.assertEqual(len(table), 3)
+        self.assertIn('b', table)
+        self.assertNotIn('d', table)
+
+    def test_lookup(self):
+        table = symbols.Table(['a', 'b'])
+        self.assertEqual(table.kind('b'), 1)
+        self.assertIsNone(table.kind('c'))
+        self.assertEqual(table.name(1), 'b')
+
+    def test_intern_threads(self):
+        table = symbols.Table()
+        barrier = threading.Barrier(8)
+
+        def intern(offset: int) -> None:
+            barrier.wait()
+            for i in range(200):
+                table.intern(str((i * 7 + offset) % 200))
+        threads = [threading.Thread(target=intern, args=(offset,)) for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(table.kinds.values()), list(range(200)))
+        self.assertEqual([table.kind(name) for name in table.names], list(range(200)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,30 @@
 from __future__ import annotations
 import parser
-from typing import Callable, Generic, MutableSequence, Optional, Sequence, Set, TypeVar
+import symbols
+from typing import Any, Callable, Dict, Generic, MutableSequence, Optional, Sequence, Set, Tuple, TypeVar
 
 Expr = TypeVar('Expr')
 Rule = Callable[[parser.Node, Sequence[Expr]], Optional[Expr]]
 
 
+class RuleName:
+    def __init__(self, rule_name: str, rule: Rule):
+        self.rule_name = rule_name
+        self.rule = rule
+
+    def __repr__(self) -> str:
+        return f'RuleName({repr(self.rule_name)})'
+
+    def matches(self, key: Tuple[Any, Any], symbols_: Optional[symbols.Table]) -> bool:
+        kind = symbols_.kind(self.rule_name) if symbols_ is not None else None
+        return any(k == (self.rule_name if isinstance(k, str) else kind) for k in key if k is not None)
+
+    def __call__(self, node: parser.Node, exprs: Sequence[Expr]) -> Optional[Expr]:
+        return self.rule(node, exprs) if (node.rule_name == self.rule_name or (node.token and node.token.rule_name == self.rule_name)) else None
+
+
 def rule_name(rule_name: str, rule: Rule) -> Rule:
-    return lambda node, exprs: rule(node, exprs) if (node.rule_name == rule_name or (node.token and node.token.rule_name == rule_name)) else None
+    return RuleName(rule_name, rule)
 
 
 def nary(n: int, rule: Rule) -> Rule:
@@ -26,16 +43,35 @@ def terminal(factory: Callable[[str], Optional[Expr]]) -> Rule:
     return lambda node, exprs: factory(node.token.val) if node.token else None
 
 
+def _key(node: parser.Node, symbols_: Optional[symbols.Table]) -> Tuple[Any, Any]:
+    token = node.token
+    return (
+        node.kind if symbols_ is not None and node.symbols is symbols_ else node.rule_name,
+        None if token is None else token.kind if symbols_ is not None and token.symbols is symbols_ else token.rule_name,
+    )
+
+
 class Syntax(Generic[Expr]):
-    def __init__(self, *rules: Rule):
+    def __init__(self, *rules: Rule, symbols_: Optional[symbols.Table] = None):
         self.rules = rules
+        self.symbols = symbols_
+        self.candidates: Dict[Tuple[Any, Any], Tuple[Rule, ...]] = {}
+
+    def _candidates(self, key: Tuple[Any, Any]) -> Tuple[Rule, ...]:
+        candidates = self.candidates.get(key)
+        if candidates is None:
+            candidates = self.candidates.setdefault(key, tuple(
+                rule.rule if isinstance(rule, RuleName) else rule
+                for rule in self.rules
+                if not isinstance(rule, RuleName) or rule.matches(key, self.symbols)))
+        return candidates
 
     def __call__(self, node: parser.Node) -> Sequence[Expr]:
         child_exprs: MutableSequence[Expr] = []
         for child_node in node.children:
             child_exprs.extend(self(child_node))
         exprs = [expr for expr in [rule(node, child_exprs)
-                                   for rule in self.rules] if expr]
+                                   for rule in self._candidates(_key(node, self.symbols))] if expr]
         assert len(exprs) <= 1, 'syntax error %s' % exprs
         return [exprs[0]] if exprs else child_exprs
 
@@ -61,9 +97,9 @@ def token_vals(rule_name: str, factory: Callable[[Sequence[str]], Optional[Expr]
     return impl
 
 
-def get_token_vals(token_rule_name: str) -> Syntax[str]:
-    return Syntax(rule_name(token_rule_name, aggregate_token_vals))
+def get_token_vals(token_rule_name: str, symbols_: Optional[symbols.Table] = None) -> Syntax[str]:
+    return Syntax(rule_name(token_rule_name, aggregate_token_vals), symbols_=symbols_)
 
 
-def get_nodes(rule_name_: str) -> Syntax[parser.Node]:
-    return Syntax(rule_name(rule_name_, aggregate_nodes))
+def get_nodes(rule_name_: str, symbols_: Optional[symbols.Table] = None) -> Syntax[parser.Node]:
+    return Syntax(rule_name(rule_name_, aggregate_nodes), symbols_=symbols_)
@@ -1,6 +1,8 @@
 from __future__ import annotations
 import lexer
+import loader
 import parser
+import symbols
 import syntax
 from typing import List as ListType, NamedTuple
 import unittest
@@ -190,6 +192,30 @@ class SyntaxTest(unittest.TestCase):
             [_List([_Int(1), _Add(_Int(2), _Int(3)), _Not(_Int(4))])]
         )
 
+    def test_syntax_kinds(self):
+        table = symbols.Table(['int', 'add'])
+        syntax_ = syntax.Syntax(self.int_rule(), self.add_rule(), symbols_=table)
+        self.assertEqual(
+            syntax_(parser.Node(rule_name='add', kind=1, symbols_=table, children=(
+                parser.Node(token=lexer.Token('1', lexer.Location(0, 0), 'int', kind=0, symbols=table)),
+                parser.Node(token=lexer.Token('2', lexer.Location(0, 0), 'int', kind=0, symbols=table)),
+            ))),
+            [_Add(_Int(1), _Int(2))]
+        )
+        self.assertEqual(
+            syntax_(parser.Node(rule_name='add', kind=0, symbols_=table)),
+            []
+        )
+
+    def test_syntax_loaded(self):
+        lexer_, parser_ = loader.load_lexer_and_parser(
+            'id = "[a-z]"; ws ~= " +"; root -> item!; item -> "id";')
+        node = parser_.parse(lexer_.lex('a b c'))
+        self.assertEqual(syntax.get_token_vals('id')(node), ['a', 'b', 'c'])
+        self.assertEqual(len(syntax.get_nodes('item')(node)), 3)
+        self.assertEqual(syntax.get_token_vals('id', parser_.symbols)(node), ['a', 'b', 'c'])
+        self.assertEqual(syntax.get_token_vals('id', symbols.Table(['ws', 'id']))(node), ['a', 'b', 'c'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,66 @@
+from __future__ import annotations
+import processor
+import struct
+from collections import deque
+from typing import BinaryIO, Deque, Dict, Iterator, List
+
+_MAGIC = b'PTRC\x01'
+_NAME = 3
+_RECORD = struct.Struct('<BIq')
+_NAME_HEADER = struct.Struct('<BII')
+
+
+class RingBuffer(processor.Tracer):
+    def __init__(self, size: int = 4096):
+        super().__init__()
+        self.events: Deque[processor.Event] = deque(maxlen=size)
+
+    def __repr__(self) -> str:
+        return f'RingBuffer(events={list(self.events)})'
+
+    def event(self, event: processor.Event) -> None:
+        self.events.append(event)
+
+
+class TraceFile(processor.Tracer):
+    def __init__(self, file: BinaryIO):
+        super().__init__()
+        self.file = file
+        self.names: Dict[str, int] = {}
+        self.file.write(_MAGIC)
+
+    def __repr__(self) -> str:
+        return f'TraceFile(file={self.file})'
+
+    def event(self, event: processor.Event) -> None:
+        name_id = self.names.get(event.rule_name)
+        if name_id is None:
+            name_id = self.names[event.rule_name] = len(self.names)
+            name = event.rule_name.encode('utf-8')
+            self.file.write(_NAME_HEADER.pack(_NAME, name_id, len(name)))
+            self.file.write(name)
+        self.file.write(_RECORD.pack(event.kind, name_id, event.pos))
+
+
+def replay(file: BinaryIO) -> Iterator[processor.Event]:
+    if file.read(len(_MAGIC)) != _MAGIC:
+        raise processor.Error('invalid trace file')
+    names: List[str] = []
+    while True:
+        kind = file.read(1)
+        if not kind:
+            return
+        if kind[0] == _NAME:
+            _, name_id, length = _NAME_HEADER.unpack(
+                kind + file.read(_NAME_HEADER.size - 1))
+            assert name_id == len(names), f'out of order name {name_id}'
+            names.append(file.read(length).decode('utf-8'))
+        else:
+            kind_, name_id, pos = _RECORD.unpack(
+                kind + file.read(_RECORD.size - 1))
+            yield processor.Event(kind_, names[name_id], pos)
+
+
+def load(path: str) -> List[processor.Event]:
+    with open(path, 'rb') as file:
+        return list(replay(file))
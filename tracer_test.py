@@ -0,0 +1,55 @@
+from __future__ import annotations
+import io
+import lexer
+import processor
+import regex
+import tracer
+import unittest
+
+
+def lexer_() -> lexer.Lexer:
+    return lexer.Lexer(
+        {
+            'a': regex.Regex(regex.Literal('a')),
+            'b': regex.Regex(regex.Literal('b')),
+        }, {}
+    )
+
+
+class RingBufferTest(unittest.TestCase):
+    def test_bounded(self):
+        buffer = tracer.RingBuffer(3)
+        lexer_().traced(buffer).lex('ab')
+        self.assertEqual(list(buffer.events), [
+            processor.Event(processor.ENTER, 'b', 1),
+            processor.Event(processor.EXIT, 'b', 2),
+            processor.Event(processor.EXIT, '_root', 2),
+        ])
+
+
+class TraceFileTest(unittest.TestCase):
+    def test_replay(self):
+        buffer = tracer.RingBuffer()
+        file = io.BytesIO()
+        lexer_().traced(buffer).lex('ab')
+        lexer_().traced(tracer.TraceFile(file)).lex('ab')
+        file.seek(0)
+        self.assertEqual(list(tracer.replay(file)), list(buffer.events))
+        self.assertEqual(list(buffer.events), [
+            processor.Event(processor.ENTER, '_root', 0),
+            processor.Event(processor.ENTER, 'a', 0),
+            processor.Event(processor.EXIT, 'a', 1),
+            processor.Event(processor.ENTER, 'a', 1),
+            processor.Event(processor.FAIL, 'a', 1),
+            processor.Event(processor.ENTER, 'b', 1),
+            processor.Event(processor.EXIT, 'b', 2),
+            processor.Event(processor.EXIT, '_root', 2),
+        ])
+
+    def test_replay_invalid(self):
+        with self.assertRaisesRegex(processor.Error, 'invalid trace file'):
+            list(tracer.replay(io.BytesIO(b'abc')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,344 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from array import array
+import lexer
+import loader
+import parser
+import pysh
+import syntax
+import threading
+from typing import Dict, List, Mapping, MutableSequence, Optional, Sequence, Tuple
+
+GRAMMAR = r'''
+id = "([a-z]|[A-Z]|_)([a-z]|[A-Z]|[0-9]|_)*";
+ws ~= "( |
+|	)+";
+prog -> stmt!;
+stmt -> assign | block;
+assign -> expr "=" expr ";";
+block -> "{" stmt* "}";
+expr -> new | attr | ref;
+new -> "id" "\(\)";
+attr -> ref ("." "id")+;
+ref -> "id";
+'''
+
+LOAD_NAME = 0
+STORE_NAME = 1
+LOAD_SLOT = 2
+STORE_SLOT = 3
+LOAD_ATTR = 4
+STORE_ATTR = 5
+NEW = 6
+ENTER = 7
+EXIT = 8
+
+OPS = ['LOAD_NAME', 'STORE_NAME', 'LOAD_SLOT', 'STORE_SLOT',
+       'LOAD_ATTR', 'STORE_ATTR', 'NEW', 'ENTER', 'EXIT']
+
+MAX_OPERAND = (1 << 32) - 1
+
+
+class Code:
+    def __init__(self):
+        self.ops = array('L')
+        self.consts: List[pysh.Type] = []
+        self.names: List[str] = []
+        self.layouts: List[pysh.Layout] = []
+        self.caches: List[pysh.AttrCache] = []
+
+    def __repr__(self) -> str:
+        return '\n'.join(
+            f'{OPS[self.ops[pc]]} {self.ops[pc+1]} {self.ops[pc+2]}'
+            for pc in range(0, len(self.ops), 3))
+
+    def emit(self, op: int, a: int = 0, b: int = 0) -> None:
+        if not (0 <= a <= MAX_OPERAND and 0 <= b <= MAX_OPERAND):
+            raise pysh.Error(f'operand out of range in {OPS[op]} {a} {b}')
+        self.ops.extend((op, a, b))
+
+
+class Compiler:
+    def __init__(self, types: Mapping[str, pysh.Type]):
+        self.types = types
+        self.code = Code()
+        self.layout: Optional[pysh.Layout] = None
+        self.names: Dict[str, int] = {}
+        self.consts: Dict[int, int] = {}
+
+    def compile(self, stmts: Sequence[Stmt]) -> Code:
+        for stmt in stmts:
+            stmt.compile(self)
+        return self.code
+
+    def name(self, name: str) -> int:
+        index = self.names.get(name)
+        if index is None:
+            index = self.names[name] = len(self.code.names)
+            self.code.names.append(name)
+        return index
+
+    def type(self, name: str) -> int:
+        if name not in self.types:
+            raise pysh.Error(f'unknown type {repr(name)}')
+        type = self.types[name]
+        index = self.consts.get(type.id)
+        if index is None:
+            index = self.consts[type.id] = len(self.code.consts)
+            self.code.consts.append(type)
+        return index
+
+    def cache(self, name: str) -> int:
+        self.code.caches.append(pysh.AttrCache(name))
+        return len(self.code.caches) - 1
+
+
+class Interpreter:
+    def __init__(self, types: Mapping[str, pysh.Type]):
+        self.types = types
+
+    def run(self, stmts: Sequence[Stmt], scope: pysh.Scope) -> None:
+        for stmt in stmts:
+            stmt.exec(self, scope)
+
+
+class Expr(ABC):
+    @abstractmethod
+    def eval(self, interpreter: Interpreter, scope: pysh.Scope) -> pysh.Val: pass
+
+    @abstractmethod
+    def compile(self, compiler: Compiler) -> None: pass
+
+
+class Ref(Expr):
+    def __init__(self, name: str):
+        self.name = name
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, self.__class__) and self.name == rhs.name
+
+    def __repr__(self) -> str:
+        return self.name
+
+    def eval(self, interpreter: Interpreter, scope: pysh.Scope) -> pysh.Val:
+        return scope[self.name]
+
+    def compile(self, compiler: Compiler) -> None:
+        slot = compiler.layout.resolve(
+            self.name) if compiler.layout is not None else None
+        if slot is None:
+            compiler.code.emit(LOAD_NAME, compiler.name(self.name))
+        else:
+            compiler.code.emit(LOAD_SLOT, slot.depth, slot.index)
+
+
+class Attr(Expr):
+    def __init__(self, expr: Expr, name: str):
+        self.expr = expr
+        self.name = name
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, self.__class__) and self.expr == rhs.expr and self.name == rhs.name
+
+    def __repr__(self) -> str:
+        return f'{self.expr}.{self.name}'
+
+    def eval(self, interpreter: Interpreter, scope: pysh.Scope) -> pysh.Val:
+        return self.expr.eval(interpreter, scope).scope[self.name]
+
+    def compile(self, compiler: Compiler) -> None:
+        self.expr.compile(compiler)
+        compiler.code.emit(LOAD_ATTR, compiler.cache(self.name))
+
+
+class New(Expr):
+    def __init__(self, type: str):
+        self.type = type
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, self.__class__) and self.type == rhs.type
+
+    def __repr__(self) -> str:
+        return f'{self.type}()'
+
+    def eval(self, interpreter: Interpreter, scope: pysh.Scope) -> pysh.Val:
+        if self.type not in interpreter.types:
+            raise pysh.Error(f'unknown type {repr(self.type)}')
+        return pysh.Val(interpreter.types[self.type])
+
+    def compile(self, compiler: Compiler) -> None:
+        compiler.code.emit(NEW, compiler.type(self.type))
+
+
+class Stmt(ABC):
+    @abstractmethod
+    def exec(self, interpreter: Interpreter, scope: pysh.Scope) -> None: pass
+
+    @abstractmethod
+    def compile(self, compiler: Compiler) -> None: pass
+
+
+class Assign(Stmt):
+    def __init__(self, target: Expr, val: Expr):
+        self.target = target
+        self.val = val
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, self.__class__) and self.target == rhs.target and self.val == rhs.val
+
+    def __repr__(self) -> str:
+        return f'{self.target} = {self.val};'
+
+    def exec(self, interpreter: Interpreter, scope: pysh.Scope) -> None:
+        if isinstance(self.target, Ref):
+            scope[self.target.name] = self.val.eval(interpreter, scope)
+        elif isinstance(self.target, Attr):
+            obj = self.target.expr.eval(interpreter, scope)
+            obj.scope[self.target.name] = self.val.eval(interpreter, scope)
+        else:
+            raise pysh.Error(f'invalid assignment target {self.target}')
+
+    def compile(self, compiler: Compiler) -> None:
+        if isinstance(self.target, Ref):
+            self.val.compile(compiler)
+            if compiler.layout is None:
+                compiler.code.emit(
+                    STORE_NAME, compiler.name(self.target.name))
+            else:
+                compiler.code.emit(
+                    STORE_SLOT, 0, compiler.layout.declare(self.target.name))
+        elif isinstance(self.target, Attr):
+            self.target.expr.compile(compiler)
+            self.val.compile(compiler)
+            compiler.code.emit(STORE_ATTR, compiler.cache(self.target.name))
+        else:
+            raise pysh.Error(f'invalid assignment target {self.target}')
+
+
+class Block(Stmt):
+    def __init__(self, stmts: Sequence[Stmt]):
+        self.stmts = stmts
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, self.__class__) and list(self.stmts) == list(rhs.stmts)
+
+    def __repr__(self) -> str:
+        return '{%s}' % ' '.join(map(repr, self.stmts))
+
+    def exec(self, interpreter: Interpreter, scope: pysh.Scope) -> None:
+        interpreter.run(self.stmts, pysh.Scope(scope))
+
+    def compile(self, compiler: Compiler) -> None:
+        layout = compiler.layout = pysh.Layout(parent=compiler.layout)
+        compiler.code.layouts.append(layout)
+        compiler.code.emit(ENTER, len(compiler.code.layouts) - 1)
+        for stmt in self.stmts:
+            stmt.compile(compiler)
+        compiler.code.emit(EXIT)
+        compiler.layout = layout.parent
+        layout.freeze()
+
+
+class VM:
+    def run(self, code: Code, scope: pysh.Scope) -> None:
+        consts = code.consts
+        names = code.names
+        layouts = code.layouts
+        caches = code.caches
+        globals = scope
+        stack: MutableSequence[pysh.Val] = []
+        push = stack.append
+        pop = stack.pop
+        ops = iter(code.ops)
+        for op, a, b in zip(ops, ops, ops):
+            if op == LOAD_SLOT:
+                frame = scope.frames[a]
+                val = frame.vals[b]
+                push(val if val is not None else frame.get(pysh.Slot(0, b)))
+            elif op == LOAD_ATTR:
+                cache = caches[a]
+                obj = pop()
+                push(obj.slots[cache.index] if obj.shape is cache.shape else cache.get(obj))
+            elif op == STORE_SLOT:
+                frame = scope.frames[a]
+                val = pop()
+                type = frame.types[b]
+                if type is val.type:
+                    frame.vals[b] = val
+                elif type is None:
+                    frame.types[b] = val.type
+                    frame.vals[b] = val
+                else:
+                    frame._set(b, val)
+            elif op == LOAD_NAME:
+                # Names the compiler could not resolve to a slot are never
+                # bound in a frame, so they are looked up in the globals.
+                push(globals[names[a]])
+            elif op == STORE_NAME:
+                globals[names[a]] = pop()
+            elif op == STORE_ATTR:
+                cache = caches[a]
+                val = pop()
+                obj = pop()
+                if obj.shape is cache.shape and obj.shape.types[cache.index] is val.type:
+                    obj.slots[cache.index] = val
+                else:
+                    cache.set(obj, val)
+            elif op == NEW:
+                push(pysh.Val(consts[a]))
+            elif op == ENTER:
+                scope = pysh.FrameScope(layouts[a], scope)
+            elif op == EXIT:
+                scope = scope.parent
+            else:
+                raise pysh.Error(f'invalid op {op}')
+
+
+def _attr(node, exprs: Sequence[Expr]) -> Optional[Expr]:
+    names = syntax.get_token_vals('id')(node)
+    expr = exprs[0]
+    for name in names[1:]:
+        expr = Attr(expr, name)
+    return expr
+
+
+_loaded: Optional[Tuple[lexer.Lexer, parser.Parser, syntax.Syntax]] = None
+_lock = threading.Lock()
+
+
+def _load() -> Tuple[lexer.Lexer, parser.Parser, syntax.Syntax]:
+    global _loaded
+    if _loaded is None:
+        with _lock:
+            if _loaded is None:
+                lexer_, parser_ = loader.load_lexer_and_parser(GRAMMAR)
+                _loaded = lexer_, parser_, syntax.Syntax(
+                    syntax.rule_name(
+                        'ref',
+                        syntax.sub_syntax(
+                            syntax.get_token_vals('id'),
+                            lambda node, vals: Ref(vals[0])
+                        )
+                    ),
+                    syntax.rule_name('attr', _attr),
+                    syntax.rule_name(
+                        'new',
+                        syntax.sub_syntax(
+                            syntax.get_token_vals('id'),
+                            lambda node, vals: New(vals[0])
+                        )
+                    ),
+                    syntax.rule_name('assign', syntax.binary(Assign)),
+                    syntax.rule_name('block', lambda node, exprs: Block(list(exprs))),
+                    symbols_=parser_.symbols,
+                )
+    return _loaded
+
+
+def load(input: str) -> Sequence[Stmt]:
+    lexer_, parser_, syntax_ = _load()
+    return syntax_(parser_.parse(lexer_.lex(input)))
+
+
+def compile_program(input: str, types: Mapping[str, pysh.Type]) -> Code:
+    return Compiler(types).compile(load(input))
@@ -0,0 +1,47 @@
+from __future__ import annotations
+import pysh
+import timeit
+import vm
+from typing import Callable, Mapping
+
+
+def nested(depth: int, reads: int) -> str:
+    body = ' '.join([f'r{i} = a{i % depth}.x;' for i in range(reads)])
+    for i in reversed(range(depth)):
+        body = f'{{ a{i+1} = a{i}; {body} }}'
+    return f'a0 = T(); a0.x = T(); {body}'
+
+
+def attrs(count: int) -> str:
+    return 'a = T(); a.x = T(); a.x.y = T(); ' + ' '.join(
+        [f'b{i} = a.x.y; a.x.y = b{i};' for i in range(count)])
+
+
+BENCHMARKS: Mapping[str, str] = {
+    'nested': nested(16, 32),
+    'attrs': attrs(64),
+}
+
+
+def bench(name: str, fn: Callable[[], None], number: int) -> float:
+    seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f'  {name:12} {seconds * 1e6:10.1f}us')
+    return seconds
+
+
+def main(number: int = 200) -> None:
+    types = {'T': pysh.Type('T')}
+    for name, input in BENCHMARKS.items():
+        stmts = vm.load(input)
+        code = vm.Compiler(types).compile(stmts)
+        interpreter = vm.Interpreter(types)
+        vm_ = vm.VM()
+        print(name)
+        tree = bench('interpreter', lambda: interpreter.run(
+            stmts, pysh.Scope()), number)
+        bytecode = bench('vm', lambda: vm_.run(code, pysh.Scope()), number)
+        print(f'  {"speedup":12} {tree / bytecode:10.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+from __future__ import annotations
+import processor
+import pysh
+import unittest
+import vm
+
+
+class LoadTest(unittest.TestCase):
+    def test_load(self):
+        self.assertEqual(
+            vm.load('a = T(); a.b = a; { c = a.b.b; }'),
+            [
+                vm.Assign(vm.Ref('a'), vm.New('T')),
+                vm.Assign(vm.Attr(vm.Ref('a'), 'b'), vm.Ref('a')),
+                vm.Block([
+                    vm.Assign(vm.Ref('c'), vm.Attr(
+                        vm.Attr(vm.Ref('a'), 'b'), 'b')),
+                ]),
+            ]
+        )
+
+
+class CompilerTest(unittest.TestCase):
+    def test_compile(self):
+        t = pysh.Type('T')
+        code = vm.compile_program('a = T(); { b = a; { c = b.x; b = c; } }', {'T': t})
+        self.assertEqual(list(code.ops), [
+            vm.NEW, 0, 0,
+            vm.STORE_NAME, 0, 0,
+            vm.ENTER, 0, 0,
+            vm.LOAD_NAME, 0, 0,
+            vm.STORE_SLOT, 0, 0,
+            vm.ENTER, 1, 0,
+            vm.LOAD_SLOT, 1, 0,
+            vm.LOAD_ATTR, 0, 0,
+            vm.STORE_SLOT, 0, 0,
+            vm.LOAD_SLOT, 0, 0,
+            vm.STORE_SLOT, 0, 1,
+            vm.EXIT, 0, 0,
+            vm.EXIT, 0, 0,
+        ])
+        self.assertEqual(code.consts, [t])
+        self.assertEqual(code.names, ['a'])
+        self.assertEqual([layout.names for layout in code.layouts], [
+                         ['b'], ['c', 'b']])
+
+    def test_unknown_type(self):
+        with self.assertRaisesRegex(pysh.Error, "unknown type 'U'"):
+            vm.compile_program('a = U();', {})
+
+    def test_indexes(self):
+        t = pysh.Type('T')
+        u = pysh.Type('U')
+        code = vm.compile_program('a = T(); b = U(); a = T(); c = b; b = U();', {'T': t, 'U': u})
+        self.assertEqual(code.consts, [t, u])
+        self.assertEqual(code.names, ['a', 'b', 'c'])
+
+    def test_operand_range(self):
+        code = vm.Code()
+        code.emit(vm.ENTER, vm.MAX_OPERAND)
+        self.assertEqual(list(code.ops), [vm.ENTER, vm.MAX_OPERAND, 0])
+        with self.assertRaisesRegex(pysh.Error, 'operand out of range'):
+            code.emit(vm.ENTER, vm.MAX_OPERAND + 1)
+        self.assertEqual(len(code.ops), 3)
+
+
+class VMTest(unittest.TestCase):
+    def run_both(self, input: str, types, scope_factory):
+        stmts = vm.load(input)
+        interpreter_scope = scope_factory()
+        vm.Interpreter(types).run(stmts, interpreter_scope)
+        vm_scope = scope_factory()
+        vm.VM().run(vm.Compiler(types).compile(stmts), vm_scope)
+        return interpreter_scope, vm_scope
+
+    def test_run(self):
+        t = pysh.Type('T')
+        u = pysh.Type('U', t)
+        g = pysh.Val(t)
+
+        def scope() -> pysh.Scope:
+            scope = pysh.Scope()
+            scope['g'] = g
+            return scope
+        for input in [
+            'a = T();',
+            'a = g; a.x = T(); a.x.y = U();',
+            'a = T(); { a = U(); a.x = g; g.y = a; }',
+            'a = T(); { b = a; { b = U(); b.x = a; a.y = b; } a.z = b; }',
+            '{ g = U(); { g.x = g; } }',
+        ]:
+            with self.subTest(input=input):
+                interpreter_scope, vm_scope = self.run_both(
+                    input, {'T': t, 'U': u}, scope)
+                self.assertEqual(interpreter_scope.vars.keys(),
+                                 vm_scope.vars.keys())
+                for name in interpreter_scope.vars:
+                    self.assertTrue(
+                        interpreter_scope[name].structurally_equal(vm_scope[name]), name)
+                    self.assertEqual(interpreter_scope[name] is g, vm_scope[name] is g, name)
+
+    def test_shadowing(self):
+        t = pysh.Type('T')
+        outer = pysh.Val(t)
+        scope = pysh.Scope()
+        scope['a'] = outer
+        vm.VM().run(vm.compile_program('{ a = a; a.x = a; { a.y = a; } }', {}), scope)
+        self.assertIs(scope['a'], outer)
+        self.assertIs(outer.get_attr('x'), outer)
+        self.assertIs(outer.get_attr('y'), outer)
+
+    def test_persistent_scope(self):
+        t = pysh.Type('T')
+        globals = pysh.PersistentScope()
+        globals['g'] = pysh.Val(t)
+        code = vm.compile_program('a = T(); { b = g; a.x = b; }', {'T': t})
+        forks = [globals.fork() for _ in range(2)]
+        for fork in forks:
+            vm.VM().run(code, fork)
+        self.assertIsNot(forks[0]['a'], forks[1]['a'])
+        for fork in forks:
+            self.assertIs(fork['a'].get_attr('x'), globals['g'])
+        self.assertNotIn('a', globals)
+
+    def test_errors(self):
+        t = pysh.Type('T')
+        for input, msg in [
+            ('a = b;', "unknown var 'b'"),
+            ('{ a = b; }', "unknown var 'b'"),
+            ('a = T(); b = a.x;', "unknown var 'x'"),
+            ('a = T(); a = U();', 'incompatible'),
+            ('{ a = T(); a = U(); }', 'incompatible'),
+            ('a = T(); a.x = T(); a.x = U();', 'incompatible'),
+        ]:
+            with self.subTest(input=input):
+                types = {'T': t, 'U': pysh.Type('U')}
+                with self.assertRaisesRegex(pysh.Error, msg):
+                    vm.Interpreter(types).run(vm.load(input), pysh.Scope())
+                with self.assertRaisesRegex(pysh.Error, msg):
+                    vm.VM().run(vm.compile_program(input, types), pysh.Scope())
+
+
+class ConcurrencyTest(unittest.TestCase):
+    def test_frozen(self):
+        lexer_, parser_, _ = vm._load()
+        self.assertIs(vm._load()[1], parser_)
+        self.assertTrue(lexer_.frozen)
+        self.assertTrue(parser_.frozen)
+        with self.assertRaisesRegex(processor.Error, 'frozen Parser'):
+            parser_.root = 'stmt'
+        with self.assertRaises(TypeError):
+            parser_.rules['stmt'] = parser_.rules['prog']
+
+
+if __name__ == '__main__':
+    unittest.main()